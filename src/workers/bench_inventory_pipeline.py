@@ -0,0 +1,216 @@
+# bench_inventory_pipeline.py - End-to-end benchmark of the inventory report workers
+# Builds (or reuses) a synthetic dataset (see synthetic_inventory_data.py), runs
+# generate_inventory_report for every plant in batch mode and merge_inventory_reports over the
+# outputs - as subprocesses fed JSON on stdin, like the controller does - and writes the
+# per-stage timings and peak memory the workers report to a JSON results file.
+#
+# Runs offline; by default every cache is off so runs compare cold builds (--warm keeps them).
+#
+# python bench_inventory_pipeline.py --scale small [--plants N] [--mb51-rows N] [--materials N]
+#     [--options '{"output_mode": "streaming"}'] [--results bench_results.json] [--baseline old.json]
+
+import sys
+import os
+import json
+import time
+import argparse
+import platform
+import threading
+import subprocess
+
+from synthetic_inventory_data import make_dataset
+
+WORKER_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# name -> (plants, MB51 rows per plant, materials per plant)
+SCALES = {
+    "smoke": (2, 1000, 200),
+    "small": (10, 20000, 1000),
+    "medium": (100, 50000, 2000),
+    "large": (300, 100000, 3000),
+    "mb51-1m": (1, 1000000, 20000),
+    "mb51-2m": (1, 2000000, 30000),
+}
+COLD_OPTIONS = {"reuse_output": False, "stage_cache": False, "parse_cache": False, "layout_cache": False}
+MB = 1024 * 1024
+
+def log(msg):
+    """Log to stderr"""
+    print(f"[bench] {msg}", file=sys.stderr, flush=True)
+
+def feed(pipe, text):
+    try:
+        pipe.write(text)
+    finally:
+        pipe.close()
+
+def wait_child(proc):
+    """Reap the worker; returns (exit code, its peak RSS in MB or None where wait4 is missing)"""
+    if not hasattr(os, "wait4"):
+        return proc.wait(), None
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    peak = usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+    return proc.returncode, round(peak / MB, 1)
+
+def run_worker(script, payload, cwd, stderr_path):
+    """Run a worker with payload on stdin; returns (wall seconds, peak RSS MB, stdout JSON lines)"""
+    started = time.perf_counter()
+    with open(stderr_path, "w", encoding="utf-8") as err:
+        proc = subprocess.Popen([sys.executable, os.path.join(WORKER_DIR, script)],
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=err,
+                                text=True, encoding="utf-8", cwd=cwd)
+        writer = threading.Thread(target=feed, args=(proc.stdin, json.dumps(payload)), daemon=True)
+        writer.start()
+        stdout = proc.stdout.read()
+        writer.join()
+        returncode, peak_rss = wait_child(proc)
+    wall = time.perf_counter() - started
+    lines = []
+    for line in stdout.splitlines():
+        line = line.strip()
+        if line.startswith("{"):
+            try:
+                lines.append(json.loads(line))
+            except ValueError:
+                pass
+    if returncode != 0:
+        error = lines[-1].get("error") if lines else f"exit code {returncode}"
+        raise RuntimeError(f"{script} failed: {error} (see {stderr_path})")
+    return wall, peak_rss, lines
+
+def stage_totals(results):
+    """Sum wall / CPU seconds and rows per stage over several worker results"""
+    totals = {}
+    for result in results:
+        for name, stage in ((result.get("timings") or {}).get("stages") or {}).items():
+            total = totals.setdefault(name, {"wall_s": 0.0, "cpu_s": 0.0, "rows": 0})
+            total["wall_s"] = round(total["wall_s"] + stage.get("wall_s", 0), 3)
+            total["cpu_s"] = round(total["cpu_s"] + stage.get("cpu_s", 0), 3)
+            total["rows"] += stage.get("rows") or 0
+    return totals
+
+def peak_memory(results):
+    peaks = [(result.get("memory") or {}).get("peak_rss_mb") for result in results]
+    peaks = [p for p in peaks if p is not None]
+    return max(peaks) if peaks else None
+
+def run_generate(dataset, options, work_dir):
+    payload = {
+        "report_date": dataset["report_date"],
+        "master_inventory": dataset["master_inventory"],
+        "master_movement": dataset["master_movement"],
+        "options": options,
+        "plants": [{"plant": job["plant"], "report_id": idx, "files": job["files"]}
+                   for idx, job in enumerate(dataset["plants"])],
+    }
+    wall, process_rss, lines = run_worker("generate_inventory_report.py", payload, work_dir,
+                                          os.path.join(work_dir, "generate.log"))
+    plants = [line for line in lines if line.get("type") == "plant_result"]
+    failed = [p["plant"] for p in plants if not p.get("success")]
+    if failed:
+        raise RuntimeError(f"generate_inventory_report failed for {failed} (see generate.log)")
+    return {
+        "wall_s": round(wall, 3),
+        "stages": stage_totals(plants),
+        "peak_rss_mb": peak_memory(plants),
+        "process_peak_rss_mb": process_rss,
+        "plants": [{"plant": p["plant"], "rows_written": p.get("rows_written"), "file_size": p.get("file_size"),
+                    "timings": p.get("timings"), "memory": p.get("memory")} for p in plants],
+    }, [p["output_path"] for p in plants]
+
+def run_merge(output_paths, work_dir, memory_profile):
+    payload = {"file_paths": output_paths, "memory_profile": memory_profile}
+    wall, process_rss, lines = run_worker("merge_inventory_reports.py", payload, work_dir,
+                                          os.path.join(work_dir, "merge.log"))
+    result = next((line for line in reversed(lines) if "success" in line), {})
+    return {
+        "wall_s": round(wall, 3),
+        "stages": stage_totals([result]),
+        "peak_rss_mb": peak_memory([result]),
+        "process_peak_rss_mb": process_rss,
+        "total_data_rows": result.get("total_data_rows"),
+        "file_size": result.get("file_size"),
+    }
+
+def compare(results, baseline):
+    """Log per-stage wall time and peak memory against a previous results file"""
+    for worker in ("generate", "merge"):
+        old, new = baseline.get(worker) or {}, results.get(worker) or {}
+        if not old or not new:
+            continue
+        log(f"{worker}: {old.get('wall_s')}s -> {new.get('wall_s')}s, "
+            f"peak {old.get('peak_rss_mb')} MB -> {new.get('peak_rss_mb')} MB")
+        for name, stage in new.get("stages", {}).items():
+            before = (old.get("stages") or {}).get(name, {}).get("wall_s")
+            change = f"{(stage['wall_s'] - before) / before * 100:+.1f}%" if before else "new"
+            log(f"  {name:<20} {before if before is not None else '-':>10} -> {stage['wall_s']:>10}  {change}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark generate_inventory_report + merge_inventory_reports")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="smoke")
+    parser.add_argument("--plants", type=int)
+    parser.add_argument("--mb51-rows", type=int)
+    parser.add_argument("--materials", type=int)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-baso", action="store_true")
+    parser.add_argument("--data-dir", help="dataset directory (default bench/data/<sizes>)")
+    parser.add_argument("--work-dir", default=os.path.join("bench", "work"))
+    parser.add_argument("--options", default="{}", help="JSON report options, e.g. output_mode / formula_mode")
+    parser.add_argument("--warm", action="store_true", help="keep output reuse and parse/stage/layout caches on")
+    parser.add_argument("--skip-merge", action="store_true")
+    parser.add_argument("--no-memory", action="store_true", help="do not enable memory_profile")
+    parser.add_argument("--results", default=os.path.join("bench", "bench_results.json"))
+    parser.add_argument("--baseline", help="previous results file to compare against")
+    args = parser.parse_args()
+
+    plants, mb51_rows, materials = SCALES[args.scale]
+    plants = args.plants or plants
+    mb51_rows = args.mb51_rows or mb51_rows
+    materials = args.materials or materials
+    data_dir = args.data_dir or os.path.join("bench", "data", f"p{plants}_r{mb51_rows}_m{materials}_s{args.seed}")
+
+    log(f"Dataset: {plants} plants x {mb51_rows:,} MB51 rows, {materials:,} materials ({data_dir})")
+    started = time.perf_counter()
+    dataset = make_dataset(data_dir, plants, mb51_rows, materials, seed=args.seed, baso=not args.no_baso)
+    log(f"Dataset ready in {time.perf_counter() - started:.1f}s")
+
+    options = json.loads(args.options)
+    if not args.warm:
+        options = dict(COLD_OPTIONS, **options)
+    if not args.no_memory:
+        options.setdefault("memory_profile", True)
+    work_dir = os.path.abspath(args.work_dir)
+    os.makedirs(work_dir, exist_ok=True)
+
+    results = {
+        "scale": args.scale,
+        "params": dataset["params"],
+        "options": options,
+        "started": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+    log("Running generate_inventory_report (batch)...")
+    results["generate"], output_paths = run_generate(dataset, options, work_dir)
+    log(f"  {results['generate']['wall_s']}s, peak {results['generate']['peak_rss_mb']} MB")
+
+    if not args.skip_merge:
+        log(f"Running merge_inventory_reports over {len(output_paths)} outputs...")
+        output_paths = [os.path.join(work_dir, path) for path in output_paths]
+        results["merge"] = run_merge(output_paths, work_dir, options.get("memory_profile", False))
+        log(f"  {results['merge']['wall_s']}s, peak {results['merge']['peak_rss_mb']} MB")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.results)), exist_ok=True)
+    with open(args.results, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=1)
+    log(f"Results written to {args.results}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            compare(results, json.load(f))
+
+if __name__ == "__main__":
+    main()
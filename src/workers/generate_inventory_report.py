@@ -2,21 +2,132 @@
 # Modified: Added BASO file processing with 4 sheets (GT GS, GT BS, MT GS, MT BS)
 # BASO mapping: (Plant, Kode Barang) -> FISIK (PCS)
 # Output: 3 new columns CC (GS BASO), CD (BS BASO), CE (Grand Total)
+# Options: payload "options" = {"output_mode": "streaming"} writes through a write-only worksheet
+#   parsed sheets are cached as Arrow snapshots (see parse_cache.py), {"parse_cache": false} disables it
+#   {"parse_mode": "process"} parses MB51 and the main file sheets in parallel processes
+#   {"mb51_chunk_rows": N} folds MB51 into its aggregates N rows at a time (0 = load it whole;
+#   default: chunks of MB51_CHUNK_ROWS for files of MB51_STREAM_MIN_MB and up)
+#   a request with unchanged inputs returns the previous output (see report_manifest.py)
+#   header rows / column mappings of known sheet templates are remembered (see header_layouts.py)
+#   report rows 1-8 are stamped from a cached header template (see header_template.py)
+#   body columns, formulas, row-3 SUMs and control cells follow report_layout.json (see report_layout.py)
+#   the result carries per-stage "timings"; {"metrics_file": path} also appends them as a JSON line
+#   {"memory_profile": true} adds RSS per stage and DataFrame sizes as "memory" (see memory_usage.py)
+#   {"formula_mode": "values"} writes the formula columns / row-3 SUMs as computed numbers,
+#   "both" keeps the formulas with their computed result stored as cached value (default "formulas")
+#   {"compression_level": 0-9} zip level of the saved xlsx, 0 = stored (see workbook_save.py)
+#   {"progress": true} emits type=progress lines with ETA and heartbeats on stdout (see report_progress.py)
+#   {"deadline": ..., "timeout_s": N} / SIGTERM stop the job at the next stage or chunk boundary with a
+#   "cancelled" result and no output file (see job_control.py)
+# Batch mode: payload "plants" = [{plant, report_id, files: {mb51, main, baso}}, ...]
+#   master data is parsed once, one JSON line per plant is streamed as it finishes
+#   plants run in parallel child processes, {"plant_workers": N} at most ("auto" = usable CPUs,
+#   1 = one after the other), started only while their estimated memory fits {"memory_budget_mb"}
+#   (default 80% of available memory; env INVENTORY_PLANT_WORKERS / INVENTORY_MEMORY_BUDGET_MB)
 
 import sys
 import json
 import os
+import re
 import datetime
+import zipfile
 import traceback
-from collections import defaultdict
+import threading
+import types
+import multiprocessing as mp
+from multiprocessing import connection as mp_connection
+from collections import deque
+from operator import itemgetter
+from itertools import chain, islice
 import pandas as pd
 import numpy as np
-from openpyxl import Workbook
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.cell.cell import ERROR_CODES
 from openpyxl.utils import get_column_letter
-from openpyxl.styles import Alignment
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import warnings
 
+from parse_cache import get_parse_cache, file_digest, frame_to_buffer, buffer_to_frame
+from report_manifest import get_report_manifest, data_digest
+from header_layouts import get_layout_registry
+from header_template import get_header_template
+from stage_timings import StageTimings, append_metrics, metrics_path
+from memory_usage import get_memory_tracker, available_memory, MB
+from report_layout import load_layout, LAYOUT_PATH
+from workbook_save import compression_level, zip_settings, save_workbook
+from report_progress import ProgressReporter, get_progress_reporter
+from job_control import CancelToken, JobCancelled, get_cancel_token, install_signal_handlers, remove_partial
+
+# Column layout of the report sheet, compiled from report_layout.json (see report_layout.py)
+LAYOUT = load_layout()
+REPORT_SHEET = LAYOUT.sheet
+WORKERS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def worker_sources(module):
+    """Source files of module and of every src/workers module it imports, directly or not"""
+    sources, pending = set(), [module]
+    while pending:
+        module = pending.pop()
+        path = os.path.abspath(getattr(module, "__file__", None) or "")
+        if os.path.dirname(path) != WORKERS_DIR or path in sources:
+            continue
+        sources.add(path)
+        for value in vars(module).values():
+            name = value.__name__ if isinstance(value, types.ModuleType) else getattr(value, "__module__", None)
+            if isinstance(name, str) and name in sys.modules:
+                pending.append(sys.modules[name])
+    return sorted(sources)
+
+# The code (this module and everything it imports from src/workers: header layouts, parse
+# cache, header template, workbook save, ...) and the layout are part of every output
+# fingerprint, so a change to any of them never reuses an old stage cache or output
+OUTPUT_SOURCES = worker_sources(sys.modules[__name__]) + [LAYOUT_PATH]
+CODE_VERSION = data_digest([file_digest(path) for path in OUTPUT_SOURCES])[:16]
+# Options that change the output file (everything else only changes how it is produced)
+OUTPUT_OPTIONS = ("output_mode", "formula_mode", "compression_level")
+LAST_COLUMN = LAYOUT.last_column
+NUMBER_FORMAT = LAYOUT.number_format
+
+MB51_TARGET_COLUMNS = LAYOUT.mb51_columns
+SUM_COLUMNS = LAYOUT.sum_columns
+
+# MB51 fields the report reads: (field, find_col candidates, required)
+MB51_COLUMNS = [
+    ("posting_date", ["Posting Date"], True),
+    ("material", ["Material"], True),
+    ("plant", ["Plant", "Plnt"], True),
+    ("mv_type", ["Movement type", "Movement Type"], True),
+    ("mv_text", ["Movement Type Text"], True),
+    ("amount", ["Quantity"], True),
+    ("sloc", ["Storage", "Storage Location", "Storage Loc"], False),
+    ("material_desc_mb51", ["Material description"], False),
+]
+MB51_CACHE_KEY = "mb51:" + ",".join(field for field, _, _ in MB51_COLUMNS)
+# BASO: rows searched for the header (after the first), rows folded per chunk
+BASO_HEADER_SCAN_ROWS = 10
+BASO_CHUNK_ROWS = 100000
+# MB51 files from this size on are aggregated in chunks instead of loaded whole
+MB51_STREAM_MIN_MB = 100
+MB51_CHUNK_ROWS = 200000
+# Peak RSS estimate of one plant job: interpreter + libraries, plus per MB of input files
+# (measured with bench_inventory_pipeline.py: 7.4 MB of inputs peaked at 235 MB)
+PLANT_BASE_MB = 150
+PLANT_MB_PER_INPUT_MB = 20
+# Strings read_excel turns into NaN by default (pandas na_values), plus Excel error values
+EXCEL_NA_STRINGS = frozenset([
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+]) | frozenset(ERROR_CODES)
+
+EMPTY_STORAGE = "EMPTY_STORAGE"
+# MB51 column block per storage location, {grouping: column}
+STORAGE_COLUMN_BLOCKS = LAYOUT.storage_blocks
+# 641/642 without storage location go to BF/BG regardless of their grouping
+EMPTY_STORAGE_MV_TYPE_COLUMNS = LAYOUT.empty_storage_mv_types
+# Other empty-storage "Intra Gudang" movements land in BG
+EMPTY_STORAGE_GROUPING_COLUMNS = LAYOUT.empty_storage_groupings
+
 def log(msg):
     """Log to stderr"""
     print(f"[worker] {msg}", file=sys.stderr, flush=True)
@@ -46,29 +157,339 @@ def get_column_index(letter):
         return ord(letter) - ord('A') + 1
     return sum([(ord(ch) - 64) * (26 ** (len(letter)-i-1)) for i, ch in enumerate(letter)])
 
-def read_sheet(file_path, sheet_name):
-    """Read single sheet - parallelizable"""
+def parse_excel_str(file_path, sheet_name):
+    """Read a sheet as str with stripped column names"""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        df = pd.read_excel(file_path, sheet_name=sheet_name, engine="openpyxl", dtype=str)
+    df.columns = [str(c).strip() if not pd.isna(c) else f"Unnamed_{i}" 
+                 for i, c in enumerate(df.columns)]
+    return df
+
+def excel_str(value):
+    """Cell value the way read_excel(dtype=str) returns it"""
+    if value is None:
+        return np.nan
+    if isinstance(value, str):
+        return np.nan if value in EXCEL_NA_STRINGS else value
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+def excel_number(value):
+    """Cell value for a numeric column; text is left for pd.to_numeric to coerce"""
+    if isinstance(value, bool):
+        return str(value)
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+def header_labels(values):
+    """Header row labelled like read_excel: blanks -> "Unnamed: i", duplicates -> "name.1", stripped"""
+    labels = []
+    seen = {}
+    for i, value in enumerate(values):
+        if value is None or value == "" or value in ERROR_CODES:
+            label = f"Unnamed: {i}"
+        elif isinstance(value, float) and value.is_integer():
+            label = int(value)
+        else:
+            label = value
+        count = seen.get(label, 0)
+        while count > 0:
+            seen[label] = count + 1
+            label = f"{label}.{count}"
+            count = seen.get(label, 0)
+        seen[label] = count + 1
+        labels.append(str(label).strip())
+    return labels
+
+def resolve_mb51_columns(labels):
+    """MB51 field -> column position, using the find_col candidate lists"""
+    positions = {}
+    missing = []
+    for field, candidates, required in MB51_COLUMNS:
+        col = find_col(labels, candidates)
+        if col:
+            positions[field] = labels.index(col)
+        elif required:
+            missing.append(candidates[0])
+
+    if missing:
+        raise ValueError(f"Missing MB51 columns: {', '.join(missing)}")
+    return positions
+
+def mb51_frame(fields, picked):
+    """Frame of picked MB51 row tuples: str columns like read_excel(dtype=str), numeric quantity"""
+    columns = list(zip(*picked)) or [()] * len(fields)
+    df = pd.DataFrame(index=pd.RangeIndex(len(picked)))
+    for field, values in zip(fields, columns):
+        if field == "amount":
+            df[field] = pd.to_numeric(pd.Series([excel_number(v) for v in values], dtype=object), errors="coerce")
+        else:
+            df[field] = pd.Series([excel_str(v) for v in values], dtype=object)
+    return df
+
+def iter_mb51_chunks(file_path, sheet_name=0, chunk_rows=None):
+    """Two-phase MB51 read: sniff the header row, then keep only the columns the report uses
+
+    Yields frames of about chunk_rows rows (a single frame when chunk_rows is None).
+    Values match read_excel(dtype=str) on the same columns; quantity comes back numeric.
+    """
+    wb = load_workbook(file_path, read_only=True, data_only=True, keep_links=False)
+    yielded = False
     try:
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore", UserWarning)
-            df = pd.read_excel(file_path, sheet_name=sheet_name, dtype=str)
-            df.columns = [str(c).strip() if not pd.isna(c) else f"Unnamed_{i}" 
-                         for i, c in enumerate(df.columns)]
-            return sheet_name, df
-    except Exception as e:
-        log(f"Error reading {sheet_name}: {str(e)}")
-        return sheet_name, None
+        ws = wb.worksheets[sheet_name] if isinstance(sheet_name, int) else wb[sheet_name]
+        ws.reset_dimensions()
+        rows = ws.iter_rows(values_only=True)
+        labels = header_labels(next(rows, ()))
+        positions = resolve_mb51_columns(labels)
+        log(f"  MB51 columns used: " + ", ".join(f"{field}='{labels[pos]}'" for field, pos in positions.items())
+            + f" ({len(positions)} of {len(labels)})")
+
+        fields = list(positions)
+        width = max(positions.values()) + 1
+        pick = itemgetter(*positions.values())
+        picked = []
+        last_data_row = 0
+        for row in rows:
+            if len(row) < width:
+                row = tuple(row) + (None,) * (width - len(row))
+            picked.append(pick(row))
+            # read_excel drops trailing rows that are empty in every column
+            if row.count(None) + row.count("") < len(row):
+                last_data_row = len(picked)
+                if chunk_rows and last_data_row >= chunk_rows:
+                    yield mb51_frame(fields, picked)
+                    yielded = True
+                    picked = []
+                    last_data_row = 0
+    finally:
+        wb.close()
+
+    del picked[last_data_row:]
+    if picked or not yielded:
+        yield mb51_frame(fields, picked)
+
+def parse_mb51(file_path, sheet_name=0):
+    """Whole MB51 sheet as one frame (see iter_mb51_chunks)"""
+    return next(iter_mb51_chunks(file_path, sheet_name))
+
+def normalize_distinct(series, normalize):
+    """Apply a str normalizer once per distinct value instead of once per row"""
+    codes, uniques = pd.factorize(series, use_na_sentinel=False)
+    normalized = normalize(pd.Index(uniques, dtype=object).astype(str))
+    return pd.Series(np.asarray(normalized, dtype=object)[codes], index=series.index)
+
+def parse_buffer(parse, file_path, sheet_name):
+    """Process-pool entry: parse one sheet and return it as a columnar buffer"""
+    return frame_to_buffer(parse(file_path, sheet_name))
+
+class SheetLoader:
+    """Parse sheets in the background
+
+    parse_mode "thread" (default) shares one interpreter, which mostly overlaps I/O only
+    since read_excel holds the GIL; "process" parses each sheet in its own process and
+    ships it back as an Arrow buffer. The parse cache is consulted and filled in the parent.
+    """
+
+    def __init__(self, parse_mode=None, parse_cache=None, max_workers=4):
+        self.parse_cache = parse_cache
+        self.use_processes = parse_mode == "process"
+        if self.use_processes:
+            max_workers = max(1, min(max_workers, os.cpu_count() or 1))
+            self.executor = ProcessPoolExecutor(max_workers=max_workers)
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.pending = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def submit(self, file_path, sheet_name, parse=parse_excel_str, cache_key=None):
+        """Start parsing; cache_key names the cache entry (default: the sheet name)"""
+        cache_key = sheet_name if cache_key is None else cache_key
+        df = self.parse_cache.get(file_path, cache_key) if self.parse_cache is not None else None
+        if df is not None:
+            future = df
+        elif self.use_processes:
+            future = self.executor.submit(parse_buffer, parse, file_path, sheet_name)
+        else:
+            future = self.executor.submit(parse, file_path, sheet_name)
+        self.pending[(file_path, sheet_name)] = (future, cache_key)
+
+    def result(self, file_path, sheet_name, required=False):
+        """Parsed sheet; errors are logged and give None unless required"""
+        future, cache_key = self.pending.pop((file_path, sheet_name))
+        if isinstance(future, pd.DataFrame):
+            return future
+        try:
+            df = future.result()
+        except Exception as e:
+            if required:
+                raise
+            log(f"Error reading {sheet_name}: {str(e)}")
+            return None
+        if self.use_processes:
+            df = buffer_to_frame(df)
+        if self.parse_cache is not None:
+            self.parse_cache.put(file_path, cache_key, df)
+        return df
+
+class MovementColumnTable:
+    """(storage, mv_text) -> MB51 target column, compiled once from master_movement
+
+    codes[storage_code, mv_text_code] is a position in MB51_TARGET_COLUMNS, -1 = no column.
+    The extra last mv_text column is all -1 so unknown texts (get_indexer -> -1) fall into it.
+    """
+
+    def __init__(self, mv_text_to_grouping):
+        self.storages = pd.Index(list(STORAGE_COLUMN_BLOCKS) + [EMPTY_STORAGE])
+        self.texts = pd.Index(list(mv_text_to_grouping))
+        self.column_names = np.array(MB51_TARGET_COLUMNS + [None], dtype=object)
+        column_pos = {col: i for i, col in enumerate(MB51_TARGET_COLUMNS)}
+
+        grouping_columns = dict(STORAGE_COLUMN_BLOCKS)
+        grouping_columns[EMPTY_STORAGE] = EMPTY_STORAGE_GROUPING_COLUMNS
+
+        self.codes = np.full((len(self.storages), len(self.texts) + 1), -1, dtype=np.int16)
+        for text_code, mv_text in enumerate(self.texts):
+            grouping = mv_text_to_grouping[mv_text]
+            for storage_code, storage in enumerate(self.storages):
+                column = grouping_columns[storage].get(grouping)
+                if column:
+                    self.codes[storage_code, text_code] = column_pos[column]
+
+        self.empty_storage_code = self.storages.get_loc(EMPTY_STORAGE)
+        self.mv_type_codes = {mv_type: column_pos[col] for mv_type, col in EMPTY_STORAGE_MV_TYPE_COLUMNS.items()}
+
+    def mapped_count(self):
+        return int((self.codes >= 0).sum())
+
+    def assign(self, storage, mv_text, mv_type):
+        """Vectorized target column per row (None where nothing matches)"""
+        storage_codes = self.storages.get_indexer(storage)
+        text_codes = self.texts.get_indexer(mv_text)
+
+        target = self.codes[storage_codes, text_codes]
+        target[storage_codes < 0] = -1
+
+        mv_type = np.asarray(mv_type, dtype=object)
+        is_empty_storage = storage_codes == self.empty_storage_code
+        for code_value, pos in self.mv_type_codes.items():
+            target[is_empty_storage & (mv_type == code_value)] = pos
+
+        return self.column_names[target]
+
+# find_col candidates per field of the main file sheets and BASO
+SALDO_AWAL_COLUMNS = {"material": ["Kode Material", "Material"], "plant": ["Plant", "Plnt"],
+                      "sloc": ["Storage Loc", "Storage Location"],
+                      "amount": ["Closing Stock (pcs)", "QTY", "Closing Stock"]}
+MB5B_COLUMNS = {"material": ["Material"], "plant": ["Plnt", "Plant"], "gs": ["GS"], "bs": ["BS"]}
+EDS_COLUMNS = {"material": ["Material"], "plant": ["Plant"], "sloc": ["Storage Location", "Storage Loc"],
+               "amount": ["Closing Stock (pcs)", "Closing Stock", "QTY"]}
+BASO_COLUMNS = {"plant": ["PLANT", "Plant"], "material": ["KODE BARANG", "Kode Barang", "Material"],
+                "fisik": ["FISIK (PCS)", "Fisik (pcs)", "FISIK"]}
+
+def header_layout(rows, header_row, candidates):
+    """Layout of a sheet: its header row index and the find_col label of every field"""
+    return {"header_row": header_row,
+            "columns": {field: find_col(rows[header_row], names) for field, names in candidates.items()}}
+
+def layout_columns(layout, candidates):
+    """Column labels of a layout in the field order of candidates (None = not found)"""
+    return [layout["columns"].get(field) for field in candidates]
+
+class KeyCodes:
+    """Shared str -> int code dictionaries for SheetCache keys (material, plant, sloc)
+
+    Codes pack into one int64 per key: material << 32 | plant << 16 | sloc.
+    """
+
+    LIMITS = {"material": 1 << 31, "plant": 1 << 16, "sloc": 1 << 16}
+
+    def __init__(self):
+        self.indexes = {name: pd.Index([], dtype=object) for name in self.LIMITS}
+
+    def encode(self, name, values, add=True):
+        """Code per value; unknown values get new codes, or -1 when add is False"""
+        values = pd.Index(values, dtype=object)
+        index = self.indexes[name]
+        codes = index.get_indexer(values)
+        if add and (codes < 0).any():
+            index = index.append(values[codes < 0].unique())
+            if len(index) > self.LIMITS[name]:
+                raise ValueError(f"Too many distinct {name} values ({len(index)})")
+            self.indexes[name] = index
+            codes = index.get_indexer(values)
+        return codes
+
+    def keys(self, materials, plants, slocs=None, add=True):
+        """Packed int64 key per row (-1 where any part is unknown and add is False)"""
+        parts = [self.encode("material", materials, add), self.encode("plant", plants, add)]
+        parts.append(self.encode("sloc", slocs, add) if slocs is not None else np.zeros(len(parts[0]), dtype=np.int64))
+        material, plant, sloc = (part.astype(np.int64) for part in parts)
+        keys = (material << 32) | (plant << 16) | sloc
+        keys[(material < 0) | (plant < 0) | (sloc < 0)] = -1
+        return keys
+
+    def decode(self, key):
+        """(material, plant) of a packed key"""
+        key = int(key)
+        return self.indexes["material"][key >> 32], self.indexes["plant"][(key >> 16) & 0xFFFF]
 
 class SheetCache:
-    """Cache for sheet lookups - build once, query many times"""
+    """Cache for sheet lookups - build once, query many times
+
+    Each aggregate is a sorted array of packed KeyCodes keys plus a value array, so a
+    batched lookup is one searchsorted + take.
+    """
     
-    def __init__(self, sheets_dict, baso_path=None):
+    def __init__(self, sheets_dict, baso_path=None, layouts=None):
         self.sheets = sheets_dict
+        self.layouts = layouts
+        self.codes = KeyCodes()
         self.caches = {}
         self.baso_path = baso_path
         self._build_caches()
         if baso_path:
             self._build_baso_cache()
+
+    def __getstate__(self):
+        # Only the built lookups are needed once constructed (stage cache pickles this)
+        state = dict(self.__dict__)
+        state["sheets"] = {}
+        state["layouts"] = None
+        return state
+
+    def _layout(self, kind, rows, detect):
+        """Header layout from the layout registry, else from detect(rows)"""
+        if self.layouts is None:
+            return detect(rows)
+        return self.layouts.resolve(kind, rows, detect)
+
+    def _store(self, cache_key, materials, plants, amounts, slocs=None):
+        """Sum amounts per (material, plant[, sloc]) into the cache; returns its entry count
+
+        A cache that already exists is added to (BASO sheets of the same type add up).
+        """
+        keys = self.codes.keys(materials, plants, slocs)
+        amounts = np.asarray(amounts, dtype=float)
+        if cache_key in self.caches:
+            old_keys, old_values = self.caches[cache_key]
+            keys = np.concatenate([old_keys, keys])
+            amounts = np.concatenate([old_values, amounts])
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        values = np.bincount(inverse, weights=amounts, minlength=len(unique_keys))
+        self.caches[cache_key] = (unique_keys, values)
+        return len(unique_keys)
+
+    def entries(self, cache_key):
+        """Number of keys in a cache (0 when it was not built)"""
+        return len(self.caches[cache_key][0]) if cache_key in self.caches else 0
     
     def _build_caches(self):
         """Pre-build all lookup caches"""
@@ -77,11 +498,9 @@ class SheetCache:
         # Cache SALDO AWAL
         if 'SALDO AWAL' in self.sheets:
             df = self.sheets['SALDO AWAL']
-            cols = list(df.columns)
-            mat_col = find_col(cols, ["Kode Material", "Material"])
-            plant_col = find_col(cols, ["Plant", "Plnt"])
-            sloc_col = find_col(cols, ["Storage Loc", "Storage Location"])
-            amt_col = find_col(cols, ["Closing Stock (pcs)", "QTY", "Closing Stock"])
+            layout = self._layout('saldo_awal', [list(df.columns)],
+                                  lambda rows: header_layout(rows, 0, SALDO_AWAL_COLUMNS))
+            mat_col, plant_col, sloc_col, amt_col = layout_columns(layout, SALDO_AWAL_COLUMNS)
             
             if mat_col and amt_col:
                 df_clean = df.copy()
@@ -90,31 +509,36 @@ class SheetCache:
                 df_clean['sloc'] = df_clean[sloc_col].astype(str).str.strip() if sloc_col else ''
                 df_clean['amount'] = pd.to_numeric(df_clean[amt_col], errors='coerce').fillna(0)
                 
-                grouped = df_clean.groupby(['material', 'plant', 'sloc'], dropna=False)['amount'].sum()
-                self.caches['saldo_awal'] = grouped.to_dict()
-                log(f"  SALDO AWAL cache: {len(self.caches['saldo_awal'])} entries")
+                count = self._store('saldo_awal', df_clean['material'], df_clean['plant'],
+                                    df_clean['amount'], df_clean['sloc'])
+                log(f"  SALDO AWAL cache: {count} entries")
         
         # Cache SALDO AWAL MB5B
         if 'SALDO AWAL MB5B' in self.sheets:
             df = self.sheets['SALDO AWAL MB5B']
             
-            header_row_idx = None
-            if len(df) > 1:
-                for i in range(min(10, len(df))):
-                    row_values = df.iloc[i].astype(str).str.lower().tolist()
-                    if 'material' in ' '.join(row_values):
-                        header_row_idx = i
-                        break
+            def detect_mb5b_awal(rows):
+                # rows[0] is the parsed column names, rows[i + 1] is data row i
+                header_row = 0
+                if len(df) > 1:
+                    for i, row in enumerate(rows[1:]):
+                        if 'material' in ' '.join(str(v) for v in row).lower():
+                            header_row = i + 1
+                            break
+                layout = header_layout(rows, header_row, MB5B_COLUMNS)
+                if not header_row:
+                    # No header row found: the decision rests on every scanned row
+                    layout["signature_rows"] = len(rows)
+                return layout
             
-            if header_row_idx is not None:
-                df.columns = df.iloc[header_row_idx]
-                df = df.iloc[header_row_idx + 1:].reset_index(drop=True)
+            layout = self._layout('saldo_awal_mb5b', [list(df.columns)] + df.head(10).values.tolist(),
+                                  detect_mb5b_awal)
+            header_row = layout["header_row"]
+            if header_row:
+                df.columns = df.iloc[header_row - 1]
+                df = df.iloc[header_row:].reset_index(drop=True)
             
-            cols = list(df.columns)
-            mat_col = find_col(cols, ["Material"])
-            plant_col = find_col(cols, ["Plnt", "Plant"])
-            gs_col = find_col(cols, ["GS"])
-            bs_col = find_col(cols, ["BS"])
+            mat_col, plant_col, gs_col, bs_col = layout_columns(layout, MB5B_COLUMNS)
             
             if mat_col and (gs_col or bs_col):
                 df_clean = df.copy()
@@ -123,24 +547,19 @@ class SheetCache:
                 
                 if gs_col:
                     df_clean['gs_amount'] = pd.to_numeric(df_clean[gs_col], errors='coerce').fillna(0)
-                    grouped_gs = df_clean.groupby(['material', 'plant'], dropna=False)['gs_amount'].sum()
-                    self.caches['mb5b_awal_gs'] = grouped_gs.to_dict()
-                    log(f"  MB5B AWAL GS cache: {len(self.caches['mb5b_awal_gs'])} entries")
+                    count = self._store('mb5b_awal_gs', df_clean['material'], df_clean['plant'], df_clean['gs_amount'])
+                    log(f"  MB5B AWAL GS cache: {count} entries")
                 
                 if bs_col:
                     df_clean['bs_amount'] = pd.to_numeric(df_clean[bs_col], errors='coerce').fillna(0)
-                    grouped_bs = df_clean.groupby(['material', 'plant'], dropna=False)['bs_amount'].sum()
-                    self.caches['mb5b_awal_bs'] = grouped_bs.to_dict()
-                    log(f"  MB5B AWAL BS cache: {len(self.caches['mb5b_awal_bs'])} entries")
+                    count = self._store('mb5b_awal_bs', df_clean['material'], df_clean['plant'], df_clean['bs_amount'])
+                    log(f"  MB5B AWAL BS cache: {count} entries")
         
         # Cache MB5B
         if '13. MB5B' in self.sheets:
             df = self.sheets['13. MB5B']
-            cols = list(df.columns)
-            mat_col = find_col(cols, ["Material"])
-            plant_col = find_col(cols, ["Plnt", "Plant"])
-            gs_col = find_col(cols, ["GS"])
-            bs_col = find_col(cols, ["BS"])
+            layout = self._layout('mb5b', [list(df.columns)], lambda rows: header_layout(rows, 0, MB5B_COLUMNS))
+            mat_col, plant_col, gs_col, bs_col = layout_columns(layout, MB5B_COLUMNS)
             
             if mat_col and (gs_col or bs_col):
                 df_clean = df.copy()
@@ -149,15 +568,13 @@ class SheetCache:
                 
                 if gs_col:
                     df_clean['gs_amount'] = pd.to_numeric(df_clean[gs_col], errors='coerce').fillna(0)
-                    grouped_gs = df_clean.groupby(['material', 'plant'], dropna=False)['gs_amount'].sum()
-                    self.caches['mb5b_gs'] = grouped_gs.to_dict()
-                    log(f"  MB5B GS cache: {len(self.caches['mb5b_gs'])} entries")
+                    count = self._store('mb5b_gs', df_clean['material'], df_clean['plant'], df_clean['gs_amount'])
+                    log(f"  MB5B GS cache: {count} entries")
                 
                 if bs_col:
                     df_clean['bs_amount'] = pd.to_numeric(df_clean[bs_col], errors='coerce').fillna(0)
-                    grouped_bs = df_clean.groupby(['material', 'plant'], dropna=False)['bs_amount'].sum()
-                    self.caches['mb5b_bs'] = grouped_bs.to_dict()
-                    log(f"  MB5B BS cache: {len(self.caches['mb5b_bs'])} entries")
+                    count = self._store('mb5b_bs', df_clean['material'], df_clean['plant'], df_clean['bs_amount'])
+                    log(f"  MB5B BS cache: {count} entries")
         
         # Cache EDS
         if '14. SALDO AKHIR EDS' in self.sheets:
@@ -165,11 +582,8 @@ class SheetCache:
             log(f"  === DEBUGGING EDS SHEET ===")
             log(f"  Sheet shape: {df.shape} (rows x cols)")
             
-            cols = list(df.columns)
-            mat_col = find_col(cols, ["Material"])
-            plant_col = find_col(cols, ["Plant"])
-            sloc_col = find_col(cols, ["Storage Location", "Storage Loc"])
-            amt_col = find_col(cols, ["Closing Stock (pcs)", "Closing Stock", "QTY"])
+            layout = self._layout('eds', [list(df.columns)], lambda rows: header_layout(rows, 0, EDS_COLUMNS))
+            mat_col, plant_col, sloc_col, amt_col = layout_columns(layout, EDS_COLUMNS)
             
             if mat_col and amt_col:
                 df_clean = df.copy()
@@ -178,1031 +592,1204 @@ class SheetCache:
                 df_clean['sloc'] = df_clean[sloc_col].astype(str).str.strip() if sloc_col else ''
                 df_clean['amount'] = pd.to_numeric(df_clean[amt_col], errors='coerce').fillna(0)
                 
-                grouped = df_clean.groupby(['material', 'plant', 'sloc'], dropna=False)['amount'].sum()
-                self.caches['eds'] = grouped.to_dict()
-                log(f"  EDS cache: {len(self.caches['eds'])} entries")
+                count = self._store('eds', df_clean['material'], df_clean['plant'],
+                                    df_clean['amount'], df_clean['sloc'])
+                log(f"  EDS cache: {count} entries")
 
     def _build_baso_cache(self):
-        """Build BASO cache from 4 sheets"""
+        """Build BASO cache from the GS/BS sheets in one read-only pass over the workbook"""
         log("=== Building BASO cache ===")
         
         try:
-            import openpyxl
-            wb = openpyxl.load_workbook(self.baso_path, read_only=True, data_only=True)
-            available_sheets = wb.sheetnames
-            log(f"  Available BASO sheets: {available_sheets}")
-            
-            # Initialize caches
-            self.caches['baso_gs'] = {}
-            self.caches['baso_bs'] = {}
-            
-            # Process each sheet
-            for sheet_name in available_sheets:
-                # Detect type by sheet name ending
-                sheet_lower = sheet_name.lower()
-                if sheet_lower.endswith('gs'):
-                    target_type = 'GS'
-                elif sheet_lower.endswith('bs'):
-                    target_type = 'BS'
-                else:
-                    log(f"  Skipping sheet '{sheet_name}' (not ending with GS or BS)")
-                    continue
-                
-                log(f"  Processing BASO sheet: '{sheet_name}' -> {target_type}")
-                
-                # Read sheet
-                df = pd.read_excel(self.baso_path, sheet_name=sheet_name, dtype=str)
-                df.columns = [str(c).strip() if not pd.isna(c) else f"Unnamed_{i}" 
-                             for i, c in enumerate(df.columns)]
-                
-                log(f"    Sheet shape: {df.shape}")
-                log(f"    First 5 rows preview:")
-                for i in range(min(5, len(df))):
-                    log(f"      Row {i}: {list(df.iloc[i].values)[:8]}")
-                
-                # Find header row (row 3 = index 2)
-                header_row_idx = None
-                for i in range(min(10, len(df))):
-                    row_values = df.iloc[i].astype(str).str.lower().tolist()
-                    row_str = ' '.join(row_values)
-                    if 'kode barang' in row_str or 'fisik' in row_str:
-                        header_row_idx = i
-                        log(f"    Found header at row {i}")
-                        break
-                
-                if header_row_idx is None:
-                    log(f"    ERROR: Could not find header row")
-                    continue
-                
-                # Set header and remove rows before it
-                df.columns = df.iloc[header_row_idx]
-                df = df.iloc[header_row_idx + 1:].reset_index(drop=True)
-                
-                # Find columns
-                cols = list(df.columns)
-                log(f"    Columns after header: {cols}")
-                
-                plant_col = find_col(cols, ["PLANT", "Plant"])
-                material_col = find_col(cols, ["KODE BARANG", "Kode Barang", "Material"])
-                fisik_col = find_col(cols, ["FISIK (PCS)", "Fisik (pcs)", "FISIK"])
-                
-                log(f"    Column mapping:")
-                log(f"      Plant: {plant_col}")
-                log(f"      Material: {material_col}")
-                log(f"      Fisik: {fisik_col}")
-                
-                if not plant_col or not material_col or not fisik_col:
-                    log(f"    ERROR: Missing required columns")
-                    continue
-                
-                # Process data
-                df_clean = df.copy()
-                df_clean['plant'] = df_clean[plant_col].astype(str).str.strip().str.upper()
-                df_clean['material'] = df_clean[material_col].astype(str).str.strip()
-                df_clean['fisik'] = pd.to_numeric(df_clean[fisik_col], errors='coerce').fillna(0)
-                
-                # Remove empty rows
-                df_clean = df_clean[
-                    (df_clean['plant'] != '') & 
-                    (df_clean['plant'] != 'NAN') &
-                    (df_clean['material'] != '') & 
-                    (df_clean['material'] != 'NAN')
-                ]
-                
-                log(f"    Valid rows: {len(df_clean)}")
-                
-                # Group by (plant, material) and sum
-                grouped = df_clean.groupby(['plant', 'material'], dropna=False)['fisik'].sum()
+            wb = load_workbook(self.baso_path, read_only=True, data_only=True, keep_links=False)
+            try:
+                available_sheets = wb.sheetnames
+                log(f"  Available BASO sheets: {available_sheets}")
                 
-                # Store in appropriate cache
-                cache_key = 'baso_gs' if target_type == 'GS' else 'baso_bs'
-                for (plant, material), fisik_value in grouped.items():
-                    key = (material, plant)
-                    if key in self.caches[cache_key]:
-                        self.caches[cache_key][key] += fisik_value
+                # Process each sheet
+                for sheet_name in available_sheets:
+                    # Detect type by sheet name ending
+                    sheet_lower = sheet_name.lower()
+                    if sheet_lower.endswith('gs'):
+                        target_type = 'GS'
+                    elif sheet_lower.endswith('bs'):
+                        target_type = 'BS'
                     else:
-                        self.caches[cache_key][key] = fisik_value
-                
-                log(f"    Added {len(grouped)} entries to {cache_key}")
-            
-            wb.close()
+                        log(f"  Skipping sheet '{sheet_name}' (not ending with GS or BS)")
+                        continue
+                    
+                    log(f"  Processing BASO sheet: '{sheet_name}' -> {target_type}")
+                    self._fold_baso_sheet(wb[sheet_name], 'baso_gs' if target_type == 'GS' else 'baso_bs')
+            finally:
+                wb.close()
             
-            log(f"  BASO GS cache: {len(self.caches.get('baso_gs', {}))} total entries")
-            log(f"  BASO BS cache: {len(self.caches.get('baso_bs', {}))} total entries")
+            log(f"  BASO GS cache: {self.entries('baso_gs')} total entries")
+            log(f"  BASO BS cache: {self.entries('baso_bs')} total entries")
             
             # Show sample data
-            if len(self.caches.get('baso_gs', {})) > 0:
-                log(f"  Sample BASO GS entries (first 5):")
-                for i, (key, val) in enumerate(list(self.caches['baso_gs'].items())[:5]):
-                    log(f"    {key} = {val}")
-            
-            if len(self.caches.get('baso_bs', {})) > 0:
-                log(f"  Sample BASO BS entries (first 5):")
-                for i, (key, val) in enumerate(list(self.caches['baso_bs'].items())[:5]):
-                    log(f"    {key} = {val}")
+            for cache_key, label in (('baso_gs', 'GS'), ('baso_bs', 'BS')):
+                if self.entries(cache_key) > 0:
+                    log(f"  Sample BASO {label} entries (first 5):")
+                    keys, values = self.caches[cache_key]
+                    for key, val in zip(keys[:5], values[:5]):
+                        log(f"    {self.codes.decode(key)} = {val}")
                     
         except Exception as e:
+            # Empty BASO caches would silently write 0 in every CC/CD/CE cell
             log(f"  ERROR building BASO cache: {str(e)}")
-            log(f"  Traceback: {traceback.format_exc()}")
-            self.caches['baso_gs'] = {}
-            self.caches['baso_bs'] = {}
-
-    def get_saldo_awal(self, material, plant, sloc_type):
-        if 'saldo_awal' not in self.caches:
-            return 0.0
-        return self.caches['saldo_awal'].get((material, plant, sloc_type), 0.0)
-    
-    def get_mb5b_awal(self, material, plant, sloc_type):
-        cache_key = 'mb5b_awal_gs' if sloc_type == "GS" else 'mb5b_awal_bs'
-        if cache_key not in self.caches:
-            return 0.0
-        return self.caches[cache_key].get((material, plant), 0.0)
-    
-    def get_mb5b(self, material, plant, sloc_type):
-        cache_key = 'mb5b_gs' if sloc_type == "GS" else 'mb5b_bs'
-        if cache_key not in self.caches:
-            return 0.0
-        return self.caches[cache_key].get((material, plant), 0.0)
-    
-    def get_eds(self, material, plant, sloc_type):
-        if 'eds' not in self.caches:
-            return 0.0
-        return self.caches['eds'].get((material, plant, sloc_type), 0.0)
-    
-    def get_baso(self, material, plant, sloc_type):
-        """Get BASO value for material+plant"""
-        cache_key = 'baso_gs' if sloc_type == "GS" else 'baso_bs'
-        if cache_key not in self.caches:
-            return 0.0
-        return self.caches[cache_key].get((material, plant), 0.0)
-
-def main():
-    try:
-        payload = json.load(sys.stdin)
-        files = payload.get("files", {})
-        master_inventory = payload.get("master_inventory", [])
-        master_movement = payload.get("master_movement", [])
-        report_date = payload.get("report_date")
-
-        mb51_path = files.get("mb51")
-        main_path = files.get("main")
-        baso_path = files.get("baso")  # TAMBAHAN: Path BASO (opsional)
-
-        if not mb51_path or not main_path:
-            raise ValueError("Payload must include files.mb51 and files.main paths")
-        
-        if not report_date:
-            raise ValueError("Payload must include report_date")
-
-        # Log BASO status
-        if baso_path:
-            log(f"BASO file provided: {baso_path}")
-        else:
-            log("BASO file not provided - will use zeros for BASO columns")
-
-        # Load master data
-        log("Loading master data...")
-        df_master_inv = pd.DataFrame(master_inventory)
-        df_master_mov = pd.DataFrame(master_movement)
-
-        df_master_inv.columns = [str(c).strip().lower() if not pd.isna(c) else f"col_{i}" 
-                                  for i, c in enumerate(df_master_inv.columns)]
-        df_master_mov.columns = [str(c).strip().lower() if not pd.isna(c) else f"col_{i}" 
-                                  for i, c in enumerate(df_master_mov.columns)]
-
-        # Inventory mapping
-        log("Creating inventory lookup...")
-        df_master_inv['plant'] = df_master_inv['plant'].astype(str).str.strip()
-        inv_map = df_master_inv.set_index('plant')[['area', 'kode_dist', 'profit_center']].to_dict('index')
-        
-        # Build mv_text -> mv_grouping mapping
-        log("Building movement text -> grouping mapping...")
-        df_master_mov['mv_text'] = df_master_mov['mv_text'].astype(str).str.strip().str.lower()
-        df_master_mov['mv_grouping'] = df_master_mov['mv_grouping'].astype(str).str.strip()
-        
-        mv_text_to_grouping = {}
-        for _, row in df_master_mov.iterrows():
-            mv_text = row['mv_text']
-            mv_grouping = row['mv_grouping']
-            if mv_text and mv_text != 'nan' and mv_grouping and mv_grouping != 'nan':
-                if mv_text not in mv_text_to_grouping:
-                    mv_text_to_grouping[mv_text] = mv_grouping
-        
-        log(f"  Created {len(mv_text_to_grouping)} mv_text -> mv_grouping mappings")
-        
-        # Build storage + mv_grouping -> column mapping
-        log("Building (storage, mv_grouping) -> column mapping...")
-        storage_grouping_to_column = {
-            # GS00 - 9 columns (R to Z)
-            ("GS00", "Terima Barang"): "R",
-            ("GS00", "Retur Beli"): "S",
-            ("GS00", "Penjualan"): "T",
-            ("GS00", "Retur Jual"): "U",
-            ("GS00", "Intra Gudang Masuk"): "V",
-            ("GS00", "Intra Gudang"): "W",
-            ("GS00", "Transfer Stock"): "X",
-            ("GS00", "Pemusnahan"): "Y",
-            ("GS00", "Adjustment"): "Z",
-            
-            # BS00 - 9 columns (AB to AJ)
-            ("BS00", "Terima Barang"): "AB",
-            ("BS00", "Retur Beli"): "AC",
-            ("BS00", "Penjualan"): "AD",
-            ("BS00", "Retur Jual"): "AE",
-            ("BS00", "Intra Gudang Masuk"): "AF",
-            ("BS00", "Intra Gudang"): "AG",
-            ("BS00", "Transfer Stock"): "AH",
-            ("BS00", "Pemusnahan"): "AI",
-            ("BS00", "Adjustment"): "AJ",
-            
-            # AI00 - 9 columns (AL to AT)
-            ("AI00", "Terima Barang"): "AL",
-            ("AI00", "Retur Beli"): "AM",
-            ("AI00", "Penjualan"): "AN",
-            ("AI00", "Retur Jual"): "AO",
-            ("AI00", "Intra Gudang Masuk"): "AP",
-            ("AI00", "Intra Gudang"): "AQ",
-            ("AI00", "Transfer Stock"): "AR",
-            ("AI00", "Pemusnahan"): "AS",
-            ("AI00", "Adjustment"): "AT",
-            
-            # TR00 - 9 columns (AV to BD)
-            ("TR00", "Terima Barang"): "AV",
-            ("TR00", "Retur Beli"): "AW",
-            ("TR00", "Penjualan"): "AX",
-            ("TR00", "Retur Jual"): "AY",
-            ("TR00", "Intra Gudang Masuk"): "AZ",
-            ("TR00", "Intra Gudang"): "BA",
-            ("TR00", "Transfer Stock"): "BB",
-            ("TR00", "Pemusnahan"): "BC",
-            ("TR00", "Adjustment"): "BD",
-            
-            # 641/642 (empty storage) - 2 columns (BF, BG)
-            ("EMPTY_STORAGE", "Intra Gudang"): "BF",
-            ("EMPTY_STORAGE", "Intra Gudang"): "BG",
-        }
-        
-        log(f"  Created {len(storage_grouping_to_column)} (storage, mv_grouping) -> column mappings")
+            raise ValueError(f"Could not read BASO file {os.path.basename(self.baso_path)}: {str(e)}") from e
+
+    def _fold_baso_sheet(self, ws, cache_key):
+        """Stream one BASO sheet: find the header row, then fold rows into cache_key in chunks
+
+        Rows are read as read_excel(dtype=str) would give them, so the header search and
+        the cleaning below see the same values the DataFrame version did.
+        """
+        ws.reset_dimensions()
+        rows = ws.iter_rows(values_only=True)
+        # head[0] is the row read_excel used as column names, never data or the header
+        head_raw = list(islice(rows, BASO_HEADER_SCAN_ROWS + 1))
+        head = [[excel_str(v) for v in row] for row in head_raw]
+
+        def detect_baso(rows):
+            # Find header row (row 3 = index 2)
+            for i, values in enumerate(rows[1:]):
+                row_str = ' '.join(str(v) for v in values).lower()
+                if 'kode barang' in row_str or 'fisik' in row_str:
+                    return header_layout(rows, i + 1, BASO_COLUMNS)
+            return None
 
-        # Read MB51
-        log(f"Reading MB51...")
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore", UserWarning)
-            df_mb51 = pd.read_excel(mb51_path, sheet_name=0, engine="openpyxl", dtype=str)
-        
-        df_mb51.columns = [str(c).strip() if not pd.isna(c) else f"Unnamed_{i}" 
-                          for i, c in enumerate(df_mb51.columns)]
-
-        # Find columns
-        mb_cols = list(df_mb51.columns)
-        col_posting = find_col(mb_cols, ["Posting Date"])
-        col_material = find_col(mb_cols, ["Material"])
-        col_plant = find_col(mb_cols, ["Plant", "Plnt"])
-        col_movement = find_col(mb_cols, ["Movement type", "Movement Type"])
-        col_movement_text = find_col(mb_cols, ["Movement Type Text"])
-        col_amount = find_col(mb_cols, ["Quantity"])
-        col_sloc = find_col(mb_cols, ["Storage", "Storage Location", "Storage Loc"])
-        col_material_desc = find_col(mb_cols, ["Material description"])
-
-        missing = []
-        for name, col in [("Posting Date", col_posting), ("Material", col_material), 
-                         ("Plant", col_plant), ("Movement type", col_movement),
-                         ("Movement Type Text", col_movement_text), ("Quantity", col_amount)]:
-            if not col:
-                missing.append(name)
-        
-        if missing:
-            raise ValueError(f"Missing MB51 columns: {', '.join(missing)}")
-
-        # Rename
-        rename_dict = {
-            col_posting: "posting_date", col_material: "material",
-            col_plant: "plant", col_movement: "mv_type",
-            col_movement_text: "mv_text", col_amount: "amount"
-        }
-        if col_sloc:
-            rename_dict[col_sloc] = "sloc"
-        if col_material_desc:
-            rename_dict[col_material_desc] = "material_desc_mb51"
+        layout = self._layout('baso', head, detect_baso)
+        if layout is None:
+            log(f"    ERROR: Could not find header row")
+            return
+        
+        header_row = layout["header_row"]
+        header = head[header_row]
+        log(f"    Found header at row {header_row - 1}")
+        log(f"    Columns after header: {header}")
+        
+        plant_col, material_col, fisik_col = layout_columns(layout, BASO_COLUMNS)
+        
+        log(f"    Column mapping:")
+        log(f"      Plant: {plant_col}")
+        log(f"      Material: {material_col}")
+        log(f"      Fisik: {fisik_col}")
+        
+        if not plant_col or not material_col or not fisik_col:
+            log(f"    ERROR: Missing required columns")
+            return
+        
+        positions = [header.index(col) for col in (plant_col, material_col, fisik_col)]
+        width = max(positions) + 1
+        pick = itemgetter(*positions)
+        
+        before = self.entries(cache_key)
+        valid_rows = 0
+        picked = []
+        for row in chain(head_raw[header_row + 1:], rows):
+            if len(row) < width:
+                row = tuple(row) + (None,) * (width - len(row))
+            picked.append(pick(row))
+            if len(picked) >= BASO_CHUNK_ROWS:
+                valid_rows += self._fold_baso_rows(cache_key, picked)
+                picked = []
+        valid_rows += self._fold_baso_rows(cache_key, picked)
+        
+        log(f"    Valid rows: {valid_rows}")
+        log(f"    Added {self.entries(cache_key) - before} new entries to {cache_key}")
+
+    def _fold_baso_rows(self, cache_key, picked):
+        """Clean (plant, material, fisik) tuples and sum them into cache_key; returns the valid row count"""
+        if not picked:
+            return 0
+        plant, material, fisik = zip(*picked)
+        df_clean = pd.DataFrame({
+            'plant': pd.Series([excel_str(v) for v in plant], dtype=object).astype(str).str.strip().str.upper(),
+            'material': pd.Series([excel_str(v) for v in material], dtype=object).astype(str).str.strip(),
+            'fisik': pd.to_numeric(pd.Series([excel_number(v) for v in fisik], dtype=object), errors='coerce').fillna(0),
+        })
+        
+        # Remove empty rows
+        df_clean = df_clean[
+            (df_clean['plant'] != '') & 
+            (df_clean['plant'] != 'NAN') &
+            (df_clean['material'] != '') & 
+            (df_clean['material'] != 'NAN')
+        ]
         
-        df_mb51 = df_mb51.rename(columns=rename_dict)
+        if len(df_clean):
+            self._store(cache_key, df_clean['material'], df_clean['plant'], df_clean['fisik'])
+        return len(df_clean)
 
-        # Determine report period
-        log("Determining report period from request body...")
-        report_month_dt = datetime.datetime.strptime(report_date, "%Y-%m-%d")
-        
-        bulan = report_month_dt.strftime("%B").upper()
-        tahun = report_month_dt.year
-        prev_month_dt = report_month_dt
-        prev_month = prev_month_dt.strftime("%B").upper()
-        prev_year = prev_month_dt.year
-        bulan_only = bulan
+    def lookup(self, kind, materials, plants, sloc_type):
+        """Vectorized lookup for aligned material/plant sequences - 0.0 where missing
 
-        log(f"  Report period from request: {bulan} {tahun}")
+        kind: 'saldo_awal', 'mb5b_awal', 'mb5b', 'eds' or 'baso'
+        """
+        if kind in ('saldo_awal', 'eds'):
+            cache_key = kind
+            slocs = [sloc_type] * len(materials)
+        else:
+            cache_key = f"{kind}_{sloc_type.lower()}"
+            slocs = None
+
+        if not self.entries(cache_key):
+            return np.zeros(len(materials))
+
+        cache_keys, values = self.caches[cache_key]
+        keys = self.codes.keys(materials, plants, slocs, add=False)
+        pos = np.minimum(np.searchsorted(cache_keys, keys), len(cache_keys) - 1)
+        found = (keys >= 0) & (cache_keys[pos] == keys)
+        return np.where(found, values[pos], 0.0)
+
+# Per-row formulas, '{r}' is the worksheet row number (in dependency order)
+FORMULA_COLUMNS = LAYOUT.formulas
+
+def formula_column(template, row_numbers):
+    """Expand a formula template for every row at once"""
+    parts = template.split("{r}")
+    column = parts[0] + row_numbers
+    for part in parts[1:-1]:
+        column = column + part + row_numbers
+    return column + parts[-1]
+
+def compute_formula_columns(body):
+    """Evaluate FORMULA_COLUMNS on the body numbers, one vectorized column at a time
+
+    Templates are in dependency order; blank columns (separators) count as 0 like in Excel.
+    """
+    computed = {}
+    zeros = np.zeros(len(body))
+
+    def column_values(letter):
+        if letter in computed:
+            return computed[letter]
+        if letter in body.columns:
+            return body[letter].to_numpy(dtype=float)
+        return zeros
+
+    for letter, terms in LAYOUT.formula_terms.items():
+        result = zeros.copy()
+        for sign, letters in terms:
+            term = zeros.copy()
+            for ref in letters:
+                term = term + column_values(ref)
+            result = result - term if sign == "-" else result + term
+        computed[letter] = result
+    return computed
+
+def summary_values(body, computed):
+    """Numbers behind the row-3 SUM formulas and the control formulas (BB2)"""
+    values = {}
+    for col in SUM_COLUMNS:
+        column = computed[col] if col in computed else body[col].to_numpy(dtype=float)
+        values[f"{col}3"] = float(column.sum())
+    for cell, terms in LAYOUT.control_terms.items():
+        total = 0.0
+        for sign, ref in terms:
+            total = total - values[ref] if sign == "-" else total + values[ref]
+        values[cell] = total
+    return values
+
+# Formula cell as openpyxl writes it, with an empty cached value
+FORMULA_CELL = re.compile(rb'<c r="([A-Z]+)([0-9]+)"([^>]*)><f>([^<]*)</f>(?:<v\s*/>|<v></v>)?</c>')
+
+def store_cached_values(output_path, computed, cell_values, level=None):
+    """Fill in the cached value of every formula cell (openpyxl can only write formulas)"""
+    def with_value(match):
+        letter, row = match.group(1).decode(), int(match.group(2))
+        ref = f"{letter}{row}"
+        if ref in cell_values:
+            value = cell_values[ref]
+        elif letter in computed and row >= LAYOUT.first_data_row:
+            value = computed[letter][row - LAYOUT.first_data_row]
+        else:
+            return match.group(0)
+        return b'<c r="%s%s"%s><f>%s</f><v>%s</v></c>' % (
+            match.group(1), match.group(2), match.group(3), match.group(4), repr(float(value)).encode())
+
+    compression, compresslevel = zip_settings(level)
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    with zipfile.ZipFile(output_path) as src, zipfile.ZipFile(tmp_path, "w", compression) as dst:
+        for info in src.infolist():
+            data = src.read(info.filename)
+            if info.filename.startswith("xl/worksheets/sheet"):
+                data = FORMULA_CELL.sub(with_value, data)
+            dst.writestr(info, data, compression, compresslevel)
+    os.replace(tmp_path, output_path)
+
+def build_body_frame(grouped_materials, material_desc_map, bulan_only, sheet_cache, mb51_pivot, mb51_plants):
+    """Build every body column (A..CE) as one columnar frame, one row per material"""
+    materials = grouped_materials['material'].astype(str).reset_index(drop=True)
+    plants = grouped_materials['plant'].astype(str).str.strip().str.upper().reset_index(drop=True)
+    first_row = LAYOUT.first_data_row
+    row_numbers = pd.Series(np.arange(first_row, first_row + len(materials)), dtype=int).astype(str)
+
+    fields = {
+        "area": grouped_materials['area'].astype(str).reset_index(drop=True),
+        "plant": plants,
+        "kode_dist": grouped_materials['kode_dist'].astype(str).reset_index(drop=True),
+        "profit_center": grouped_materials['profit_center'].astype(str).reset_index(drop=True),
+        "period": bulan_only,
+        "material": materials,
+        "description": materials.map(material_desc_map).fillna(""),
+    }
+    columns = {letter: fields[field] for letter, field in LAYOUT.material_fields.items()}
+
+    # Sheet aggregates
+    for letter, kind, sloc_type in LAYOUT.sheet_lookups:
+        columns[letter] = sheet_cache.lookup(kind, materials, plants, sloc_type)
+
+    # MB51 pivot joined on (material, plant); plants without MB51 data stay 0
+    keys = pd.MultiIndex.from_arrays([materials, plants])
+    mb51_values = mb51_pivot.reindex(index=keys, columns=MB51_TARGET_COLUMNS).fillna(0.0)
+    mb51_values[~plants.isin(mb51_plants).to_numpy()] = 0.0
+    for letter in MB51_TARGET_COLUMNS:
+        columns[letter] = mb51_values[letter].to_numpy()
+
+    for letter, template in FORMULA_COLUMNS.items():
+        columns[letter] = formula_column(template, row_numbers)
+
+    body = pd.DataFrame(columns)
+    ordered = sorted(body.columns, key=LAYOUT.index.get)
+    return body[ordered]
+
+def checked_rows(rows, cancel, every=1000):
+    """Pass rows through, checking for cancellation every few rows"""
+    for count, row in enumerate(rows, 1):
+        if count % every == 0:
+            cancel.check("writing")
+        yield row
+
+def iter_frame_rows(body):
+    """Yield body rows as value lists indexed by worksheet column (A..CE)"""
+    positions = [LAYOUT.index[letter] - 1 for letter in body.columns]
+    for values in body.itertuples(index=False, name=None):
+        row = [None] * LAST_COLUMN
+        for pos, value in zip(positions, values):
+            row[pos] = value
+        yield row
+
+def summary_cells(last_row, s1_value, bp2_value, values=None):
+    """Control totals (S1, BB2, BP2) and the row-3 SUMs - formulas, or the numbers in values"""
+    formulas = dict(LAYOUT.sum_formulas(last_row), **LAYOUT.control_formulas)
+    cells = {cell: values[cell] if values else formula for cell, formula in formulas.items()}
+    sources = {"mb51_balance": s1_value, "end_stock_balance": bp2_value}
+    for cell, source in LAYOUT.controls.items():
+        cells[cell] = sources[source]
+    return cells
+
+def save_report_standard(output_path, header, header_values, body_rows, full_calc=True, timings=None,
+                         level=None):
+    """Build the report on an in-memory worksheet and save it"""
+    timings = timings or StageTimings()
+    wb = Workbook()
+    wb.calculation.fullCalcOnLoad = full_calc
+    ws = wb.active
+    ws.title = REPORT_SHEET
+    header.stamp(ws, header_values)
+
+    number_from = LAYOUT.number_columns_from
+    for write_row, values in enumerate(body_rows, LAYOUT.first_data_row):
+        for col_idx, value in enumerate(values, 1):
+            if value is None:
+                continue
+            cell = ws.cell(row=write_row, column=col_idx, value=value)
+            if col_idx >= number_from and isinstance(value, (int, float)):
+                cell.number_format = NUMBER_FORMAT
+
+    timings.lap("format", rows=ws.max_row - LAYOUT.header_rows)
+    save_workbook(wb, output_path, level)
+    timings.lap("save")
+
+def save_report_streaming(output_path, header, header_values, body_rows, full_calc=True, timings=None,
+                          level=None):
+    """Stream the report through a write-only worksheet - each row is emitted once, already styled"""
+    timings = timings or StageTimings()
+    wb = Workbook(write_only=True)
+    wb.calculation.fullCalcOnLoad = full_calc
+    ws = wb.create_sheet(REPORT_SHEET)
+    header.apply_layout(ws)
+    for row in header.write_only_rows(ws, header_values, LAST_COLUMN):
+        ws.append(row)
+
+    # One reusable number-formatted cell per column; ws.append consumes a row before the next is built
+    number_columns = range(LAYOUT.number_columns_from, LAST_COLUMN + 1)
+    number_cells = {}
+    for col_idx in number_columns:
+        number_cells[col_idx] = WriteOnlyCell(ws)
+        number_cells[col_idx].number_format = NUMBER_FORMAT
+
+    rows = 0
+    for values in body_rows:
+        row = list(values)
+        for col_idx in number_columns:
+            value = row[col_idx - 1]
+            if isinstance(value, (int, float)):
+                cell = number_cells[col_idx]
+                cell.value = value
+                row[col_idx - 1] = cell
+        ws.append(row)
+        rows += 1
+
+    timings.lap("format", rows=rows)
+    save_workbook(wb, output_path, level)
+    timings.lap("save")
+
+def build_master_state(master_inventory, master_movement):
+    """Build plant and movement lookups from master data - shared by every plant"""
+    # Load master data
+    log("Loading master data...")
+    df_master_inv = pd.DataFrame(master_inventory)
+    df_master_mov = pd.DataFrame(master_movement)
+
+    df_master_inv.columns = [str(c).strip().lower() if not pd.isna(c) else f"col_{i}" 
+                              for i, c in enumerate(df_master_inv.columns)]
+    df_master_mov.columns = [str(c).strip().lower() if not pd.isna(c) else f"col_{i}" 
+                              for i, c in enumerate(df_master_mov.columns)]
+
+    # Inventory mapping
+    log("Creating inventory lookup...")
+    df_master_inv['plant'] = df_master_inv['plant'].astype(str).str.strip()
+    inv_map = df_master_inv.set_index('plant')[['area', 'kode_dist', 'profit_center']].to_dict('index')
+    
+    # Build mv_text -> mv_grouping mapping (first occurrence wins)
+    log("Building movement text -> grouping mapping...")
+    df_master_mov['mv_text'] = df_master_mov['mv_text'].astype(str).str.strip().str.lower()
+    df_master_mov['mv_grouping'] = df_master_mov['mv_grouping'].astype(str).str.strip()
+    
+    valid_mov = df_master_mov[
+        (df_master_mov['mv_text'] != '') & (df_master_mov['mv_text'] != 'nan') &
+        (df_master_mov['mv_grouping'] != '') & (df_master_mov['mv_grouping'] != 'nan')
+    ].drop_duplicates('mv_text', keep='first')
+    mv_text_to_grouping = dict(zip(valid_mov['mv_text'], valid_mov['mv_grouping']))
+    
+    log(f"  Created {len(mv_text_to_grouping)} mv_text -> mv_grouping mappings")
+    
+    # Compile (storage, mv_text) -> column table
+    log("Compiling (storage, mv_text) -> column table...")
+    movement_table = MovementColumnTable(mv_text_to_grouping)
+    log(f"  Compiled {movement_table.mapped_count()} (storage, mv_text) -> column entries")
+
+    return {
+        "inv_map": inv_map,
+        "mv_text_to_grouping": mv_text_to_grouping,
+        "movement_table": movement_table,
+        "inventory_digest": data_digest(inv_map),
+        "movement_digest": data_digest(mv_text_to_grouping),
+    }
+
+class MB51Aggregator:
+    """Fold MB51 row chunks into the per-key aggregates the report needs
+
+    Keeps the (material, plant, storage, mv_type, mv_text) amount sums, the distinct
+    (area, plant, kode_dist, profit_center, material) keys, amount per plant and the first
+    description per material - memory follows the distinct keys, not the row count.
+    """
+
+    GROUP_KEYS = ['material', 'plant_clean', 'storage', 'mv_type', 'mv_text']
+    MATERIAL_KEYS = ['area', 'plant_clean', 'kode_dist', 'profit_center', 'material']
+    KNOWN_STORAGES = list(STORAGE_COLUMN_BLOCKS) + [EMPTY_STORAGE]
+
+    def __init__(self, inv_map):
+        self.inv_lookup = pd.DataFrame.from_dict(inv_map, orient='index',
+                                                 columns=['area', 'kode_dist', 'profit_center'])
+        self.chunks = 0
+        self.rows = 0
+        self.valid_dates = 0
+        self.pos_count = 0
+        self.neg_count = 0
+        self.total_amount = 0.0
+        self.unknown_storage_count = 0
+        self.unknown_storages = []
+        self.plants = set()
+        self.grouped = None
+        self.material_keys = None
+        self.amount_by_plant = pd.Series(dtype=float)
+        self.descriptions = {}
+
+    def add(self, df_mb51):
+        """Fold one chunk (a frame as returned by iter_mb51_chunks)"""
+        self.chunks += 1
+        self.rows += len(df_mb51)
 
-        # Convert data types
-        log("Converting data types...")
-        
         try:
             date_numeric = pd.to_numeric(df_mb51["posting_date"], errors='coerce')
-            df_mb51["posting_date"] = pd.to_datetime(
-                date_numeric,
-                origin='1899-12-30',
-                unit='D',
-                errors='coerce'
-            )
-            
-            valid_dates = df_mb51["posting_date"].notna().sum()
-            log(f"  ✓ Converted {valid_dates}/{len(df_mb51)} dates successfully")
-                
+            posting_date = pd.to_datetime(date_numeric, origin='1899-12-30', unit='D', errors='coerce')
+            self.valid_dates += int(posting_date.notna().sum())
         except Exception as e:
             log(f"  ERROR converting dates: {str(e)}")
-            df_mb51["posting_date"] = pd.NaT
-        
-        df_mb51["amount"] = pd.to_numeric(df_mb51["amount"], errors="coerce")
-        
-        neg_count = (df_mb51["amount"] < 0).sum()
-        pos_count = (df_mb51["amount"] > 0).sum()
-        total_amount = df_mb51["amount"].sum()
-        
-        log(f"  === AMOUNT DISTRIBUTION (RAW MB51) ===")
-        log(f"  Positive: {pos_count}, Negative: {neg_count}")
-        log(f"  Total sum: {total_amount:,.2f}")
-        
-        df_mb51["plant"] = df_mb51["plant"].astype(str).str.strip()
-        df_mb51["mv_type"] = df_mb51["mv_type"].astype(str).str.strip()
-        df_mb51["material"] = df_mb51["material"].astype(str).str.strip()
-        df_mb51["mv_text"] = df_mb51["mv_text"].astype(str).str.strip().str.lower()
-        
+
+        amount = pd.to_numeric(df_mb51["amount"], errors="coerce")
+        self.pos_count += int((amount > 0).sum())
+        self.neg_count += int((amount < 0).sum())
+        self.total_amount += float(amount.sum())
+
+        # Key columns repeat heavily, so normalize each distinct value once
+        df = pd.DataFrame({
+            "material": normalize_distinct(df_mb51["material"], lambda v: v.str.strip()),
+            "plant": normalize_distinct(df_mb51["plant"], lambda v: v.str.strip()),
+            "mv_type": normalize_distinct(df_mb51["mv_type"], lambda v: v.str.strip()),
+            "mv_text": normalize_distinct(df_mb51["mv_text"], lambda v: v.str.strip().str.lower()),
+            "amount": amount,
+        })
+
         # Handle storage
         if 'sloc' in df_mb51.columns:
-            df_mb51["is_empty_storage"] = (
-                (df_mb51["sloc"].isna()) |
-                (df_mb51["sloc"].isnull()) |
-                (df_mb51["sloc"].astype(str).str.strip() == '') |
-                (df_mb51["sloc"].astype(str).str.strip().str.upper() == 'NAN') |
-                (df_mb51["sloc"].astype(str).str.strip().str.upper() == 'NONE')
-            )
-            
-            df_mb51["storage"] = df_mb51["sloc"].astype(str).str.strip().str.upper()
-            df_mb51.loc[df_mb51["is_empty_storage"], "storage"] = 'EMPTY_STORAGE'
+            storage = normalize_distinct(df_mb51["sloc"], lambda v: v.str.strip().str.upper())
+            is_empty_storage = df_mb51["sloc"].isna() | storage.isin(['', 'NAN', 'NONE'])
+            storage[is_empty_storage] = EMPTY_STORAGE
         else:
-            df_mb51["storage"] = "EMPTY_STORAGE"
-            df_mb51["is_empty_storage"] = True
+            storage = pd.Series(EMPTY_STORAGE, index=df.index, dtype=object)
+
+        # Map unknown storages to GS00
+        unknown_storage_mask = ~storage.isin(self.KNOWN_STORAGES)
+        if unknown_storage_mask.any():
+            self.unknown_storage_count += int(unknown_storage_mask.sum())
+            for name in storage[unknown_storage_mask].unique():
+                if len(self.unknown_storages) < 10 and name not in self.unknown_storages:
+                    self.unknown_storages.append(name)
+            storage[unknown_storage_mask] = 'GS00'
+        df["storage"] = storage
 
         # Map inventory
-        log("Mapping inventory data...")
-        df_inv_lookup = pd.DataFrame([
-            {'plant': k, **v} for k, v in inv_map.items()
-        ])
-        df_mb51 = df_mb51.merge(
-            df_inv_lookup[['plant', 'area', 'kode_dist', 'profit_center']], 
-            on='plant', how='left'
-        )
+        for col in ['area', 'kode_dist', 'profit_center']:
+            df[col] = df["plant"].map(self.inv_lookup[col])
+        df["plant_clean"] = df["plant"].astype(str).str.strip().str.upper()
+        self.plants.update(df["plant_clean"].unique())
+
+        grouped = df.groupby(self.GROUP_KEYS, dropna=False).agg({'amount': 'sum'}).reset_index()
+        material_keys = df[self.MATERIAL_KEYS].drop_duplicates()
+        amount_by_plant = df.groupby('plant_clean')['amount'].sum()
+        if self.grouped is None:
+            self.grouped = grouped
+            self.material_keys = material_keys
+            self.amount_by_plant = amount_by_plant
+        else:
+            self.grouped = pd.concat([self.grouped, grouped], ignore_index=True).groupby(
+                self.GROUP_KEYS, dropna=False).agg({'amount': 'sum'}).reset_index()
+            self.material_keys = pd.concat([self.material_keys, material_keys]).drop_duplicates()
+            self.amount_by_plant = self.amount_by_plant.add(amount_by_plant, fill_value=0.0)
 
-        # Read main file sheets
-        log("Reading main file sheets...")
-        required_sheets = ['SALDO AWAL', 'SALDO AWAL MB5B', '13. MB5B', 
-                          '14. SALDO AKHIR EDS', 'Output Report INV ARUS BARANG']
-        
-        sheets_dict = {}
-        with ThreadPoolExecutor(max_workers=4) as executor:
-            futures = [executor.submit(read_sheet, main_path, sheet) for sheet in required_sheets]
-            for future in futures:
-                sheet_name, df = future.result()
-                if df is not None:
-                    sheets_dict[sheet_name] = df
-                    log(f"  ✓ Loaded '{sheet_name}': {df.shape}")
-
-        # Initialize sheet cache WITH BASO
-        sheet_cache = SheetCache(sheets_dict, baso_path)
-
-        # Get existing materials
-        existing_materials = []
-        if 'Output Report INV ARUS BARANG' in sheets_dict:
-            df_existing = sheets_dict['Output Report INV ARUS BARANG']
-            if df_existing.shape[0] > 8 and df_existing.shape[1] >= 7:
-                df_existing_materials = df_existing.iloc[7:, [1, 5]].copy()
-                df_existing_materials.columns = ['plant', 'material']
-                df_existing_materials = df_existing_materials[
-                    (df_existing_materials['material'].notna()) & 
-                    (df_existing_materials['material'].astype(str).str.strip() != '') &
-                    (df_existing_materials['material'].astype(str).str.strip() != 'nan')
-                ]
-                
-                log("Loading existing materials from main file...")
-                for idx, row in df_existing_materials.iterrows():
-                    plant = str(row['plant']).strip().upper()
-                    material = str(row['material']).strip()
-                    
-                    if plant in inv_map:
-                        existing_materials.append({
-                            'material': material, 'plant': plant,
-                            'area': inv_map[plant]['area'],
-                            'kode_dist': inv_map[plant]['kode_dist'],
-                            'profit_center': inv_map[plant]['profit_center']
-                        })
-                    else:
-                        existing_materials.append({
-                            'material': material, 'plant': plant,
-                            'area': '', 'kode_dist': '', 'profit_center': ''
-                        })
-                
-                log(f"  Found {len(existing_materials)} existing materials")
+        # First non-empty description per material, earlier chunks win
+        if 'material_desc_mb51' in df_mb51.columns:
+            desc_df = pd.DataFrame({"material": df["material"], "desc": df_mb51["material_desc_mb51"]}).dropna()
+            desc_df = desc_df[desc_df['desc'].astype(str).str.strip() != '']
+            desc_df = desc_df.drop_duplicates('material', keep='first')
+            for mat, desc in zip(desc_df['material'], desc_df['desc']):
+                self.descriptions.setdefault(mat, desc)
 
-        # Map unknown storages to GS00
-        df_mb51_filtered = df_mb51.copy()
-        log(f"MB51 data before storage mapping: {len(df_mb51_filtered)} rows")
-        
-        known_storages = ['GS00', 'BS00', 'AI00', 'TR00', 'EMPTY_STORAGE']
-        unknown_storage_mask = ~df_mb51_filtered['storage'].isin(known_storages)
-        unknown_storage_count = unknown_storage_mask.sum()
-        
-        if unknown_storage_count > 0:
-            log(f"Found {unknown_storage_count} rows with unknown storage")
-            unknown_storages = df_mb51_filtered[unknown_storage_mask]['storage'].unique()
-            log(f"  Unknown storages: {list(unknown_storages)[:10]}")
-            df_mb51_filtered.loc[unknown_storage_mask, 'storage'] = 'GS00'
+    def finish(self):
+        """Log the totals; grouped_mb51 and the distinct material keys in groupby order"""
+        log(f"  ✓ Converted {self.valid_dates}/{self.rows} dates successfully")
+        log(f"  === AMOUNT DISTRIBUTION (RAW MB51) ===")
+        log(f"  Positive: {self.pos_count}, Negative: {self.neg_count}")
+        log(f"  Total sum: {self.total_amount:,.2f}")
+        if self.unknown_storage_count > 0:
+            log(f"Found {self.unknown_storage_count} rows with unknown storage")
+            log(f"  Unknown storages: {self.unknown_storages}")
             log(f"  → Mapped all unknown storages to GS00")
-        
-        log(f"After storage mapping: {len(df_mb51_filtered)} rows")
-        
-        df_mb51_filtered['plant_clean'] = df_mb51_filtered['plant'].astype(str).str.strip().str.upper()
-        mb51_plants = set(df_mb51_filtered['plant_clean'].unique())
-        log(f"Unique plants in MB51: {len(mb51_plants)}")
-
-        # Group MB51
-        log("=== Grouping MB51 by exact combination ===")
-        grouped_mb51 = df_mb51_filtered.groupby(
-            ['material', 'plant_clean', 'storage', 'mv_type', 'mv_text'],
-            dropna=False
-        ).agg({'amount': 'sum'}).reset_index()
-        
-        log(f"  Grouped MB51: {len(grouped_mb51)} unique combinations")
-        
-        # Map mv_text to mv_grouping
-        log("Mapping mv_text to mv_grouping...")
-        grouped_mb51['mv_grouping'] = grouped_mb51['mv_text'].map(mv_text_to_grouping)
-        
-        mapped_count = grouped_mb51['mv_grouping'].notna().sum()
-        unmapped_count = grouped_mb51['mv_grouping'].isna().sum()
-        log(f"  Mapped: {mapped_count}/{len(grouped_mb51)}")
-        log(f"  Unmapped: {unmapped_count}/{len(grouped_mb51)}")
-        
-        # Determine target column
-        log("Determining target columns...")
-        
-        def get_target_column(row):
-            storage = row['storage']
-            mv_grouping = row['mv_grouping']
-            mv_type = row['mv_type']
-            
-            if storage == 'EMPTY_STORAGE':
-                if mv_type == '641':
-                    return 'BF'
-                elif mv_type == '642':
-                    return 'BG'
-            
-            if pd.notna(mv_grouping):
-                key = (storage, mv_grouping)
-                return storage_grouping_to_column.get(key, None)
-            
-            return None
-        
-        grouped_mb51['target_column'] = grouped_mb51.apply(get_target_column, axis=1)
-        
-        has_target = grouped_mb51['target_column'].notna().sum()
-        no_target = grouped_mb51['target_column'].isna().sum()
-        log(f"  Has target column: {has_target}/{len(grouped_mb51)}")
-        log(f"  No target column: {no_target}/{len(grouped_mb51)}")
-        
-        # Create lookup
-        log("Creating lookup dictionary...")
-        mb51_lookup = {}
-        
-        for _, row in grouped_mb51.iterrows():
-            if pd.notna(row['target_column']):
-                key = (row['material'], row['plant_clean'], row['target_column'])
-                if key in mb51_lookup:
-                    mb51_lookup[key] += row['amount']
-                else:
-                    mb51_lookup[key] = row['amount']
-        
-        log(f"  Created lookup with {len(mb51_lookup)} keys")
+        log(f"MB51: {self.rows} rows in {self.chunks} chunk(s), {len(self.grouped)} unique combinations")
+        log(f"Unique plants in MB51: {len(self.plants)}")
+
+        mb51_materials = self.material_keys.groupby(self.MATERIAL_KEYS, dropna=False).size().reset_index(name='count')
+        return self.grouped, mb51_materials
+
+    def total_for_plants(self, plants=None):
+        """Summed amount of the given plants (all plants when empty)"""
+        if plants:
+            return float(self.amount_by_plant[self.amount_by_plant.index.isin(plants)].sum())
+        return float(self.amount_by_plant.sum())
+
+MATERIAL_FRAME_COLUMNS = ['material', 'plant', 'area', 'kode_dist', 'profit_center']
+
+def existing_materials_frame(df_existing, inv_map):
+    """Materials of last period's output (plant B / material F from row 9) joined to the inventory master
+
+    Plants missing from the master get '' for area / kode_dist / profit_center.
+    """
+    picked = df_existing.iloc[7:, [1, 5]]
+    material = picked.iloc[:, 1].astype(str).str.strip()
+    keep = picked.iloc[:, 1].notna() & (material != '') & (material != 'nan')
+    frame = pd.DataFrame({
+        'material': material[keep].to_numpy(dtype=object),
+        'plant': picked.iloc[:, 0][keep].astype(str).str.strip().str.upper().to_numpy(dtype=object),
+    })
+
+    master = pd.DataFrame.from_dict(inv_map, orient='index', columns=['area', 'kode_dist', 'profit_center'],
+                                    dtype=object)
+    joined = master.reindex(frame['plant']).reset_index(drop=True)
+    matched = frame['plant'].isin(master.index).to_numpy()
+    for col in joined.columns:
+        frame[col] = joined[col].where(matched, '')
+    return frame
+
+def new_mb51_materials(mb51_materials, existing, main_file_plants):
+    """MB51 material keys not in the existing materials (anti-join on material|plant), limited to
+    the main file's plants when it has any - in MB51 groupby order"""
+    frame = pd.DataFrame({
+        'material': mb51_materials['material'].astype(str).str.strip(),
+        'plant': mb51_materials['plant_clean'].astype(str).str.strip().str.upper(),
+        'area': mb51_materials['area'],
+        'kode_dist': mb51_materials['kode_dist'],
+        'profit_center': mb51_materials['profit_center'],
+    })
+    existing_keys = existing['material'] + '|' + existing['plant']
+    keep = ~(frame['material'] + '|' + frame['plant']).isin(existing_keys)
+    if main_file_plants:
+        keep &= frame['plant'].isin(main_file_plants)
+    return frame[keep]
+
+def sheet_descriptions(df_out):
+    """Material -> description from last period's output (F / G from row 9); a later row wins"""
+    materials = df_out.iloc[7:, 5].astype(str).str.strip()
+    descriptions = df_out.iloc[7:, 6].astype(str).str.strip()
+    keep = (materials != '') & (materials != 'nan') & (descriptions != '') & (descriptions != 'nan')
+    return dict(zip(materials[keep], descriptions[keep]))
+
+def aggregate_inputs(files, master, options, parse_cache, timings, progress, cancel):
+    """Read the inputs and aggregate everything that does not depend on master_movement
+
+    The result is what the stage cache keeps, so a master_movement change only redoes
+    map_movements and the write.
+    """
+    mb51_path = files.get("mb51")
+    main_path = files.get("main")
+    baso_path = files.get("baso")
+    inv_map = master["inv_map"]
+
+    mb51_chunk_rows = options.get("mb51_chunk_rows")
+    if mb51_chunk_rows is None:
+        mb51_chunk_rows = MB51_CHUNK_ROWS if os.path.getsize(mb51_path) >= MB51_STREAM_MIN_MB * 1024 * 1024 else 0
+    aggregator = MB51Aggregator(inv_map)
+
+    # Read MB51 and the main file sheets together, MB51 first
+    log(f"Reading MB51 and main file sheets ({options.get('parse_mode') or 'thread'} mode)...")
+    progress.stage("reading", "Reading MB51 and main file sheets")
+    required_sheets = ['SALDO AWAL', 'SALDO AWAL MB5B', '13. MB5B', 
+                      '14. SALDO AKHIR EDS', 'Output Report INV ARUS BARANG']
+    
+    sheets_dict = {}
+    with SheetLoader(options.get("parse_mode"), parse_cache, max_workers=len(required_sheets) + 1) as loader:
+        if not mb51_chunk_rows:
+            loader.submit(mb51_path, 0, parse=parse_mb51, cache_key=f"0|{MB51_CACHE_KEY}")
+        for sheet in required_sheets:
+            loader.submit(main_path, sheet)
+
+        if mb51_chunk_rows:
+            # Large extracts are folded chunk by chunk while the main file parses in the background
+            log(f"  Streaming MB51 in chunks of {int(mb51_chunk_rows):,} rows (not parse-cached)")
+            for chunk in iter_mb51_chunks(mb51_path, 0, int(mb51_chunk_rows)):
+                timings.lap("mb51_read", rows=len(chunk))
+                timings.frame("df_mb51", chunk)
+                aggregator.add(chunk)
+                timings.lap("mb51_aggregate", rows=len(chunk))
+                progress.advance(len(chunk), f"MB51: {aggregator.rows:,} rows read")
+                log(f"  MB51 chunk {aggregator.chunks}: {aggregator.rows:,} rows so far")
+                cancel.check("reading")
+        else:
+            df_mb51 = loader.result(mb51_path, 0, required=True)
+            log(f"  ✓ Loaded MB51: {df_mb51.shape}")
+            timings.lap("mb51_read", rows=len(df_mb51))
+            timings.frame("df_mb51", df_mb51)
+            aggregator.add(df_mb51)
+            timings.lap("mb51_aggregate", rows=len(df_mb51))
+            progress.advance(len(df_mb51), f"MB51: {aggregator.rows:,} rows read")
+            del df_mb51
+            cancel.check("reading")
+        for sheet in required_sheets:
+            df = loader.result(main_path, sheet)
+            if df is not None:
+                sheets_dict[sheet] = df
+                log(f"  ✓ Loaded '{sheet}': {df.shape}")
+        timings.lap("main_sheets_read", rows=sum(len(df) for df in sheets_dict.values()))
+        timings.frame("sheets_dict", sheets_dict)
+        cancel.check("reading")
+
+    # Group MB51
+    log("=== Grouping MB51 by exact combination ===")
+    progress.stage("caches", "Grouping MB51 and building sheet caches")
+    grouped_mb51, mb51_materials = aggregator.finish()
+    mb51_plants = aggregator.plants
+    timings.lap("grouping", rows=aggregator.rows)
+    timings.frame("grouped_mb51", grouped_mb51)
+
+    # Initialize sheet cache WITH BASO
+    layouts = get_layout_registry(options)
+    sheet_cache = SheetCache(sheets_dict, baso_path, layouts)
+    if layouts is not None:
+        log(f"Header layouts: {layouts.hits} known, {layouts.misses} detected")
+        layouts.save()
+    timings.lap("cache_build")
+    cancel.check("caches")
+
+    # Get existing materials
+    existing_materials = pd.DataFrame(columns=MATERIAL_FRAME_COLUMNS, dtype=object)
+    if 'Output Report INV ARUS BARANG' in sheets_dict:
+        df_existing = sheets_dict['Output Report INV ARUS BARANG']
+        if df_existing.shape[0] > 8 and df_existing.shape[1] >= 7:
+            log("Loading existing materials from main file...")
+            existing_materials = existing_materials_frame(df_existing, inv_map)
+            unmatched = (~existing_materials['plant'].isin(inv_map.keys())).sum()
+            log(f"  Found {len(existing_materials)} existing materials ({unmatched} without inventory master)")
+
+    # Merge materials
+    log(f"Merging materials from main file and MB51")
+    main_file_plants = set(existing_materials['plant'])
+    new_materials = new_mb51_materials(mb51_materials, existing_materials, main_file_plants)
+    grouped_materials = pd.concat([existing_materials, new_materials], ignore_index=True)
+
+    log(f"  Existing materials: {len(existing_materials)}")
+    log(f"  New materials: {len(new_materials)} of {len(mb51_materials)} MB51 keys")
+    log(f"  Total: {len(grouped_materials)}")
+
+    if len(grouped_materials) == 0:
+        raise ValueError("No materials found")
+
+    # Material descriptions
+    log("Loading material descriptions...")
+    material_desc_map = {}
+    
+    if 'Output Report INV ARUS BARANG' in sheets_dict:
+        try:
+            df_out = sheets_dict['Output Report INV ARUS BARANG']
+            if df_out.shape[0] > 8 and df_out.shape[1] >= 7:
+                material_desc_map = sheet_descriptions(df_out)
+                log(f"  Loaded {len(material_desc_map)} from main file")
+        except Exception as e:
+            log(f"  Warning: {str(e)}")
+    
+    from_mb51 = {mat: desc for mat, desc in aggregator.descriptions.items() if mat not in material_desc_map}
+    material_desc_map.update(from_mb51)
+    log(f"  Added {len(from_mb51)} from MB51")
+    
+    log(f"  Total: {len(material_desc_map)} descriptions")
 
-        # Merge materials
-        log(f"Merging materials from main file and MB51")
-        
-        main_file_plants = set()
-        if len(existing_materials) > 0:
-            main_file_plants = set(m['plant'] for m in existing_materials)
-        
-        all_materials = existing_materials.copy()
-        existing_set = set(f"{m['material']}|{m['plant']}" for m in existing_materials)
-        
-        mb51_materials = df_mb51_filtered.groupby(
-            ['area', 'plant_clean', 'kode_dist', 'profit_center', 'material'], 
-            dropna=False
-        ).size().reset_index(name='count')
-        
-        new_materials_added = 0
-        
-        for _, mb_row in mb51_materials.iterrows():
-            plant_normalized = str(mb_row['plant_clean']).strip().upper()
-            material = str(mb_row['material']).strip()
-            key = f"{material}|{plant_normalized}"
-            
-            if key in existing_set:
-                continue
-            
-            if len(main_file_plants) > 0 and plant_normalized not in main_file_plants:
-                continue
-            
-            all_materials.append({
-                'material': material, 
-                'plant': plant_normalized,
-                'area': mb_row['area'], 
-                'kode_dist': mb_row['kode_dist'],
-                'profit_center': mb_row['profit_center']
-            })
-            new_materials_added += 1
-        
-        log(f"  Existing materials: {len(existing_materials)}")
-        log(f"  New materials: {new_materials_added}")
-        log(f"  Total: {len(all_materials)}")
+    # MB51 side of S1 - ctrl balance
+    mb51_total_amount = aggregator.total_for_plants(main_file_plants)
 
-        if len(all_materials) == 0:
-            raise ValueError("No materials found")
+    # MB5B side of BP2
+    sum_mb5b_pq = 0.0
+    if '13. MB5B' in sheets_dict:
+        df_mb5b_sheet = sheets_dict['13. MB5B']
+        try:
+            if df_mb5b_sheet.shape[1] > 16:
+                sum_p = pd.to_numeric(df_mb5b_sheet.iloc[:, 15], errors='coerce').fillna(0).sum()
+                sum_q = pd.to_numeric(df_mb5b_sheet.iloc[:, 16], errors='coerce').fillna(0).sum()
+                sum_mb5b_pq = sum_p + sum_q
+        except Exception as e:
+            log(f"  Warning: {str(e)}")
+    timings.lap("material_merge", rows=len(grouped_materials))
+    
+    return {
+        "grouped_mb51": grouped_mb51,
+        "mb51_plants": mb51_plants,
+        "grouped_materials": grouped_materials,
+        "material_desc_map": material_desc_map,
+        "sheet_cache": sheet_cache,
+        "mb51_total_amount": float(mb51_total_amount),
+        "sum_mb5b_pq": float(sum_mb5b_pq),
+    }
+
+def map_movements(grouped_mb51, master):
+    """Map grouped MB51 movements to target columns and pivot per (material, plant)"""
+    mv_text_to_grouping = master["mv_text_to_grouping"]
+    movement_table = master["movement_table"]
+    grouped_mb51 = grouped_mb51.copy()
+
+    # Map mv_text to mv_grouping
+    log("Mapping mv_text to mv_grouping...")
+    grouped_mb51['mv_grouping'] = grouped_mb51['mv_text'].map(mv_text_to_grouping)
+    
+    mapped_count = grouped_mb51['mv_grouping'].notna().sum()
+    unmapped_count = grouped_mb51['mv_grouping'].isna().sum()
+    log(f"  Mapped: {mapped_count}/{len(grouped_mb51)}")
+    log(f"  Unmapped: {unmapped_count}/{len(grouped_mb51)}")
+    
+    # Determine target column
+    log("Determining target columns...")
+    
+    grouped_mb51['target_column'] = movement_table.assign(
+        grouped_mb51['storage'], grouped_mb51['mv_text'], grouped_mb51['mv_type']
+    )
+    
+    has_target = grouped_mb51['target_column'].notna().sum()
+    no_target = grouped_mb51['target_column'].isna().sum()
+    log(f"  Has target column: {has_target}/{len(grouped_mb51)}")
+    log(f"  No target column: {no_target}/{len(grouped_mb51)}")
+    
+    # Pivot (material, plant) x target_column
+    log("Creating MB51 pivot...")
+    mb51_pivot = grouped_mb51[grouped_mb51['target_column'].notna()].groupby(
+        ['material', 'plant_clean', 'target_column']
+    )['amount'].sum().unstack('target_column')
+    
+    log(f"  Created pivot with {mb51_pivot.shape[0]} (material, plant) rows x {mb51_pivot.shape[1]} columns")
+
+    return mb51_pivot, int(unmapped_count), int(no_target)
+
+def generate_report(files, report_date, master, plant_code=None, options=None, progress=None, cancel=None):
+    """Generate the report for one plant and return the result dict
+
+    options: {"output_mode": "standard" | "streaming", "formula_mode": "formulas" | "values" | "both",
+              "parse_mode": "thread" | "process",
+              "parse_cache": bool, "parse_cache_dir": ..., "reuse_output": bool, "stage_cache": bool}
+    progress: ProgressReporter for the progress lines (silent when not given)
+    cancel: CancelToken checked at stage / chunk boundaries (raises JobCancelled)
+    """
+    options = options or {}
+    progress = progress or ProgressReporter()
+    cancel = cancel or CancelToken()
+    cancel.check("start")
+    memory = get_memory_tracker("generate_inventory_report", options)
+    timings = StageTimings(memory)
+    parse_cache = get_parse_cache(options)
+    mb51_path = files.get("mb51")
+    main_path = files.get("main")
+    baso_path = files.get("baso")  # TAMBAHAN: Path BASO (opsional)
+
+    if not mb51_path or not main_path:
+        raise ValueError("Payload must include files.mb51 and files.main paths")
+
+    # Log BASO status
+    if baso_path:
+        log(f"BASO file provided: {baso_path}")
+    else:
+        log("BASO file not provided - will use zeros for BASO columns")
+
+    # Fingerprint the request - same inputs give the same output
+    manifest = get_report_manifest(options)
+    digest = parse_cache.digest if parse_cache is not None else file_digest
+    inputs = {
+        "files": {key: digest(path) if path else None for key, path in
+                  (("mb51", mb51_path), ("main", main_path), ("baso", baso_path))},
+        "master_inventory": master["inventory_digest"],
+        "code_version": CODE_VERSION,
+    }
+    stage_key = data_digest(inputs)
+    inputs.update({
+        "master_movement": master["movement_digest"],
+        "report_date": report_date,
+        "plant": plant_code,
+        "options": {key: options.get(key) for key in OUTPUT_OPTIONS},
+    })
+    fingerprint = data_digest(inputs)
+    timings.lap("fingerprint")
+
+    previous = manifest.find_output(fingerprint)
+    if previous is not None:
+        log(f"Inputs unchanged (fingerprint {fingerprint[:10]}) - reusing {previous['output_path']}")
+        progress.complete(f"Inputs unchanged - reusing {os.path.basename(previous['output_path'])}")
+        return dict(previous, reused=True, timings=timings.as_dict())
+
+    # Determine report period
+    log("Determining report period from request body...")
+    report_month_dt = datetime.datetime.strptime(report_date, "%Y-%m-%d")
+    
+    bulan = report_month_dt.strftime("%B").upper()
+    tahun = report_month_dt.year
+    prev_month_dt = report_month_dt
+    prev_month = prev_month_dt.strftime("%B").upper()
+    prev_year = prev_month_dt.year
+    bulan_only = bulan
+
+    log(f"  Report period from request: {bulan} {tahun}")
+
+    stage = manifest.load_stage(stage_key)
+    if stage is not None:
+        log(f"Reusing cached aggregates ({stage_key[:10]}) - only the movement mapping is redone")
+        timings.lap("stage_cache_load")
+    else:
+        stage = aggregate_inputs(files, master, options, parse_cache, timings, progress, cancel)
+        manifest.save_stage(stage_key, stage)
+        timings.lap("stage_cache_save")
+
+    grouped_materials = stage["grouped_materials"]
+    material_desc_map = stage["material_desc_map"]
+    sheet_cache = stage["sheet_cache"]
+    mb51_plants = stage["mb51_plants"]
+    mb51_total_amount = stage["mb51_total_amount"]
+    sum_mb5b_pq = stage["sum_mb5b_pq"]
+
+    mb51_pivot, unmapped_count, no_target = map_movements(stage["grouped_mb51"], master)
+    timings.lap("movement_mapping", rows=len(stage["grouped_mb51"]))
+    cancel.check("movement_mapping")
+
+    # Create workbook
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    # Batch runs can finish several plants within the same second
+    if plant_code:
+        filename = f"Output_Report_INV_ARUS_BARANG_{plant_code}_{timestamp}.xlsx"
+    else:
+        filename = f"Output_Report_INV_ARUS_BARANG_{timestamp}.xlsx"
+    output_dir = os.path.join("assets", "exports")
+    ensure_dir(output_dir)
+    output_path = os.path.join(output_dir, filename)
+
+    # BODY CALCULATION
+    log("Calculating body rows...")
+    num_materials = len(grouped_materials)
+    progress.stage("body", f"Calculating {num_materials:,} body rows")
+    last_row = 8 + num_materials
+
+    body = build_body_frame(grouped_materials, material_desc_map, bulan_only,
+                            sheet_cache, mb51_pivot, mb51_plants)
+
+    eds_hits = {
+        'GS': int((body['BV'] != 0).sum()),
+        'BS': int((body['BW'] != 0).sum()),
+        'total_queries': 2 * num_materials
+    }
+    baso_hits = {
+        'GS': int((body['CC'] != 0).sum()),
+        'BS': int((body['CD'] != 0).sum()),
+        'total_queries': 2 * num_materials
+    }
+
+    # Control totals - needed before the body so the streaming writer can emit rows 1-3 first
+    totals = body[MB51_TARGET_COLUMNS].sum()
+
+    # S1 - ctrl balance
+    sum_r3_bf3 = float(totals.sum())
+    s1_value = round(mb51_total_amount - sum_r3_bf3, 2)
+    log(f"  S1 = {s1_value:.2f}")
+    
+    # BP2 calculation - BP is written as a formula, so only the MB5B sheet contributes
+    sum_bp = 0.0
+    
+    bp2_value = round(sum_bp - sum_mb5b_pq, 2)
+    log(f"  BP2 = {bp2_value:.2f}")
+
+    first_row = grouped_materials.iloc[0] if not grouped_materials.empty else None
+
+    # Formula columns computed here, so the file does not depend on Excel recalculating it
+    formula_mode = options.get("formula_mode", "formulas")
+    if formula_mode not in ("formulas", "values", "both"):
+        raise ValueError(f"Unknown formula_mode: {formula_mode}")
+    computed = {}
+    top_values = None
+    if formula_mode != "formulas":
+        computed = compute_formula_columns(body)
+        top_values = summary_values(body, computed)
+        log(f"  Computed {len(computed)} formula columns ({formula_mode} mode)")
+    if formula_mode == "values":
+        body = body.assign(**computed)
+
+    header = get_header_template(options)
+    header_fields = {"bulan": bulan, "tahun": tahun, "prev_month": prev_month, "prev_year": prev_year}
+    if first_row is not None:
+        header_fields.update(area=first_row['area'], plant=first_row['plant'], kode_dist=first_row['kode_dist'],
+                             profit_center=first_row['profit_center'], bulan_only=bulan_only)
+    header_values = header.values(header_fields, summary_cells(
+        last_row, s1_value, bp2_value, top_values if formula_mode == "values" else None))
+
+    timings.lap("body", rows=num_materials)
+    timings.frame("body", body)
+
+    output_mode = options.get("output_mode", "standard")
+    full_calc = formula_mode == "formulas"
+    level = compression_level(options)
+    log(f"Writing workbook ({output_mode} mode, compression level {'default' if level is None else level})...")
+    cancel.check("body")
+    progress.stage("writing", f"Writing {num_materials:,} rows ({output_mode} mode)", total=num_materials)
+    body_rows = progress.track(checked_rows(iter_frame_rows(body), cancel),
+                               then=lambda: progress.stage("saving", "Saving workbook"))
+    try:
+        if output_mode == "streaming":
+            save_report_streaming(output_path, header, header_values, body_rows, full_calc, timings, level)
+        else:
+            save_report_standard(output_path, header, header_values, body_rows, full_calc, timings, level)
+        if formula_mode == "both":
+            cancel.check("saving")
+            store_cached_values(output_path, computed, top_values, level)
+            timings.lap("cached_values")
+        cancel.check("saving")
+    except JobCancelled:
+        remove_partial(output_path, f"{output_path}.{os.getpid()}.tmp")
+        raise
+
+    log(f"Total rows written: {num_materials}")
+    
+    # Log EDS usage
+    log(f"  === EDS Cache Usage ===")
+    log(f"  Total queries: {eds_hits['total_queries']}")
+    log(f"  GS hits: {eds_hits['GS']}, BS hits: {eds_hits['BS']}")
+    
+    # Log BASO usage
+    log(f"  === BASO Cache Usage ===")
+    log(f"  Total queries: {baso_hits['total_queries']}")
+    log(f"  GS hits: {baso_hits['GS']}, BS hits: {baso_hits['BS']}")
+    
+    if not os.path.exists(output_path):
+        raise Exception(f"File was not created")
+    
+    file_size = os.path.getsize(output_path)
+    log(f"✓ File created: {file_size:,} bytes")
+    if parse_cache is not None:
+        log(f"Parse cache: {parse_cache.hits} hits, {parse_cache.misses} misses")
+    
 
-        grouped_materials = pd.DataFrame(all_materials)
+    result = {
+        "success": True,
+        "output_path": output_path,
+        "rows_written": num_materials,
+        "report_month": f"{bulan} {tahun}",
+        "total_materials": len(grouped_materials),
+        "file_size": file_size,
+        "timestamp": timestamp,
+        "unmapped_count": int(unmapped_count),
+        "no_target_count": int(no_target),
+        "eds_hits": {
+            "total_queries": eds_hits['total_queries'],
+            "gs_hits": eds_hits['GS'],
+            "bs_hits": eds_hits['BS']
+        },
+        "baso_hits": {
+            "total_queries": baso_hits['total_queries'],
+            "gs_hits": baso_hits['GS'],
+            "bs_hits": baso_hits['BS']
+        },
+        "baso_available": baso_path is not None,
+        "timings": timings.as_dict(),
+    }
+    if memory is not None:
+        result["memory"] = memory.as_dict()
+    log(f"Timings: {timings.summary()}")
+
+    manifest.write(fingerprint, inputs, result)
+    append_metrics(metrics_path(options), {
+        "worker": "generate_inventory_report",
+        "plant": plant_code,
+        "output_path": output_path,
+        "rows_written": num_materials,
+        "timings": result["timings"],
+        "memory": result.get("memory"),
+    })
+    progress.complete(f"File created: {file_size:,} bytes")
+    return result
+
+def emit_line(record):
+    """Write one JSON record to stdout"""
+    print(json.dumps(record), flush=True)
+
+def plant_name(job):
+    return str(job.get("plant") or "").strip().upper() or None
+
+def tag_plant_result(result, idx, job):
+    """Batch fields of a plant_result line"""
+    result["type"] = "plant_result"
+    result["plant"] = plant_name(job)
+    result["report_id"] = job.get("report_id")
+    result["index"] = idx
+    return result
+
+def run_plant(idx, total, job, report_date, master, options=None, emit=emit_line, cancel=None):
+    """Generate one batch plant; errors become a failed plant_result instead of raising"""
+    plant = plant_name(job)
+    log(f"=== Batch {idx + 1}/{total}: plant {plant} ===")
 
-        # Material descriptions
-        log("Loading material descriptions...")
-        material_desc_map = {}
-        
-        if 'Output Report INV ARUS BARANG' in sheets_dict:
-            try:
-                df_out = sheets_dict['Output Report INV ARUS BARANG']
-                if df_out.shape[0] > 8 and df_out.shape[1] >= 7:
-                    for idx in range(7, len(df_out)):
-                        try:
-                            row = df_out.iloc[idx]
-                            mat_key = str(row.iloc[5]).strip() if len(row) > 5 else ''
-                            mat_desc = str(row.iloc[6]).strip() if len(row) > 6 else ''
-                            if mat_key and mat_key != 'nan' and mat_desc and mat_desc != 'nan':
-                                material_desc_map[mat_key] = mat_desc
-                        except:
-                            continue
-                    log(f"  Loaded {len(material_desc_map)} from main file")
-            except Exception as e:
-                log(f"  Warning: {str(e)}")
-        
-        if 'material_desc_mb51' in df_mb51.columns:
-            desc_df = df_mb51[['material', 'material_desc_mb51']].dropna()
-            desc_df = desc_df[desc_df['material_desc_mb51'].astype(str).str.strip() != '']
-            desc_df = desc_df.drop_duplicates('material', keep='first')
-            
-            added_from_mb51 = 0
-            for mat, desc in zip(desc_df['material'], desc_df['material_desc_mb51']):
-                if mat not in material_desc_map:
-                    material_desc_map[mat] = desc
-                    added_from_mb51 += 1
-            
-            log(f"  Added {added_from_mb51} from MB51")
-        
-        log(f"  Total: {len(material_desc_map)} descriptions")
+    try:
+        job_options = dict(options or {}, **(job.get("options") or {}))
+        with get_progress_reporter(job_options, plant, emit) as progress:
+            result = generate_report(job.get("files", {}), report_date, master, plant_code=plant,
+                                     options=job_options, progress=progress, cancel=cancel)
+    except JobCancelled as e:
+        log(f"CANCELLED [{plant}]: {str(e)}")
+        result = e.result()
+    except Exception as e:
+        tb = traceback.format_exc()
+        log(f"ERROR [{plant}]: {str(e)}")
+        log(f"Traceback:\n{tb}")
+        result = {
+            "success": False,
+            "error": str(e),
+            "trace": tb
+        }
 
-        # Create workbook
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"Output_Report_INV_ARUS_BARANG_{timestamp}.xlsx"
-        output_dir = os.path.join("assets", "exports")
-        ensure_dir(output_dir)
-        output_path = os.path.join(output_dir, filename)
-
-        log("Creating Excel workbook...")
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Output Report INV ARUS BARANG"
-        center = Alignment(horizontal="center", vertical="center")
-
-        # HEADER (tetap sama)
-        ws["F1"], ws["F2"], ws["F3"], ws["F4"], ws["F5"], ws["F7"] = "Nama Area", "Plant", "Kode Dist", "Profit Center", "Periode", "Material"
-        
-        if not grouped_materials.empty:
-            first_row = grouped_materials.iloc[0]
-            ws["G1"], ws["G2"], ws["G3"], ws["G4"], ws["G5"] = first_row['area'], first_row['plant'], first_row['kode_dist'], first_row['profit_center'], bulan_only
-        
-        ws["G7"] = "Material Description"
-        ws["A8"], ws["B8"], ws["C8"], ws["D8"], ws["E8"], ws["F8"] = "Nama Area", "Plant", "Kode Dist", "Profit Center", "Periode", "source data"
-        
-        # Row 8 labels
-        ws["R8"], ws["S8"], ws["T8"], ws["U8"], ws["V8"], ws["W8"], ws["X8"], ws["Y8"] = "DTB", "BPPR", "LBP", "LBP", "DTB", "BPPR", "ALIH STATUS", "Pemusnahan"
-        ws["AB8"], ws["AC8"], ws["AD8"], ws["AE8"], ws["AF8"], ws["AG8"], ws["AH8"], ws["AI8"] = "DTB", "BPPR", "LBP", "LBP", "DTB", "BPPR", "ALIH STATUS", "Pemusnahan"
-        ws["AL8"], ws["AM8"], ws["AN8"], ws["AO8"], ws["AP8"], ws["AQ8"], ws["AR8"], ws["AS8"] = "DTB", "BPPR", "LBP", "LBP", "DTB", "BPPR", "ALIH STATUS", "Pemusnahan"
-        ws["AV8"], ws["AW8"], ws["AX8"], ws["AY8"], ws["AZ8"], ws["BA8"], ws["BB8"], ws["BC8"] = "DTB", "BPPR", "LBP", "LBP", "DTB", "BPPR", "ALIH STATUS", "Pemusnahan"
-        ws["BF8"], ws["BG8"] = "641", "642"
-
-        ws.merge_cells("H4:M4")
-        ws["H4"] = f"SALDO AWAL {bulan} {tahun}"
-        ws["H4"].alignment = center
-        
-        ws.merge_cells("H5:J5")
-        ws["H5"] = f"SALDO AWAL {prev_month} {prev_year}"
-        ws["H5"].alignment = center
-        
-        ws.merge_cells("K5:M5")
-        ws["K5"] = "SAP - MB5B"
-        ws["K5"].alignment = center
-        ws["N5"] = "DIFF"
-        ws["N5"].alignment = center
-
-        headers_6 = ["GS", "BS", "Grand Total", "GS", "BS", "Grand Total", "GS", "BS", "Grand Total"]
-        for i, label in enumerate(headers_6, start=8):
-            ws.cell(row=6, column=i, value=label).alignment = center
-
-        for col in range(8, 17):
-            ws.cell(row=7, column=col, value="S.Aw").alignment = center
-
-        ws["R1"] = "ctrl balance MB51"
-        ws.merge_cells("R5:BH5")
-        ws["R5"] = "SAP - MB51"
-        ws["R5"].alignment = center
-
-        ws.merge_cells("R6:Z6")
-        ws["R6"] = "GS00"
-        ws["R6"].alignment = center
-
-        gs00_movements = [
-            ("R", "Terima Barang"), ("S", "Retur Beli"), ("T", "Penjualan"),
-            ("U", "Retur Jual"), ("V", "Intra Gudang Masuk"), ("W", "Intra Gudang"),
-            ("X", "Transfer Stock"), ("Y", "Pemusnahan"), ("Z", "Adjustment")
-        ]
-        for col, label7 in gs00_movements:
-            ws[f"{col}7"] = label7
-            ws[f"{col}7"].alignment = center
-
-        ws.merge_cells("AB6:AJ6")
-        ws["AB6"] = "BS00"
-        ws["AB6"].alignment = center
-        bs00_movements = [
-            ("AB", "Terima Barang"), ("AC", "Retur Beli"), ("AD", "Penjualan"),
-            ("AE", "Retur Jual"), ("AF", "Intra Gudang Masuk"), ("AG", "Intra Gudang"),
-            ("AH", "Transfer Stock"), ("AI", "Pemusnahan"), ("AJ", "Adjustment")
-        ]
-        for col, label7 in bs00_movements:
-            ws[f"{col}7"] = label7
-            ws[f"{col}7"].alignment = center
-
-        ws.merge_cells("AL6:AT6")
-        ws["AL6"] = "AI00"
-        ws["AL6"].alignment = center
-        ai00_movements = [
-            ("AL", "Terima Barang"), ("AM", "Retur Beli"), ("AN", "Penjualan"),
-            ("AO", "Retur Jual"), ("AP", "Intra Gudang Masuk"), ("AQ", "Intra Gudang"),
-            ("AR", "Transfer Stock"), ("AS", "Pemusnahan"), ("AT", "Adjustment")
-        ]
-        for col, label7 in ai00_movements:
-            ws[f"{col}7"] = label7
-            ws[f"{col}7"].alignment = center
-
-        ws.merge_cells("AV6:BD6")
-        ws["AV6"] = "TR00"
-        ws["AV6"].alignment = center
-        tr00_movements = [
-            ("AV", "Terima Barang"), ("AW", "Retur Beli"), ("AX", "Penjualan"),
-            ("AY", "Retur Jual"), ("AZ", "Intra Gudang Masuk"), ("BA", "Intra Gudang"),
-            ("BB", "Transfer Stock"), ("BC", "Pemusnahan"), ("BD", "Adjustment")
-        ]
-        for col, label7 in tr00_movements:
-            ws[f"{col}7"] = label7
-            ws[f"{col}7"].alignment = center
-
-        ws.merge_cells("BF6:BH6")
-        ws["BF6"] = "641 dan 642 tanpa sloc"
-        ws["BF6"].alignment = center
-        ws["BF7"], ws["BG7"], ws["BH7"] = "Intra Gudang", "Intra Gudang", "CEK"
-        ws["BI3"], ws["BI4"] = "-->stock in transit", "jika selisih cek ke MB5T"
-
-        # END STOCK
-        ws.merge_cells("BK4:BP4")
-        ws["BK4"] = f"END STOCK {prev_month} {prev_year}"
-        ws["BK4"].alignment = center
-        ws.merge_cells("BK5:BM5")
-        ws["BK5"] = "SALDO AKHIR"
-        ws["BK5"].alignment = center
-        ws.merge_cells("BN5:BP5")
-        ws["BN5"] = "SAP - MB5B"
-        ws["BN5"].alignment = center
-        ws["BQ5"] = "DIFF"
-        ws["BQ5"].alignment = center
-
-        ws["BK6"], ws["BL6"], ws["BM6"] = "GS00", "BS00", "Grand Total"
-        ws["BN6"], ws["BO6"], ws["BP6"] = "GS", "BS", "Grand Total"
-        ws["BQ6"], ws["BR6"], ws["BS6"] = "GS", "BS", "Grand Total"
-
-        for col in range(63, 72):
-            ws.cell(row=6, column=col).alignment = center
-            ws.cell(row=7, column=col, value="S.Ak").alignment = center
-
-        ws["BT7"] = "CEK SELISIH VS BULAN LALU"
-        ws["BU7"] = "kalo ada selisih atas inputan LOG1, LOG2 -> konfirmasi pa Reza utk diselesaikan"
-
-        ws.merge_cells("BV5:BX5")
-        ws["BV5"] = "STOCK - EDS"
-        ws["BV5"].alignment = center
-        ws["BY5"] = "DIFF"
-        ws["BY5"].alignment = center
-
-        ws["BV6"], ws["BW6"], ws["BX6"] = "GS", "BS", "Grand Total"
-        ws["BY6"], ws["BZ6"], ws["CA6"] = "GS", "BS", "Grand Total"
-
-        for col in range(74, 80):
-            ws.cell(row=6, column=col).alignment = center
-            ws.cell(row=7, column=col, value="S.Ak").alignment = center
-
-        # TAMBAHAN: BASO HEADERS (kolom CC, CD, CE)
-        ws.merge_cells("CC5:CE5")
-        ws["CC5"] = "STOCK - BASO"
-        ws["CC5"].alignment = center
-
-        ws["CC6"], ws["CD6"], ws["CE6"] = "GS", "BS", "Grand Total"
-        for col in range(get_column_index("CC"), get_column_index("CE") + 1):
-            ws.cell(row=6, column=col).alignment = center
-            ws.cell(row=7, column=col, value="S.Ak").alignment = center
-
-        # BODY CALCULATION
-        log("Calculating body rows...")
-        write_row = 9
-        totals = defaultdict(float)
-        
-        # Initialize tracking
-        eds_hits = {'GS': 0, 'BS': 0, 'total_queries': 0}
-        baso_hits = {'GS': 0, 'BS': 0, 'total_queries': 0}
-        
-        num_materials = len(grouped_materials)
-        all_target_columns = ["R", "S", "T", "U", "V", "W", "X", "Y", "Z",
-                              "AB", "AC", "AD", "AE", "AF", "AG", "AH", "AI", "AJ",
-                              "AL", "AM", "AN", "AO", "AP", "AQ", "AR", "AS", "AT",
-                              "AV", "AW", "AX", "AY", "AZ", "BA", "BB", "BC", "BD",
-                              "BF", "BG"]
-        
-        for idx in range(num_materials):
-            if idx % 100 == 0:
-                log(f"  Processing {idx}/{num_materials}")
-            
-            mat_row = grouped_materials.iloc[idx]
-            area = str(mat_row['area'])
-            plant = str(mat_row['plant']).strip().upper()
-            kode_dist = str(mat_row['kode_dist'])
-            profit_center = str(mat_row['profit_center'])
-            material = str(mat_row['material'])
-            material_desc = material_desc_map.get(material, "")
-            
-            plant_exists_in_mb51 = plant in mb51_plants
-
-            # Write basic info
-            ws.cell(row=write_row, column=1, value=area)
-            ws.cell(row=write_row, column=2, value=plant)
-            ws.cell(row=write_row, column=3, value=kode_dist)
-            ws.cell(row=write_row, column=4, value=profit_center)
-            ws.cell(row=write_row, column=5, value=bulan_only)
-            ws.cell(row=write_row, column=6, value=material)
-            ws.cell(row=write_row, column=7, value=material_desc)
-
-            # SALDO AWAL
-            h9 = sheet_cache.get_saldo_awal(material, plant, "GS")
-            i9 = sheet_cache.get_saldo_awal(material, plant, "BS")
-            j9_formula = f"=H{write_row}+I{write_row}"
-            
-            ws.cell(row=write_row, column=8, value=h9)
-            ws.cell(row=write_row, column=9, value=i9)
-            ws.cell(row=write_row, column=10, value=j9_formula)
+    return tag_plant_result(result, idx, job)
+
+def estimate_plant_mb(files):
+    """Rough peak RSS of one plant job from its input file sizes"""
+    size = 0
+    for path in (files or {}).values():
+        if path and os.path.exists(path):
+            size += os.path.getsize(path)
+    return PLANT_BASE_MB + PLANT_MB_PER_INPUT_MB * size / MB
+
+def plant_workers(options, job_count):
+    """How many plants run at once: options / env "plant_workers", "auto" = usable CPUs"""
+    value = (options or {}).get("plant_workers") or os.environ.get("INVENTORY_PLANT_WORKERS") or "auto"
+    if value == "auto":
+        value = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    return max(1, min(int(value), job_count))
+
+def memory_budget_mb(options):
+    """MB the concurrent plants may use together: options / env "memory_budget_mb", else 80% of MemAvailable"""
+    value = (options or {}).get("memory_budget_mb") or os.environ.get("INVENTORY_MEMORY_BUDGET_MB")
+    if value:
+        return float(value)
+    available = available_memory()
+    return available * 0.8 / MB if available is not None else None
+
+def plant_child(conn, idx, total, job, report_date, master, options, cancel):
+    """Child process of a parallel batch: one plant; progress records and the result go back through conn"""
+    # The parent forwards a cancel as SIGTERM (the daemon installs no handlers of its own)
+    install_signal_handlers(cancel)
+    lock = threading.Lock()  # the progress heartbeat thread sends too
+
+    def send(kind, record):
+        with lock:
+            conn.send((kind, record))
 
-            k9 = sheet_cache.get_mb5b_awal(material, plant, "GS")
-            l9 = sheet_cache.get_mb5b_awal(material, plant, "BS")
-            m9_formula = f"=SUM(K{write_row}:L{write_row})"
-            
-            ws.cell(row=write_row, column=11, value=k9)
-            ws.cell(row=write_row, column=12, value=l9)
-            ws.cell(row=write_row, column=13, value=m9_formula)
+    try:
+        send("result", run_plant(idx, total, job, report_date, master, options,
+                                 emit=lambda record: send("progress", record), cancel=cancel))
+    finally:
+        conn.close()
+
+def run_plants_parallel(jobs, report_date, master, options, workers, cancel, emit=emit_line):
+    """Run plants in child processes, at most workers at once and within the memory budget
+
+    Every plant gets its own short-lived child, so its memory goes back to the system when it
+    finishes. With fork the parsed master state is inherited as is, nothing is re-serialized.
+    A plant only starts while the estimates of the running plants plus its own fit the budget
+    (one always runs). Results are yielded as plants finish; "index" gives the job position.
+    Progress records of the children come back through their pipe and are written here with
+    emit, so lines of different plants never interleave.
+    On cancel the running children get SIGTERM (they stop at their next checkpoint) and the
+    plants not started yet are reported as cancelled.
+    """
+    ctx = mp.get_context("fork") if "fork" in mp.get_all_start_methods() else mp.get_context()
+    budget = memory_budget_mb(options)
+    total = len(jobs)
+    log(f"Running up to {workers} plants at once"
+        + (f" within {budget:,.0f} MB" if budget is not None else ""))
+
+    pending = deque(enumerate(jobs))
+    running = {}  # result connection -> (process, idx, job, estimate)
+    in_use = 0.0
+    forwarded = False
+    while running or (pending and not cancel.cancelled()):
+        while pending and len(running) < workers and not cancel.cancelled():
+            idx, job = pending[0]
+            estimate = estimate_plant_mb(job.get("files"))
+            if running and budget is not None and in_use + estimate > budget:
+                break
+            pending.popleft()
+            recv_conn, send_conn = ctx.Pipe(duplex=False)
+            process = ctx.Process(target=plant_child,
+                                  args=(send_conn, idx, total, job, report_date, master, options, cancel))
+            process.start()
+            send_conn.close()
+            running[recv_conn] = (process, idx, job, estimate)
+            in_use += estimate
+
+        # Short waits, so a cancel reaches the children while they run
+        if cancel.cancelled() == "cancelled" and not forwarded:
+            for process, _, _, _ in running.values():
+                process.terminate()
+            forwarded = True
+
+        for conn in mp_connection.wait(list(running), timeout=0.5):
+            try:
+                kind, result = conn.recv()
+            except EOFError:
+                kind, result = "result", None
+            if kind == "progress":
+                emit(result)
+                continue
+            process, idx, job, estimate = running.pop(conn)
+            conn.close()
+            process.join()
+            in_use -= estimate
+            if result is None and cancel.cancelled():
+                result = tag_plant_result(JobCancelled(cancel.cancelled(), "running").result(), idx, job)
+            elif result is None:
+                log(f"ERROR [{plant_name(job)}]: worker process exited with code {process.exitcode}")
+                result = tag_plant_result({
+                    "success": False,
+                    "error": f"Worker process exited with code {process.exitcode} (out of memory?)"
+                }, idx, job)
+            yield result
+
+    for idx, job in pending:
+        yield tag_plant_result(JobCancelled(cancel.cancelled(), "queued").result(), idx, job)
+
+def run_batch(jobs, report_date, master, options=None, emit=emit_line, cancel=None):
+    """Generate several plants, streaming one result line per plant
+
+    Plants run in parallel child processes when more than one CPU is usable (see
+    run_plants_parallel), otherwise one after the other in this process.
+    """
+    cancel = cancel or CancelToken()
+    total = len(jobs)
+    workers = plant_workers(options, total)
+    if workers > 1:
+        results = run_plants_parallel(jobs, report_date, master, options, workers, cancel, emit)
+    else:
+        results = (run_plant(idx, total, job, report_date, master, options, emit, cancel)
+                   for idx, job in enumerate(jobs))
+
+    succeeded = 0
+    cancelled = 0
+    for result in results:
+        emit(result)
+        if result.get("success"):
+            succeeded += 1
+        elif result.get("cancelled"):
+            cancelled += 1
+
+    return {
+        "type": "batch_complete",
+        "success": succeeded == total,
+        "total": total,
+        "succeeded": succeeded,
+        "failed": total - succeeded - cancelled,
+        "cancelled": cancelled
+    }
 
-            n9_formula = f"=H{write_row}-K{write_row}"
-            o9_formula = f"=I{write_row}-L{write_row}"
-            p9_formula = f"=N{write_row}+O{write_row}"
-            
-            ws.cell(row=write_row, column=14, value=n9_formula)
-            ws.cell(row=write_row, column=15, value=o9_formula)
-            ws.cell(row=write_row, column=16, value=p9_formula)
-
-            # Write MB51 columns
-            if plant_exists_in_mb51:
-                for target_col in all_target_columns:
-                    lookup_key = (material, plant, target_col)
-                    amount = mb51_lookup.get(lookup_key, 0.0)
-                    ws.cell(row=write_row, column=get_column_index(target_col), value=amount)
-                    totals[target_col] += amount
-            else:
-                for target_col in all_target_columns:
-                    ws.cell(row=write_row, column=get_column_index(target_col), value=0)
-
-            # BH formula
-            bh9_formula = f"=V{write_row}-BF{write_row}-BG{write_row}"
-            ws.cell(row=write_row, column=get_column_index("BH"), value=bh9_formula)
-
-            # END STOCK
-            bk9_formula = f"=H{write_row}+SUM(R{write_row}:Z{write_row})+SUM(AL{write_row}:BD{write_row})"
-            bl9_formula = f"=I{write_row}+SUM(AB{write_row}:AJ{write_row})"
-            bm9_formula = f"=BK{write_row}+BL{write_row}"
-            
-            ws.cell(row=write_row, column=get_column_index("BK"), value=bk9_formula)
-            ws.cell(row=write_row, column=get_column_index("BL"), value=bl9_formula)
-            ws.cell(row=write_row, column=get_column_index("BM"), value=bm9_formula)
-
-            # SAP - MB5B
-            bn9 = sheet_cache.get_mb5b(material, plant, "GS")
-            bo9 = sheet_cache.get_mb5b(material, plant, "BS")
-            bp9_formula = f"=SUM(BN{write_row}:BO{write_row})"
-            
-            ws.cell(row=write_row, column=get_column_index("BN"), value=bn9)
-            ws.cell(row=write_row, column=get_column_index("BO"), value=bo9)
-            ws.cell(row=write_row, column=get_column_index("BP"), value=bp9_formula)
-
-            # DIFF
-            bq9_formula = f"=BK{write_row}-BN{write_row}"
-            br9_formula = f"=BL{write_row}-BO{write_row}"
-            bs9_formula = f"=BQ{write_row}+BR{write_row}"
-            
-            ws.cell(row=write_row, column=get_column_index("BQ"), value=bq9_formula)
-            ws.cell(row=write_row, column=get_column_index("BR"), value=br9_formula)
-            ws.cell(row=write_row, column=get_column_index("BS"), value=bs9_formula)
+def main():
+    try:
+        payload = json.load(sys.stdin)
+        report_date = payload.get("report_date")
+        cancel = get_cancel_token(payload.get("options"))
 
-            bt9_formula = f"=P{write_row}-BS{write_row}"
-            ws.cell(row=write_row, column=get_column_index("BT"), value=bt9_formula)
+        if not report_date:
+            raise ValueError("Payload must include report_date")
 
-            # STOCK - EDS
-            bv9 = sheet_cache.get_eds(material, plant, "GS")
-            bw9 = sheet_cache.get_eds(material, plant, "BS")
-            bx9_formula = f"=BV{write_row}+BW{write_row}"
-            
-            eds_hits['total_queries'] += 2
-            if bv9 != 0:
-                eds_hits['GS'] += 1
-            if bw9 != 0:
-                eds_hits['BS'] += 1
-            
-            ws.cell(row=write_row, column=get_column_index("BV"), value=bv9)
-            ws.cell(row=write_row, column=get_column_index("BW"), value=bw9)
-            ws.cell(row=write_row, column=get_column_index("BX"), value=bx9_formula)
+        master = build_master_state(
+            payload.get("master_inventory", []),
+            payload.get("master_movement", [])
+        )
 
-            by9_formula = f"=BN{write_row}-BV{write_row}"
-            bz9_formula = f"=BO{write_row}-BW{write_row}"
-            ca9_formula = f"=BY{write_row}+BZ{write_row}"
-            
-            ws.cell(row=write_row, column=get_column_index("BY"), value=by9_formula)
-            ws.cell(row=write_row, column=get_column_index("BZ"), value=bz9_formula)
-            ws.cell(row=write_row, column=get_column_index("CA"), value=ca9_formula)
-
-            # TAMBAHAN: STOCK - BASO (kolom CC, CD, CE)
-            cc9 = sheet_cache.get_baso(material, plant, "GS")
-            cd9 = sheet_cache.get_baso(material, plant, "BS")
-            ce9_formula = f"=CC{write_row}+CD{write_row}"
-            
-            baso_hits['total_queries'] += 2
-            if cc9 != 0:
-                baso_hits['GS'] += 1
-            if cd9 != 0:
-                baso_hits['BS'] += 1
-            
-            ws.cell(row=write_row, column=get_column_index("CC"), value=cc9)
-            ws.cell(row=write_row, column=get_column_index("CD"), value=cd9)
-            ws.cell(row=write_row, column=get_column_index("CE"), value=ce9_formula)
+        # Batch mode: {"plants": [{"plant", "report_id", "files": {...}}, ...]}
+        if "plants" in payload:
+            jobs = payload.get("plants") or []
+            if not jobs:
+                raise ValueError("Payload plants must not be empty")
 
-            write_row += 1
+            log(f"Batch mode: {len(jobs)} plants")
+            summary = run_batch(jobs, report_date, master, options=payload.get("options"), cancel=cancel)
+            print(json.dumps(summary))
+            sys.stdout.flush()
+            log(f"✓ Batch completed: {summary['succeeded']}/{summary['total']} plants")
+            return
 
-        log(f"Total rows written: {write_row - 9}")
-        
-        # Log EDS usage
-        log(f"  === EDS Cache Usage ===")
-        log(f"  Total queries: {eds_hits['total_queries']}")
-        log(f"  GS hits: {eds_hits['GS']}, BS hits: {eds_hits['BS']}")
-        
-        # Log BASO usage
-        log(f"  === BASO Cache Usage ===")
-        log(f"  Total queries: {baso_hits['total_queries']}")
-        log(f"  GS hits: {baso_hits['GS']}, BS hits: {baso_hits['BS']}")
-
-        # Write formulas
-        log("Writing formulas...")
-        last_row = write_row - 1
-        
-        sum_columns = ["R", "S", "T", "U", "V", "W", "X", "Y", "Z",
-                      "AB", "AC", "AD", "AE", "AF", "AG", "AH", "AI", "AJ",
-                      "AL", "AM", "AN", "AO", "AP", "AQ", "AR", "AS", "AT",
-                      "AV", "AW", "AX", "AY", "AZ", "BA", "BB", "BC", "BD",
-                      "BF", "BG", "BH"]
-        
-        for col in sum_columns:
-            ws[f"{col}3"] = f"=SUM({col}9:{col}{last_row})"
-        
-        # S1 - ctrl balance
-        if len(main_file_plants) > 0:
-            mb51_for_s1 = df_mb51_filtered[df_mb51_filtered['plant_clean'].isin(main_file_plants)]
-            mb51_total_amount = mb51_for_s1['amount'].sum()
-        else:
-            mb51_total_amount = df_mb51_filtered['amount'].sum()
-        
-        sum_r3_bf3 = sum([totals.get(col, 0) for col in sum_columns if col != "BH"])
-        s1_value = round(mb51_total_amount - sum_r3_bf3, 2)
-        ws["S1"] = s1_value
-        log(f"  S1 = {s1_value:.2f}")
-        
-        # BB2 formula
-        ws["BB2"] = "=X3+AH3+AR3+BB3"
-        
-        # BP2 calculation
-        sum_bp = 0.0
-        for row in range(9, write_row):
-            cell_val = ws.cell(row=row, column=get_column_index("BP")).value
-            if isinstance(cell_val, (int, float)):
-                sum_bp += cell_val
-        
-        sum_mb5b_pq = 0.0
-        if '13. MB5B' in sheets_dict:
-            df_mb5b_sheet = sheets_dict['13. MB5B']
-            try:
-                if df_mb5b_sheet.shape[1] > 16:
-                    sum_p = pd.to_numeric(df_mb5b_sheet.iloc[:, 15], errors='coerce').fillna(0).sum()
-                    sum_q = pd.to_numeric(df_mb5b_sheet.iloc[:, 16], errors='coerce').fillna(0).sum()
-                    sum_mb5b_pq = sum_p + sum_q
-            except Exception as e:
-                log(f"  Warning: {str(e)}")
-        
-        bp2_value = round(sum_bp - sum_mb5b_pq, 2)
-        ws["BP2"] = bp2_value
-        log(f"  BP2 = {bp2_value:.2f}")
-
-        # Formatting
-        log("Formatting...")
-        for i in range(1, 85):  # Extended untuk BASO columns
-            ws.column_dimensions[get_column_letter(i)].width = 12
-        
-        ws.column_dimensions['Q'].width = 2
-        ws.column_dimensions['AA'].width = 2
-        ws.column_dimensions['AK'].width = 2
-        ws.column_dimensions['AU'].width = 2
-        ws.column_dimensions['BE'].width = 2
-        ws.column_dimensions['BJ'].width = 4
-        ws.column_dimensions['CB'].width = 2  # Space before BASO
-
-        ws.freeze_panes = "H9"
-
-        for row in range(9, write_row):
-            for col in range(8, 85):  # Extended untuk BASO
-                cell = ws.cell(row=row, column=col)
-                if isinstance(cell.value, (int, float)):
-                    cell.number_format = '#,##0'
-        
-        for row in [2, 3]:
-            for col in range(18, 85):  # Extended untuk BASO
-                ws.cell(row=row, column=col).number_format = '#,##0'
+        with get_progress_reporter(payload.get("options"), emit=emit_line) as progress:
+            result = generate_report(payload.get("files", {}), report_date, master,
+                                     options=payload.get("options"), progress=progress, cancel=cancel)
 
-        # Save
-        log(f"Saving workbook...")
-        wb.save(output_path)
-        
-        if not os.path.exists(output_path):
-            raise Exception(f"File was not created")
-        
-        file_size = os.path.getsize(output_path)
-        log(f"✓ File created: {file_size:,} bytes")
-        
-        result = {
-            "success": True,
-            "output_path": output_path,
-            "rows_written": write_row - 9,
-            "report_month": f"{bulan} {tahun}",
-            "total_materials": len(grouped_materials),
-            "file_size": file_size,
-            "timestamp": timestamp,
-            "unmapped_count": int(unmapped_count),
-            "no_target_count": int(no_target),
-            "eds_hits": {
-                "total_queries": eds_hits['total_queries'],
-                "gs_hits": eds_hits['GS'],
-                "bs_hits": eds_hits['BS']
-            },
-            "baso_hits": {
-                "total_queries": baso_hits['total_queries'],
-                "gs_hits": baso_hits['GS'],
-                "bs_hits": baso_hits['BS']
-            },
-            "baso_available": baso_path is not None
-        }
-        
         print(json.dumps(result))
         sys.stdout.flush()
         log("✓ Report completed successfully with BASO support!")
 
+    except JobCancelled as e:
+        log(f"CANCELLED: {str(e)}")
+        print(json.dumps(e.result()))
+        sys.stdout.flush()
+        sys.exit(1)
+
     except Exception as e:
         tb = traceback.format_exc()
         log(f"ERROR: {str(e)}")
@@ -1220,4 +1807,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
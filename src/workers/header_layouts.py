@@ -0,0 +1,95 @@
+# header_layouts.py - Remembered header layouts of input sheets
+# SAP extracts and BASO files come from a handful of templates. The header row and the
+# column mapping found for a sheet are stored under a signature of the rows up to and
+# including its header row, so the next file from the same template skips the header
+# search and the find_col matching. A layout whose detection looked further (no header
+# row found, so every scanned row counted) gives that row count as "signature_rows".
+#
+# Unknown signatures fall back to the detection heuristics and are then remembered.
+#
+# Options (payload "options"):
+#   layout_cache      : false disables the registry (default true)
+#   layout_cache_path : default assets/cache/header_layouts.json (env INVENTORY_LAYOUT_CACHE)
+
+import sys
+import os
+import json
+import hashlib
+
+# Bump when a detection heuristic changes, so old layouts are ignored
+LAYOUT_VERSION = "2"
+MAX_LAYOUTS_PER_KIND = 50
+
+def log(msg):
+    """Log to stderr"""
+    print(f"[header-layouts] {msg}", file=sys.stderr, flush=True)
+
+def rows_signature(kind, rows):
+    """Digest of the given leading rows of a sheet"""
+    raw = json.dumps([LAYOUT_VERSION, kind, [[str(v) for v in row] for row in rows]], ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+def signature_rows(layout):
+    """Number of leading rows the detection of a layout depended on"""
+    return layout.get("signature_rows", layout["header_row"] + 1)
+
+class HeaderLayoutRegistry:
+    """kind -> {signature: {"header_row": int, "columns": {field: label}}}, kept as one JSON file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.layouts = {}
+        self.hits = 0
+        self.misses = 0
+        self.changed = False
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == LAYOUT_VERSION:
+                self.layouts = data.get("layouts") or {}
+        except (OSError, ValueError, AttributeError):
+            pass
+
+    def resolve(self, kind, rows, detect):
+        """Layout for a sheet whose first rows are given; detect(rows) -> layout or None on a miss"""
+        known = self.layouts.get(kind, {})
+        for count in sorted({signature_rows(layout) for layout in known.values()}):
+            if count > len(rows):
+                continue
+            layout = known.get(rows_signature(kind, rows[:count]))
+            if layout is not None:
+                self.hits += 1
+                return layout
+
+        self.misses += 1
+        layout = detect(rows)
+        if layout is not None:
+            known = self.layouts.setdefault(kind, {})
+            known[rows_signature(kind, rows[:signature_rows(layout)])] = layout
+            while len(known) > MAX_LAYOUTS_PER_KIND:
+                known.pop(next(iter(known)))
+            self.changed = True
+        return layout
+
+    def save(self):
+        """Write the registry back if it learned a layout; failures never fail the report"""
+        if not self.changed:
+            return
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": LAYOUT_VERSION, "layouts": self.layouts}, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.path)
+            self.changed = False
+        except OSError as e:
+            log(f"Could not save layouts: {str(e)}")
+
+def get_layout_registry(options=None):
+    """HeaderLayoutRegistry configured from payload options / environment, or None when disabled"""
+    options = options or {}
+    if options.get("layout_cache") is False:
+        return None
+    path = options.get("layout_cache_path") or os.environ.get(
+        "INVENTORY_LAYOUT_CACHE", os.path.join("assets", "cache", "header_layouts.json"))
+    return HeaderLayoutRegistry(path)
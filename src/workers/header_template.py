@@ -0,0 +1,367 @@
+# header_template.py - Prebuilt header (rows 1-8) of the inventory report
+# The header layout ('Mapping Inventory.txt', built by write_header below) is captured once as
+# plain data - cell values with {field} placeholders, alignment / number format per cell,
+# merged ranges, column widths - and cached on disk. Each output then only stamps it:
+# placeholders are filled in (area, plant, period, month labels) and the shared style objects
+# are reused instead of being rebuilt cell by cell.
+#
+# The cache is keyed by the digest of this module, report_layout.py and report_layout.json, so
+# any change to the header code or the column layout rebuilds it. Cache dir: options / payload
+# "report_cache_dir" (default assets/cache, env INVENTORY_REPORT_CACHE_DIR).
+# Only openpyxl and the layout are needed, so the merge worker stamps the header without
+# importing the generator.
+
+import sys
+import os
+import re
+import json
+import hashlib
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.cell.cell import MergedCell
+from openpyxl.styles import Alignment
+from openpyxl.utils import get_column_letter, column_index_from_string
+
+import report_layout
+from report_layout import load_layout, LAYOUT_PATH
+
+LAYOUT = load_layout()
+TEMPLATE_FILE = "header_template.json"
+HEADER_ROWS = 8
+PLACEHOLDER = re.compile(r"^\{(\w+)\}$")
+
+def log(msg):
+    """Log to stderr"""
+    print(f"[header-template] {msg}", file=sys.stderr, flush=True)
+
+def layout_digest():
+    """Digest of the code and the column layout that build the header"""
+    h = hashlib.sha1()
+    for path in (os.path.abspath(__file__), report_layout.__file__, LAYOUT_PATH):
+        with open(path, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+def write_header(ws, first_row, bulan, tahun, prev_month, prev_year, bulan_only):
+    """Write header rows 1-8 (labels, period titles and merged ranges)"""
+    center = Alignment(horizontal="center", vertical="center")
+
+    # HEADER (tetap sama)
+    ws["F1"], ws["F2"], ws["F3"], ws["F4"], ws["F5"], ws["F7"] = "Nama Area", "Plant", "Kode Dist", "Profit Center", "Periode", "Material"
+    
+    if first_row is not None:
+        ws["G1"], ws["G2"], ws["G3"], ws["G4"], ws["G5"] = first_row['area'], first_row['plant'], first_row['kode_dist'], first_row['profit_center'], bulan_only
+    
+    ws["G7"] = "Material Description"
+    ws["A8"], ws["B8"], ws["C8"], ws["D8"], ws["E8"], ws["F8"] = "Nama Area", "Plant", "Kode Dist", "Profit Center", "Periode", "source data"
+    
+    # Row 8 labels
+    ws["R8"], ws["S8"], ws["T8"], ws["U8"], ws["V8"], ws["W8"], ws["X8"], ws["Y8"] = "DTB", "BPPR", "LBP", "LBP", "DTB", "BPPR", "ALIH STATUS", "Pemusnahan"
+    ws["AB8"], ws["AC8"], ws["AD8"], ws["AE8"], ws["AF8"], ws["AG8"], ws["AH8"], ws["AI8"] = "DTB", "BPPR", "LBP", "LBP", "DTB", "BPPR", "ALIH STATUS", "Pemusnahan"
+    ws["AL8"], ws["AM8"], ws["AN8"], ws["AO8"], ws["AP8"], ws["AQ8"], ws["AR8"], ws["AS8"] = "DTB", "BPPR", "LBP", "LBP", "DTB", "BPPR", "ALIH STATUS", "Pemusnahan"
+    ws["AV8"], ws["AW8"], ws["AX8"], ws["AY8"], ws["AZ8"], ws["BA8"], ws["BB8"], ws["BC8"] = "DTB", "BPPR", "LBP", "LBP", "DTB", "BPPR", "ALIH STATUS", "Pemusnahan"
+    ws["BF8"], ws["BG8"] = "641", "642"
+
+    ws.merge_cells("H4:M4")
+    ws["H4"] = f"SALDO AWAL {bulan} {tahun}"
+    ws["H4"].alignment = center
+    
+    ws.merge_cells("H5:J5")
+    ws["H5"] = f"SALDO AWAL {prev_month} {prev_year}"
+    ws["H5"].alignment = center
+    
+    ws.merge_cells("K5:M5")
+    ws["K5"] = "SAP - MB5B"
+    ws["K5"].alignment = center
+    ws["N5"] = "DIFF"
+    ws["N5"].alignment = center
+
+    headers_6 = ["GS", "BS", "Grand Total", "GS", "BS", "Grand Total", "GS", "BS", "Grand Total"]
+    for i, label in enumerate(headers_6, start=8):
+        ws.cell(row=6, column=i, value=label).alignment = center
+
+    for col in range(8, 17):
+        ws.cell(row=7, column=col, value="S.Aw").alignment = center
+
+    ws["R1"] = "ctrl balance MB51"
+    ws.merge_cells("R5:BH5")
+    ws["R5"] = "SAP - MB51"
+    ws["R5"].alignment = center
+
+    ws.merge_cells("R6:Z6")
+    ws["R6"] = "GS00"
+    ws["R6"].alignment = center
+
+    gs00_movements = [
+        ("R", "Terima Barang"), ("S", "Retur Beli"), ("T", "Penjualan"),
+        ("U", "Retur Jual"), ("V", "Intra Gudang Masuk"), ("W", "Intra Gudang"),
+        ("X", "Transfer Stock"), ("Y", "Pemusnahan"), ("Z", "Adjustment")
+    ]
+    for col, label7 in gs00_movements:
+        ws[f"{col}7"] = label7
+        ws[f"{col}7"].alignment = center
+
+    ws.merge_cells("AB6:AJ6")
+    ws["AB6"] = "BS00"
+    ws["AB6"].alignment = center
+    bs00_movements = [
+        ("AB", "Terima Barang"), ("AC", "Retur Beli"), ("AD", "Penjualan"),
+        ("AE", "Retur Jual"), ("AF", "Intra Gudang Masuk"), ("AG", "Intra Gudang"),
+        ("AH", "Transfer Stock"), ("AI", "Pemusnahan"), ("AJ", "Adjustment")
+    ]
+    for col, label7 in bs00_movements:
+        ws[f"{col}7"] = label7
+        ws[f"{col}7"].alignment = center
+
+    ws.merge_cells("AL6:AT6")
+    ws["AL6"] = "AI00"
+    ws["AL6"].alignment = center
+    ai00_movements = [
+        ("AL", "Terima Barang"), ("AM", "Retur Beli"), ("AN", "Penjualan"),
+        ("AO", "Retur Jual"), ("AP", "Intra Gudang Masuk"), ("AQ", "Intra Gudang"),
+        ("AR", "Transfer Stock"), ("AS", "Pemusnahan"), ("AT", "Adjustment")
+    ]
+    for col, label7 in ai00_movements:
+        ws[f"{col}7"] = label7
+        ws[f"{col}7"].alignment = center
+
+    ws.merge_cells("AV6:BD6")
+    ws["AV6"] = "TR00"
+    ws["AV6"].alignment = center
+    tr00_movements = [
+        ("AV", "Terima Barang"), ("AW", "Retur Beli"), ("AX", "Penjualan"),
+        ("AY", "Retur Jual"), ("AZ", "Intra Gudang Masuk"), ("BA", "Intra Gudang"),
+        ("BB", "Transfer Stock"), ("BC", "Pemusnahan"), ("BD", "Adjustment")
+    ]
+    for col, label7 in tr00_movements:
+        ws[f"{col}7"] = label7
+        ws[f"{col}7"].alignment = center
+
+    ws.merge_cells("BF6:BH6")
+    ws["BF6"] = "641 dan 642 tanpa sloc"
+    ws["BF6"].alignment = center
+    ws["BF7"], ws["BG7"], ws["BH7"] = "Intra Gudang", "Intra Gudang", "CEK"
+    ws["BI3"], ws["BI4"] = "-->stock in transit", "jika selisih cek ke MB5T"
+
+    # END STOCK
+    ws.merge_cells("BK4:BP4")
+    ws["BK4"] = f"END STOCK {prev_month} {prev_year}"
+    ws["BK4"].alignment = center
+    ws.merge_cells("BK5:BM5")
+    ws["BK5"] = "SALDO AKHIR"
+    ws["BK5"].alignment = center
+    ws.merge_cells("BN5:BP5")
+    ws["BN5"] = "SAP - MB5B"
+    ws["BN5"].alignment = center
+    ws["BQ5"] = "DIFF"
+    ws["BQ5"].alignment = center
+
+    ws["BK6"], ws["BL6"], ws["BM6"] = "GS00", "BS00", "Grand Total"
+    ws["BN6"], ws["BO6"], ws["BP6"] = "GS", "BS", "Grand Total"
+    ws["BQ6"], ws["BR6"], ws["BS6"] = "GS", "BS", "Grand Total"
+
+    for col in range(63, 72):
+        ws.cell(row=6, column=col).alignment = center
+        ws.cell(row=7, column=col, value="S.Ak").alignment = center
+
+    ws["BT7"] = "CEK SELISIH VS BULAN LALU"
+    ws["BU7"] = "kalo ada selisih atas inputan LOG1, LOG2 -> konfirmasi pa Reza utk diselesaikan"
+
+    ws.merge_cells("BV5:BX5")
+    ws["BV5"] = "STOCK - EDS"
+    ws["BV5"].alignment = center
+    ws["BY5"] = "DIFF"
+    ws["BY5"].alignment = center
+
+    ws["BV6"], ws["BW6"], ws["BX6"] = "GS", "BS", "Grand Total"
+    ws["BY6"], ws["BZ6"], ws["CA6"] = "GS", "BS", "Grand Total"
+
+    for col in range(74, 80):
+        ws.cell(row=6, column=col).alignment = center
+        ws.cell(row=7, column=col, value="S.Ak").alignment = center
+
+    # TAMBAHAN: BASO HEADERS (kolom CC, CD, CE)
+    ws.merge_cells("CC5:CE5")
+    ws["CC5"] = "STOCK - BASO"
+    ws["CC5"].alignment = center
+
+    ws["CC6"], ws["CD6"], ws["CE6"] = "GS", "BS", "Grand Total"
+    for col in range(column_index_from_string("CC"), column_index_from_string("CE") + 1):
+        ws.cell(row=6, column=col).alignment = center
+        ws.cell(row=7, column=col, value="S.Ak").alignment = center
+
+def set_column_layout(ws):
+    """Column widths and frozen panes"""
+    widths = dict(LAYOUT.widths)
+    default = widths.pop("default", None)
+    if default:
+        for i in range(1, LAYOUT.last_column + 1):
+            ws.column_dimensions[get_column_letter(i)].width = default
+    for letter, width in widths.items():
+        ws.column_dimensions[letter].width = width
+
+    ws.freeze_panes = LAYOUT.freeze_panes
+
+HEADER_FIELDS = ["area", "plant", "kode_dist", "profit_center", "bulan_only",
+                 "bulan", "tahun", "prev_month", "prev_year"]
+
+def build_header_worksheet():
+    """Header rows 1-8 on a scratch worksheet, with {field} placeholders for the per-report values"""
+    ws = Workbook().active
+    fields = {name: f"{{{name}}}" for name in HEADER_FIELDS}
+    write_header(ws, fields, fields["bulan"], fields["tahun"], fields["prev_month"], fields["prev_year"],
+                 fields["bulan_only"])
+    for row in [2, 3]:
+        for col in range(LAYOUT.summary_format_from, LAYOUT.last_column + 1):
+            ws.cell(row=row, column=col).number_format = LAYOUT.number_format
+    set_column_layout(ws)
+    return ws
+
+class HeaderTemplate:
+    """Rows 1-8 as {coordinate: value} plus per-cell styles, merged ranges, widths and frozen panes"""
+
+    def __init__(self, cells, styles, merges, widths, freeze_panes=None, digest=None):
+        self.cells = cells          # {"H4": "SALDO AWAL {bulan} {tahun}", ...}
+        self.styles = styles        # {"H4": {"alignment": {...}, "number_format": "#,##0"}, ...}
+        self.merges = merges
+        self.widths = widths
+        self.freeze_panes = freeze_panes
+        self.digest = digest
+        self._alignments = {}
+
+    @classmethod
+    def from_worksheet(cls, ws, digest=None):
+        """Capture the header rows of a worksheet built with {field} placeholders"""
+        cells, styles = {}, {}
+        for row in ws.iter_rows(min_row=1, max_row=HEADER_ROWS):
+            for cell in row:
+                if isinstance(cell, MergedCell):
+                    continue
+                if cell.value is not None:
+                    cells[cell.coordinate] = cell.value
+                if cell.has_style:
+                    style = {"number_format": cell.number_format}
+                    alignment = {k: v for k, v in (("horizontal", cell.alignment.horizontal),
+                                                   ("vertical", cell.alignment.vertical)) if v}
+                    if alignment:
+                        style["alignment"] = alignment
+                    styles[cell.coordinate] = style
+        merges = [str(r) for r in ws.merged_cells.ranges if r.min_row <= HEADER_ROWS]
+        widths = {letter: dim.width for letter, dim in ws.column_dimensions.items() if dim.width}
+        return cls(cells, styles, merges, widths, ws.freeze_panes, digest)
+
+    def to_dict(self):
+        return {"digest": self.digest, "cells": self.cells, "styles": self.styles, "merges": self.merges,
+                "widths": self.widths, "freeze_panes": self.freeze_panes}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["cells"], data["styles"], data["merges"], data["widths"],
+                   data.get("freeze_panes"), data.get("digest"))
+
+    def values(self, fields, overrides=None):
+        """Header values with placeholders filled in
+
+        A cell that is only "{field}" gets the raw field value (left out when missing), so numbers
+        stay numbers; other placeholders are formatted into the text.
+        """
+        values = {}
+        for coordinate, value in self.cells.items():
+            if isinstance(value, str) and "{" in value:
+                whole = PLACEHOLDER.match(value)
+                if whole:
+                    value = fields.get(whole.group(1))
+                    if value is None:
+                        continue
+                else:
+                    value = value.format_map(fields)
+            values[coordinate] = value
+        if overrides:
+            values.update(overrides)
+        return values
+
+    def _alignment(self, style):
+        key = tuple(sorted(style["alignment"].items()))
+        if key not in self._alignments:
+            self._alignments[key] = Alignment(**style["alignment"])
+        return self._alignments[key]
+
+    def _apply_style(self, cell, style):
+        if "alignment" in style:
+            cell.alignment = self._alignment(style)
+        if style.get("number_format") and style["number_format"] != "General":
+            cell.number_format = style["number_format"]
+
+    def stamp(self, ws, values):
+        """Write the header into a regular worksheet: values, styles, merges, widths, panes"""
+        for coordinate, value in values.items():
+            ws[coordinate].value = value
+        for coordinate, style in self.styles.items():
+            self._apply_style(ws[coordinate], style)
+        for merged_range in self.merges:
+            ws.merge_cells(merged_range)
+        self.apply_layout(ws)
+
+    def apply_layout(self, ws):
+        """Column widths and frozen panes (also valid on a write-only worksheet)"""
+        for letter, width in self.widths.items():
+            ws.column_dimensions[letter].width = width
+        if self.freeze_panes:
+            ws.freeze_panes = self.freeze_panes
+
+    def write_only_rows(self, ws, values, max_col):
+        """Header rows as lists of WriteOnlyCells for ws.append; merges go straight into ws"""
+        for merged_range in self.merges:
+            ws.merged_cells.add(merged_range)
+        rows = []
+        for row_idx in range(1, HEADER_ROWS + 1):
+            row = []
+            for col_idx in range(1, max_col + 1):
+                coordinate = f"{get_column_letter(col_idx)}{row_idx}"
+                value, style = values.get(coordinate), self.styles.get(coordinate)
+                if value is None and style is None:
+                    row.append(None)
+                    continue
+                cell = WriteOnlyCell(ws, value=value)
+                if style is not None:
+                    self._apply_style(cell, style)
+                row.append(cell)
+            rows.append(row)
+        return rows
+
+def template_path(options=None):
+    options = options or {}
+    cache_dir = options.get("report_cache_dir") or os.environ.get(
+        "INVENTORY_REPORT_CACHE_DIR", os.path.join("assets", "cache"))
+    return os.path.join(cache_dir, TEMPLATE_FILE)
+
+_loaded = {}
+
+def get_header_template(options=None):
+    """The header template - from memory, the disk cache, or built by build_header_worksheet"""
+    path = template_path(options)
+    digest = layout_digest()
+    template = _loaded.get(path)
+    if template is not None and template.digest == digest:
+        return template
+
+    try:
+        with open(path, encoding="utf-8") as f:
+            template = HeaderTemplate.from_dict(json.load(f))
+    except (OSError, ValueError, KeyError):
+        template = None
+
+    if template is None or template.digest != digest:
+        template = HeaderTemplate.from_worksheet(build_header_worksheet(), digest)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(template.to_dict(), f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, path)
+            log(f"Header template built and cached in {path}")
+        except OSError as e:
+            log(f"Could not cache header template: {str(e)}")
+
+    _loaded[path] = template
+    return template
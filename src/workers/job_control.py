@@ -0,0 +1,111 @@
+# job_control.py - Cooperative cancellation and deadlines of worker jobs
+# A CancelToken is checked at stage and chunk boundaries; once the job is cancelled or past its
+# deadline, check() raises JobCancelled, the worker removes its partial output and prints a
+# structured result instead of running to completion:
+#   {"success": false, "cancelled": true, "reason": "cancelled" | "deadline", "stage": ..., "error": ...}
+#
+# Cancel: SIGTERM / SIGINT (what the controller sends when the user cancels or the request
+# times out). The first signal is cooperative; a second one raises JobCancelled right away.
+# Deadline: "deadline" (unix seconds or ISO 8601 time) and/or "timeout_s" (seconds from the
+# start) - generate_inventory_report: payload options, merge_inventory_reports: payload.
+# report_daemon: every job gets its own token (no signal handlers, the daemon keeps serving);
+# a {"type": "cancel", "id": ...} line cancels it and the deadline comes from the job payload.
+# Batch runs share one token: a cancel stops the running plants and the remaining ones are
+# reported as cancelled without being started (parallel children get the signal forwarded).
+
+import sys
+import os
+import time
+import signal
+import datetime
+
+def log(msg):
+    """Log to stderr"""
+    print(f"[job-control] {msg}", file=sys.stderr, flush=True)
+
+class JobCancelled(Exception):
+    """The job was cancelled or ran past its deadline"""
+
+    def __init__(self, reason, stage=None):
+        self.reason = reason
+        self.stage = stage
+        what = "Cancelled" if reason == "cancelled" else "Deadline exceeded"
+        super().__init__(f"{what} during {stage}" if stage else what)
+
+    def result(self):
+        """The worker's JSON result for this cancellation"""
+        return {"success": False, "cancelled": True, "reason": self.reason, "stage": self.stage,
+                "error": str(self)}
+
+class CancelToken:
+    """Cancel flag (set by a signal handler or cancel()) plus an optional deadline"""
+
+    def __init__(self, deadline=None):
+        self.deadline = deadline
+        self.reason = None
+
+    def cancel(self, reason="cancelled"):
+        if self.reason is None:
+            self.reason = reason
+
+    def cancelled(self):
+        """The reason the job must stop, or None"""
+        if self.reason is None and self.deadline is not None and time.time() >= self.deadline:
+            self.reason = "deadline"
+        return self.reason
+
+    def check(self, stage=None):
+        """Raise JobCancelled when the job must stop"""
+        reason = self.cancelled()
+        if reason is not None:
+            raise JobCancelled(reason, stage)
+
+    def remaining(self):
+        return max(self.deadline - time.time(), 0.0) if self.deadline is not None else None
+
+def parse_deadline(options, started=None):
+    """Deadline as unix seconds from "deadline" / "timeout_s" (the earlier of the two), or None"""
+    options = options or {}
+    started = started if started is not None else time.time()
+    deadlines = []
+    deadline = options.get("deadline")
+    if deadline not in (None, ""):
+        if isinstance(deadline, (int, float)):
+            deadlines.append(float(deadline))
+        else:
+            parsed = datetime.datetime.fromisoformat(str(deadline).replace("Z", "+00:00"))
+            deadlines.append(parsed.timestamp())
+    timeout_s = options.get("timeout_s")
+    if timeout_s not in (None, ""):
+        deadlines.append(started + float(timeout_s))
+    return min(deadlines) if deadlines else None
+
+def install_signal_handlers(token, signals=(signal.SIGTERM, signal.SIGINT)):
+    """Route cancel signals to the token (main thread only)"""
+    def handler(signum, frame):
+        if token.reason == "cancelled":
+            raise JobCancelled("cancelled", "signal")
+        log(f"Received {signal.Signals(signum).name} - cancelling at the next checkpoint")
+        token.cancel("cancelled")
+
+    for signum in signals:
+        signal.signal(signum, handler)
+
+def get_cancel_token(options=None, install_signals=True):
+    """Token for a worker run: deadline from options, cancel signals routed to it"""
+    token = CancelToken(parse_deadline(options))
+    if token.deadline is not None:
+        log(f"Deadline in {token.remaining():.0f}s")
+    if install_signals:
+        install_signal_handlers(token)
+    return token
+
+def remove_partial(*paths):
+    """Delete partial outputs of a cancelled job"""
+    for path in paths:
+        if path and os.path.exists(path):
+            try:
+                os.remove(path)
+                log(f"Removed partial output {path}")
+            except OSError as e:
+                log(f"Could not remove {path}: {str(e)}")
@@ -0,0 +1,178 @@
+# memory_usage.py - Opt-in memory instrumentation of a worker job
+# Records RSS at every stage boundary (hooked into StageTimings.lap), the peak RSS of the
+# job and the in-memory size of the big DataFrames, and logs each boundary so the last
+# line before an OOM kill shows which stage was running.
+#
+# peak_rss_mb is the peak of this job only: the kernel's peak (VmHWM) is reset when the tracker
+# starts (/proc/self/clear_refs), else it is the highest RSS sampled at the stage boundaries.
+# In the daemon and in sequential batches a process runs many jobs, so the lifetime peak of the
+# process (ru_maxrss) is reported separately as process_peak_rss_mb.
+#
+# Options:
+#   memory_profile : true enables it (payload options / merge payload, env INVENTORY_MEMORY_PROFILE=1)
+#   env INVENTORY_TRACEMALLOC : also trace Python allocations and write the top sites to a
+#                               file - a path, or 1 for assets/cache/tracemalloc/<worker>_<time>.txt
+#                               (tracing slows the job down noticeably)
+
+import sys
+import os
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+TRACEMALLOC_TOP = 25
+MB = 1024 * 1024
+
+# ru_maxrss follows VmHWM, so the peak from before the last reset is kept here
+_peak_before_reset = 0
+
+def log(msg):
+    """Log to stderr"""
+    print(f"[memory] {msg}", file=sys.stderr, flush=True)
+
+def current_rss():
+    """Resident set size in bytes, or None where /proc is not available"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError, IndexError):
+        return None
+
+def peak_rss():
+    """Peak resident set size of the process over its lifetime in bytes, or None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max(peak if sys.platform == "darwin" else peak * 1024, _peak_before_reset)
+
+def reset_peak_rss():
+    """Reset the peak RSS of the process (VmHWM) to its current RSS; False where not supported"""
+    global _peak_before_reset
+    _peak_before_reset = max(_peak_before_reset, peak_rss() or 0)
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def hwm_rss():
+    """Peak RSS since the last reset_peak_rss (VmHWM) in bytes, or None"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+def available_memory():
+    """Memory the system can still hand out (MemAvailable) in bytes, or None where /proc is not available"""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+def frame_bytes(data):
+    """Deep in-memory size of a DataFrame/Series, or of the frames in a dict"""
+    if isinstance(data, dict):
+        return sum(frame_bytes(v) for v in data.values())
+    try:
+        size = data.memory_usage(deep=True)
+    except (AttributeError, TypeError):
+        return 0
+    return int(size.sum()) if hasattr(size, "sum") else int(size)
+
+def to_mb(value):
+    return round(value / MB, 1) if value is not None else None
+
+class MemoryTracker:
+    """Stage -> RSS, DataFrame sizes and an optional tracemalloc dump"""
+
+    def __init__(self, worker, trace_path=None):
+        self.worker = worker
+        self.stages = {}
+        self.frames = {}
+        self.trace_path = trace_path
+        self.peak_reset = reset_peak_rss()
+        self.sampled_peak = current_rss()
+        if trace_path:
+            tracemalloc.start()
+
+    def job_peak(self):
+        """Peak RSS of this job so far in bytes, or None"""
+        peaks = [self.sampled_peak, hwm_rss() if self.peak_reset else None]
+        return max([p for p in peaks if p is not None], default=None)
+
+    def stage(self, name):
+        """Record RSS at the end of stage name (a repeated stage keeps its highest RSS)"""
+        rss = current_rss()
+        if rss is not None:
+            self.sampled_peak = max(self.sampled_peak or 0, rss)
+        peak = self.job_peak()
+        record = self.stages.setdefault(name, {"rss_mb": None, "peak_rss_mb": None})
+        if rss is not None:
+            record["rss_mb"] = max(record["rss_mb"] or 0, to_mb(rss))
+        record["peak_rss_mb"] = to_mb(peak)
+        log(f"after {name}: rss {to_mb(rss)} MB, peak {to_mb(peak)} MB")
+
+    def frame(self, name, data):
+        """Record the size of a DataFrame (or dict of frames); the largest one seen per name is kept"""
+        size = to_mb(frame_bytes(data))
+        self.frames[name] = max(self.frames.get(name, 0), size)
+
+    def dump_tracemalloc(self):
+        """Write the top allocation sites to trace_path; returns the path or None"""
+        if not self.trace_path or not tracemalloc.is_tracing():
+            return None
+        try:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            os.makedirs(os.path.dirname(self.trace_path) or ".", exist_ok=True)
+            with open(self.trace_path, "w", encoding="utf-8") as f:
+                f.write(f"{self.worker} - traced current {to_mb(current)} MB, peak {to_mb(peak)} MB\n")
+                for stat in snapshot.statistics("lineno")[:TRACEMALLOC_TOP]:
+                    f.write(f"{stat}\n")
+            log(f"tracemalloc top {TRACEMALLOC_TOP} written to {self.trace_path}")
+            return self.trace_path
+        except Exception as e:
+            log(f"Could not write tracemalloc snapshot: {str(e)}")
+            return None
+
+    def as_dict(self):
+        """{"stages", "peak_rss_mb", "process_peak_rss_mb", "frames_mb", "tracemalloc_file"} for the result JSON"""
+        return {
+            "stages": self.stages,
+            "peak_rss_mb": to_mb(self.job_peak()),
+            "process_peak_rss_mb": to_mb(peak_rss()),
+            "frames_mb": self.frames,
+            "tracemalloc_file": self.dump_tracemalloc(),
+        }
+
+def get_memory_tracker(worker, options=None):
+    """MemoryTracker when memory_profile / INVENTORY_MEMORY_PROFILE / INVENTORY_TRACEMALLOC is set, else None"""
+    options = options or {}
+    trace = os.environ.get("INVENTORY_TRACEMALLOC", "")
+    trace_path = None
+    if trace.lower() in ("1", "true", "yes"):
+        trace_path = os.path.join("assets", "cache", "tracemalloc",
+                                  f"{worker}_{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}.txt")
+    elif trace and trace.lower() not in ("0", "false", "no"):
+        trace_path = trace
+
+    enabled = options.get("memory_profile")
+    if enabled is None:
+        enabled = os.environ.get("INVENTORY_MEMORY_PROFILE", "").lower() in ("1", "true", "yes")
+    if not enabled and not trace_path:
+        return None
+    return MemoryTracker(worker, trace_path)
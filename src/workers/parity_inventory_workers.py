@@ -0,0 +1,372 @@
+# parity_inventory_workers.py - Golden-output parity of the workers against their _works versions
+# Runs generate_inventory_report_works.py / generate_inventory_report.py on the same synthetic
+# plants (see synthetic_inventory_data.py), then merge_inventory_reports_works.py /
+# merge_inventory_reports.py over each side's outputs, and diffs the workbooks cell by cell:
+# values and formula text, control totals (S1, BP2, BL2, BB2 / AX2) and the row-3 sums of
+# every literal column. Also reports the speed / peak memory ratio (current vs _works).
+#
+# The _works generator predates BASO support, so the BASO columns (CC:CE) are ignored by
+# default; --ignore-columns "" compares everything. Exit code 1 when a diff is found.
+#
+# The streaming sheet readers are also checked against read_excel on small fixtures with blank
+# rows (missing rows come back from openpyxl as [] instead of a tuple) - see check_readers.
+#
+# The merge differs from _works by design (see merge_expected): the _works merged workbook is
+# compared with those changes applied, so only drift in the merged values is reported.
+#
+# python parity_inventory_workers.py --scale smoke [--plants N] [--options '{"output_mode": "streaming"}']
+
+import sys
+import os
+import json
+import time
+import argparse
+import pandas as pd
+from openpyxl import Workbook, load_workbook
+from openpyxl.utils import get_column_letter, column_index_from_string
+
+from synthetic_inventory_data import make_dataset
+from report_layout import load_layout
+from bench_inventory_pipeline import SCALES, COLD_OPTIONS, run_worker
+import generate_inventory_report
+
+REPORT_SHEET = "Output Report INV ARUS BARANG"
+FIRST_DATA_ROW = 9
+CONTROL_CELLS = ["S1", "BP2", "BL2", "BB2", "AX2"]
+DEFAULT_IGNORED_COLUMNS = "CC,CD,CE"
+MAX_SAMPLES = 50
+LAYOUT = load_layout()
+
+def log(msg):
+    """Log to stderr"""
+    print(f"[parity] {msg}", file=sys.stderr, flush=True)
+
+def same_value(a, b):
+    if a == "":
+        a = None
+    if b == "":
+        b = None
+    if isinstance(a, bool) or isinstance(b, bool):
+        return a == b
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+        return abs(a - b) <= 1e-6 * max(1.0, abs(a), abs(b))
+    return a == b
+
+def read_report(path):
+    """Cell values (formulas as text) of the report sheet as a list of row tuples"""
+    wb = load_workbook(path, read_only=True, data_only=False)
+    try:
+        ws = wb[REPORT_SHEET] if REPORT_SHEET in wb.sheetnames else wb.worksheets[0]
+        return [tuple(row) for row in ws.iter_rows(values_only=True)]
+    finally:
+        wb.close()
+
+def cell_at(rows, row, col):
+    if row > len(rows) or col > len(rows[row - 1]):
+        return None
+    return rows[row - 1][col - 1]
+
+def column_sums(rows):
+    """Column -> sum of the numeric literals in the data rows (formula cells are skipped)"""
+    sums = {}
+    for row in rows[FIRST_DATA_ROW - 1:]:
+        for col, value in enumerate(row, start=1):
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                sums[col] = sums.get(col, 0.0) + value
+    return sums
+
+def read_cell(path, coordinate):
+    wb = load_workbook(path, read_only=True, data_only=False)
+    try:
+        ws = wb[REPORT_SHEET] if REPORT_SHEET in wb.sheetnames else wb.worksheets[0]
+        return ws[coordinate].value
+    finally:
+        wb.close()
+
+def merge_expected(rows, plant_paths):
+    """Merged rows of _works with the intended changes of merge_inventory_reports applied
+
+    Formula columns get the layout formula of their row where _works left them empty (it also
+    cut CA:CE off), row 3 gets the layout SUMs over every merged row, BB2 replaces the stale AX2
+    and the per-report controls (S1, BP2) are the sums over the plant outputs, BL2 is gone.
+    Literal values are kept as they are, so drift in them still shows up.
+    """
+    rows = [list(row) + [None] * (LAYOUT.last_column - len(row)) for row in rows]
+    for row in range(LAYOUT.first_data_row, len(rows) + 1):
+        values = rows[row - 1]
+        for letter, formula in LAYOUT.formula_row(row).items():
+            col = LAYOUT.index[letter]
+            if values[col - 1] is None:
+                values[col - 1] = formula
+
+    if len(rows) >= 3:
+        rows[2] = [value if not (isinstance(value, str) and value.startswith("=SUM(")) else None
+                   for value in rows[2]]
+    expected_cells = dict(LAYOUT.sum_formulas(len(rows)), **LAYOUT.control_formulas)
+    for coordinate in LAYOUT.controls:
+        values = [read_cell(path, coordinate) for path in plant_paths]
+        expected_cells[coordinate] = sum(v for v in values if isinstance(v, (int, float)))
+    expected_cells.update({"AX2": None, "BL2": None})
+    for coordinate, value in expected_cells.items():
+        col = column_index_from_string("".join(ch for ch in coordinate if ch.isalpha()))
+        row = int("".join(ch for ch in coordinate if ch.isdigit()))
+        if row <= len(rows):
+            rows[row - 1][col - 1] = value
+    return [tuple(row) for row in rows]
+
+def compare_reports(expected_path, actual_path, ignore_columns=(), adjust=None):
+    """Cell-by-cell diff of two report workbooks; adjust(rows) turns the expected rows into the intended ones"""
+    expected, actual = read_report(expected_path), read_report(actual_path)
+    if adjust is not None:
+        expected = adjust(expected)
+    ignored = {column_index_from_string(c) for c in ignore_columns}
+    max_row = max(len(expected), len(actual))
+    max_col = max([len(r) for r in expected + actual] or [0])
+
+    diffs = 0
+    by_column = {}
+    samples = []
+    compared = 0
+    for row in range(1, max_row + 1):
+        for col in range(1, max_col + 1):
+            if col in ignored:
+                continue
+            a, b = cell_at(expected, row, col), cell_at(actual, row, col)
+            compared += 1
+            if same_value(a, b):
+                continue
+            diffs += 1
+            letter = get_column_letter(col)
+            by_column[letter] = by_column.get(letter, 0) + 1
+            if len(samples) < MAX_SAMPLES:
+                samples.append({"cell": f"{letter}{row}", "expected": a, "actual": b})
+
+    control = {}
+    for coordinate in CONTROL_CELLS:
+        col = column_index_from_string("".join(ch for ch in coordinate if ch.isalpha()))
+        row = int("".join(ch for ch in coordinate if ch.isdigit()))
+        a, b = cell_at(expected, row, col), cell_at(actual, row, col)
+        if a is None and b is None:
+            continue
+        control[coordinate] = {"expected": a, "actual": b, "match": same_value(a, b)}
+
+    expected_sums, actual_sums = column_sums(expected), column_sums(actual)
+    row3 = {}
+    for col in sorted(set(expected_sums) | set(actual_sums)):
+        if col in ignored:
+            continue
+        a, b = expected_sums.get(col, 0.0), actual_sums.get(col, 0.0)
+        if not same_value(a, b):
+            row3[get_column_letter(col)] = {"expected": a, "actual": b}
+
+    return {
+        "expected": expected_path,
+        "actual": actual_path,
+        "rows": [len(expected), len(actual)],
+        "cells_compared": compared,
+        "diffs": diffs,
+        "by_column": by_column,
+        "samples": samples,
+        "control_totals": control,
+        "column_sum_diffs": row3,
+        "identical": diffs == 0 and not row3 and all(c["match"] for c in control.values()),
+    }
+
+def write_mb51_fixture(path):
+    """MB51 extract with blank rows between the data rows"""
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["Material Document", "Posting Date", "Material", "Material description", "Plant",
+               "Storage Location", "Movement type", "Movement Type Text", "Quantity"])
+    ws.append([4900000001, "2025-01-02", 100000000, "PRODUK A", "P001", "GS00", 101, "GR goods receipt", 10])
+    ws.append([])
+    ws.append([4900000002, "2025-01-03", 100000007, "PRODUK B", "P001", None, "641", "TF to stck in trans.", -4])
+    ws.append([4900000003, "2025-01-04", 100000000, "PRODUK A", "P001", "BS00", "601", "GD goods issue:delvy", 2.5])
+    ws.append([])
+    ws.append([])
+    ws.append([4900000004, "2025-01-05", 100000014, None, "P001", "GS00", "101", "GR goods receipt", 1])
+    wb.save(path)
+
+def mb51_reference(path):
+    """MB51 columns of the report as read_excel(dtype=str) gives them, quantity numeric"""
+    df = pd.read_excel(path, dtype=str)
+    labels = generate_inventory_report.header_labels(list(df.columns))
+    positions = generate_inventory_report.resolve_mb51_columns(labels)
+    frame = pd.DataFrame({field: df.iloc[:, pos] for field, pos in positions.items()})
+    frame["amount"] = pd.to_numeric(frame["amount"], errors="coerce")
+    return frame
+
+def frame_rows(frame):
+    return [[None if pd.isna(v) else v for v in row] for row in frame.itertuples(index=False)]
+
+def write_baso_fixture(path):
+    """BASO workbook with a blank row above the header and one between the data rows"""
+    wb = Workbook()
+    for i, name in enumerate(["GT GS", "GT BS"]):
+        ws = wb.active if i == 0 else wb.create_sheet()
+        ws.title = name
+        ws.append([f"BERITA ACARA STOCK OPNAME - {name}"])
+        ws.append([])
+        ws.append(["NO", "PLANT", "KODE BARANG", "NAMA BARANG", "FISIK (PCS)"])
+        ws.append([1, "P001", "M1", "PRODUK M1", 5 + i])
+        ws.append([])
+        ws.append([2, "p001 ", "M2", "PRODUK M2", 7])
+        ws.append([3, "P001", "M1", "PRODUK M1", 2])
+    wb.save(path)
+
+def baso_reference(path):
+    """(material, plant) -> FISIK per GS / BS the way the read_excel BASO reader summed them"""
+    totals = {"baso_gs": {}, "baso_bs": {}}
+    for sheet in pd.ExcelFile(path).sheet_names:
+        df = pd.read_excel(path, sheet_name=sheet, dtype=str)
+        header = next(i for i in range(min(10, len(df)))
+                      if "kode barang" in " ".join(df.iloc[i].astype(str).str.lower()))
+        df.columns = df.iloc[header]
+        df = df.iloc[header + 1:].dropna(subset=["PLANT", "KODE BARANG"])
+        target = totals["baso_gs" if sheet.lower().endswith("gs") else "baso_bs"]
+        for plant, material, fisik in zip(df["PLANT"], df["KODE BARANG"], df["FISIK (PCS)"]):
+            key = (material.strip(), plant.strip().upper())
+            target[key] = target.get(key, 0.0) + float(fisik)
+    return totals
+
+def check_readers(work_dir):
+    """The streaming sheet readers of the generator against read_excel on blank-row fixtures"""
+    os.makedirs(work_dir, exist_ok=True)
+    checks = {}
+
+    mb51_path = os.path.join(work_dir, "mb51_blank_rows.xlsx")
+    write_mb51_fixture(mb51_path)
+    expected = frame_rows(mb51_reference(mb51_path))
+    # whole sheet, and in chunks of 2 rows like the streaming path of large extracts
+    for name, chunk_rows in (("mb51", None), ("mb51_chunked", 2)):
+        try:
+            chunks = list(generate_inventory_report.iter_mb51_chunks(mb51_path, chunk_rows=chunk_rows))
+            actual = frame_rows(pd.concat(chunks, ignore_index=True))
+            checks[name] = {"rows": [len(expected), len(actual)], "match": actual == expected}
+        except Exception as e:
+            checks[name] = {"error": str(e), "match": False}
+
+    baso_path = os.path.join(work_dir, "baso_blank_rows.xlsx")
+    write_baso_fixture(baso_path)
+    try:
+        cache = generate_inventory_report.SheetCache({}, baso_path)
+    except Exception as e:
+        checks["baso"] = {"error": str(e), "match": False}
+    else:
+        for cache_key, expected in baso_reference(baso_path).items():
+            keys, values = cache.caches.get(cache_key, ([], []))
+            actual = {cache.codes.decode(key): float(value) for key, value in zip(keys, values)}
+            checks[cache_key] = {"expected": {str(k): v for k, v in expected.items()},
+                                 "actual": {str(k): v for k, v in actual.items()},
+                                 "match": actual == expected}
+
+    return {"checks": checks, "identical": all(c["match"] for c in checks.values())}
+
+def generate_side(script, dataset, options, work_dir):
+    """Run one generator per plant; returns ([output paths], wall seconds, peak RSS MB)"""
+    os.makedirs(work_dir, exist_ok=True)
+    outputs, wall_total, peak = [], 0.0, None
+    for job in dataset["plants"]:
+        payload = {"files": job["files"], "report_date": dataset["report_date"],
+                   "master_inventory": dataset["master_inventory"],
+                   "master_movement": dataset["master_movement"]}
+        if options is not None:
+            payload["options"] = options
+        wall, rss, lines = run_worker(script, payload, work_dir, os.path.join(work_dir, f"{job['plant']}.log"))
+        result = lines[-1]
+        outputs.append(os.path.join(work_dir, result["output_path"]))
+        wall_total += wall
+        peak = max(peak or 0, rss or 0) or None
+        # both generators name outputs by the second
+        time.sleep(1.0)
+    return outputs, wall_total, peak
+
+def merge_side(script, outputs, work_dir):
+    wall, rss, lines = run_worker(script, {"file_paths": outputs}, work_dir, os.path.join(work_dir, "merge.log"))
+    return os.path.join(work_dir, lines[-1]["output_path"]), wall, rss
+
+def ratio(current, works):
+    return round(current / works, 3) if current and works else None
+
+def main():
+    parser = argparse.ArgumentParser(description="Parity of the inventory workers against their _works versions")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="smoke")
+    parser.add_argument("--plants", type=int)
+    parser.add_argument("--mb51-rows", type=int)
+    parser.add_argument("--materials", type=int)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--data-dir")
+    parser.add_argument("--work-dir", default=os.path.join("bench", "parity"))
+    parser.add_argument("--options", default="{}", help="JSON options for the current generator")
+    parser.add_argument("--ignore-columns", default=DEFAULT_IGNORED_COLUMNS)
+    parser.add_argument("--skip-merge", action="store_true")
+    parser.add_argument("--results", default=os.path.join("bench", "parity_results.json"))
+    args = parser.parse_args()
+
+    plants, mb51_rows, materials = SCALES[args.scale]
+    plants = args.plants or plants
+    mb51_rows = args.mb51_rows or mb51_rows
+    materials = args.materials or materials
+    data_dir = args.data_dir or os.path.join("bench", "data", f"p{plants}_r{mb51_rows}_m{materials}_s{args.seed}")
+    dataset = make_dataset(data_dir, plants, mb51_rows, materials, seed=args.seed)
+    ignore_columns = [c.strip().upper() for c in args.ignore_columns.split(",") if c.strip()]
+    options = dict(COLD_OPTIONS, **json.loads(args.options))
+    work_dir = os.path.abspath(args.work_dir)
+
+    log("Checking the sheet readers on blank-row fixtures...")
+    readers = check_readers(os.path.join(work_dir, "fixtures"))
+    for name, check in readers["checks"].items():
+        log(f"  {name}: {'match' if check['match'] else check.get('error', 'DIFFERENT')}")
+
+    log(f"Generating {plants} plants with generate_inventory_report_works.py...")
+    works_outputs, works_wall, works_rss = generate_side(
+        "generate_inventory_report_works.py", dataset, None, os.path.join(work_dir, "works"))
+    log(f"Generating {plants} plants with generate_inventory_report.py...")
+    outputs, wall, rss = generate_side(
+        "generate_inventory_report.py", dataset, options, os.path.join(work_dir, "current"))
+
+    reports = [compare_reports(a, b, ignore_columns) for a, b in zip(works_outputs, outputs)]
+    results = {
+        "params": dataset["params"],
+        "options": options,
+        "ignored_columns": ignore_columns,
+        "readers": readers,
+        "generate": {
+            "identical": all(r["identical"] for r in reports),
+            "wall_s": {"works": round(works_wall, 3), "current": round(wall, 3)},
+            "peak_rss_mb": {"works": works_rss, "current": rss},
+            "speed_ratio": ratio(wall, works_wall),
+            "memory_ratio": ratio(rss, works_rss),
+            "plants": reports,
+        },
+    }
+    for job, report in zip(dataset["plants"], reports):
+        log(f"  {job['plant']}: {report['diffs']} cell diffs over {report['cells_compared']:,} cells, "
+            f"{len(report['column_sum_diffs'])} column sum diffs")
+
+    if not args.skip_merge:
+        log("Merging both sides...")
+        works_merged, works_wall, works_rss = merge_side(
+            "merge_inventory_reports_works.py", works_outputs, os.path.join(work_dir, "works"))
+        merged, wall, rss = merge_side("merge_inventory_reports.py", outputs, os.path.join(work_dir, "current"))
+        report = compare_reports(works_merged, merged, ignore_columns,
+                                 adjust=lambda rows: merge_expected(rows, works_outputs))
+        results["merge"] = dict(report,
+                                wall_s={"works": round(works_wall, 3), "current": round(wall, 3)},
+                                peak_rss_mb={"works": works_rss, "current": rss},
+                                speed_ratio=ratio(wall, works_wall),
+                                memory_ratio=ratio(rss, works_rss))
+        log(f"  merged: {report['diffs']} cell diffs over {report['cells_compared']:,} cells")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.results)), exist_ok=True)
+    with open(args.results, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=1, default=str)
+
+    identical = (readers["identical"] and results["generate"]["identical"]
+                 and results.get("merge", {}).get("identical", True))
+    log(f"{'IDENTICAL' if identical else 'DIFFERENT'} - speed ratio {results['generate']['speed_ratio']} "
+        f"(current / works), memory ratio {results['generate']['memory_ratio']}; results in {args.results}")
+    sys.exit(0 if identical else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+# parse_cache.py - Content-addressed cache of parsed workbook sheets
+# A sheet read with pd.read_excel(dtype=str) is stored as an Arrow IPC file keyed by
+# sha256(file content) + sheet name, and loaded back memory-mapped on later runs.
+#
+# Needs pyarrow; without it the cache is disabled and sheets are parsed as before.
+# Eviction: entries older than max_age_days, then least recently used until the
+# directory is below max_total_mb.
+#
+# Options (payload "options"):
+#   parse_cache            : false disables the cache (default true)
+#   parse_cache_dir        : cache directory (default assets/cache/parsed, env INVENTORY_PARSE_CACHE_DIR)
+#   parse_cache_max_age_days : default 7 (env INVENTORY_PARSE_CACHE_MAX_AGE_DAYS)
+#   parse_cache_max_mb     : default 2048 (env INVENTORY_PARSE_CACHE_MAX_MB)
+
+import sys
+import os
+import time
+import hashlib
+import threading
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+# Bump when the way sheets are parsed changes, so old snapshots are ignored
+READER_VERSION = "1"
+CACHE_SUFFIX = ".arrow"
+
+def log(msg):
+    """Log to stderr"""
+    print(f"[parse-cache] {msg}", file=sys.stderr, flush=True)
+
+def file_digest(file_path, chunk_size=1024 * 1024):
+    """sha256 of the file content"""
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def restore_nan(df):
+    """Arrow nulls come back as None; the readers expect NaN like read_excel gives"""
+    text_cols = df.columns[df.dtypes == object]
+    if len(text_cols):
+        df[text_cols] = df[text_cols].where(df[text_cols].notna(), np.nan)
+    return df
+
+def frame_to_buffer(df):
+    """Compact columnar form of a str frame for sending between processes (Arrow IPC bytes)"""
+    if pa is None:
+        return df
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+def buffer_to_frame(buffer):
+    """Inverse of frame_to_buffer"""
+    if isinstance(buffer, pd.DataFrame):
+        return buffer
+    table = pa.ipc.open_stream(pa.py_buffer(buffer)).read_all()
+    return restore_nan(table.to_pandas())
+
+class ParseCache:
+    """Arrow IPC snapshots of parsed sheets, keyed by file content hash and sheet name"""
+
+    def __init__(self, cache_dir, max_age_days=7, max_total_mb=2048):
+        self.cache_dir = cache_dir
+        self.max_age_seconds = max_age_days * 86400 if max_age_days else None
+        self.max_total_bytes = max_total_mb * 1024 * 1024 if max_total_mb else None
+        self.hits = 0
+        self.misses = 0
+        self._digests = {}
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def digest(self, file_path):
+        """Content hash, memoized per (path, size, mtime) so a workbook is hashed once per process"""
+        st = os.stat(file_path)
+        stamp = (os.path.abspath(file_path), st.st_size, st.st_mtime_ns)
+        with self._lock:
+            digest = self._digests.get(stamp)
+        if digest is None:
+            digest = file_digest(file_path)
+            with self._lock:
+                self._digests[stamp] = digest
+        return digest
+
+    def entry_path(self, file_path, sheet_name):
+        digest = self.digest(file_path)
+        sheet_key = hashlib.sha1(f"{READER_VERSION}|{sheet_name}".encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"{digest}_{sheet_key}{CACHE_SUFFIX}")
+
+    def get(self, file_path, sheet_name):
+        """Cached DataFrame for the sheet, or None"""
+        path = self.entry_path(file_path, sheet_name)
+        if not os.path.exists(path):
+            self.misses += 1
+            return None
+        try:
+            with pa.memory_map(path, "r") as source:
+                table = pa.ipc.open_file(source).read_all()
+            df = table.to_pandas()
+        except Exception as e:
+            log(f"Dropping unreadable entry {os.path.basename(path)}: {str(e)}")
+            self._remove(path)
+            self.misses += 1
+            return None
+
+        df = restore_nan(df)
+        os.utime(path)  # mtime = last use, for LRU eviction
+        self.hits += 1
+        return df
+
+    def put(self, file_path, sheet_name, df):
+        """Store the parsed sheet; cache failures never fail the report"""
+        path = self.entry_path(file_path, sheet_name)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            with pa.OSFile(tmp_path, "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            log(f"Could not store {sheet_name}: {str(e)}")
+            self._remove(tmp_path)
+            return
+        self.evict()
+
+    def evict(self):
+        """Drop expired entries, then the least recently used ones until under the size limit"""
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(CACHE_SUFFIX):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if self.max_age_seconds and now - st.st_mtime > self.max_age_seconds:
+                self._remove(path)
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+
+        if not self.max_total_bytes:
+            return
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_total_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def get_parse_cache(options=None):
+    """ParseCache configured from payload options / environment, or None when disabled"""
+    options = options or {}
+    if options.get("parse_cache") is False:
+        return None
+    if pa is None:
+        log("pyarrow not installed - parse cache disabled")
+        return None
+    cache_dir = options.get("parse_cache_dir") or os.environ.get(
+        "INVENTORY_PARSE_CACHE_DIR", os.path.join("assets", "cache", "parsed"))
+    max_age_days = float(options.get("parse_cache_max_age_days",
+                                     os.environ.get("INVENTORY_PARSE_CACHE_MAX_AGE_DAYS", 7)))
+    max_total_mb = float(options.get("parse_cache_max_mb",
+                                     os.environ.get("INVENTORY_PARSE_CACHE_MAX_MB", 2048)))
+    return ParseCache(cache_dir, max_age_days, max_total_mb)
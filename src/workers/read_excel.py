@@ -3,12 +3,8 @@ import json
 import pandas as pd
 
 import io
-# Paksa stdout/stderr pakai UTF-8
-sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
-sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
 
-def main():
-    payload = json.load(sys.stdin)
+def read_files(payload):
     files = payload.get("files", {})
 
     main_path = files.get("main")
@@ -34,6 +30,16 @@ def main():
     else:
         output["mb51"] = []
 
+    return output
+
+def main():
+    # Paksa stdout/stderr pakai UTF-8
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+
+    payload = json.load(sys.stdin)
+    output = read_files(payload)
+
     # ====================================================
     # 3. Print JSON ke stdout (UTF-8)
     # ====================================================
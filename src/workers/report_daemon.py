@@ -0,0 +1,330 @@
+# report_daemon.py - Long-lived report worker
+# Keeps pandas / numpy / openpyxl and the parsed master data warm between jobs
+# instead of paying interpreter startup + imports for every spawn.
+#
+# Protocol: newline-delimited JSON on stdin/stdout (default) or a Unix socket
+#   request : {"id": "...", "type": "generate" | "merge" | "read_excel", "payload": {...}}
+#             {"type": "cancel", "id": "..."}                   stop a queued / running job
+#   replies : {"type": "ready", "pid": ...}                      once, on start
+#             {"type": "progress", "id": ..., ...}              merge progress, generate progress
+#                                                                (options "progress", see report_progress.py)
+#             {"type": "plant_result", "id": ..., ...}          generate batch, per plant
+#             {"type": "result", "id": ..., "result": {...}}    once per job
+#             {"type": "recycle", "reason": ...}                before the daemon exits
+#
+# "generate" accepts the same payload as generate_inventory_report.py (single plant or
+# "plants" batch). master_inventory / master_movement may be omitted to reuse the
+# master data of the previous job.
+#
+# Jobs run one at a time; input is read on a separate thread, so a "cancel" reaches the running
+# job at its next checkpoint. Payload "deadline" / "timeout_s" (generate: payload options) give
+# a job a deadline. Either way the result is the workers' "cancelled" result (see job_control.py).
+#
+# The daemon recycles itself after --max-jobs jobs or when RSS exceeds --max-rss-mb.
+# In stdin mode it exits (the parent respawns it), in socket mode it re-execs itself.
+#
+# Usage: python3 report_daemon.py [--socket PATH] [--max-jobs N] [--max-rss-mb N]
+
+import sys
+import json
+import os
+import socket
+import hashlib
+import argparse
+import threading
+import traceback
+import queue
+
+import generate_inventory_report
+import merge_inventory_reports
+import read_excel
+from job_control import JobCancelled, get_cancel_token
+from report_progress import get_progress_reporter
+
+def log(msg):
+    """Log to stderr"""
+    print(f"[report-daemon] {msg}", file=sys.stderr, flush=True)
+
+def current_rss_mb():
+    """Resident set size of this process in MB"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    # ru_maxrss is the peak, not the current RSS, but is the best we have here
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+class ReportDaemon:
+    """Dispatch JSON-lines jobs to the report workers"""
+
+    def __init__(self, max_jobs, max_rss_mb):
+        self.max_jobs = max_jobs
+        self.max_rss_mb = max_rss_mb
+        self.jobs_done = 0
+        self.master_key = None
+        self.master = None
+        self.lock = threading.Lock()
+        self.tokens = {}  # job id -> CancelToken of the queued / running job
+
+    def get_master(self, payload):
+        """Reuse the parsed master data while its content is unchanged"""
+        master_inventory = payload.get("master_inventory")
+        master_movement = payload.get("master_movement")
+
+        if master_inventory is None and master_movement is None:
+            if self.master is None:
+                raise ValueError("No master data loaded yet - payload must include master_inventory and master_movement")
+            return self.master
+
+        raw = json.dumps([master_inventory or [], master_movement or []], sort_keys=True, default=str)
+        key = hashlib.sha1(raw.encode("utf-8")).hexdigest()
+        if key != self.master_key:
+            log(f"Loading master data ({key[:10]})")
+            self.master = generate_inventory_report.build_master_state(master_inventory or [], master_movement or [])
+            self.master_key = key
+        return self.master
+
+    def cancel_job(self, job_id):
+        """Cancel a queued or running job"""
+        with self.lock:
+            token = self.tokens.get(job_id)
+        if token is None:
+            log(f"Cancel {job_id}: no such job")
+            return
+        log(f"Job {job_id}: cancel requested")
+        token.cancel("cancelled")
+
+    def run_generate(self, payload, emit, cancel):
+        report_date = payload.get("report_date")
+        if not report_date:
+            raise ValueError("Payload must include report_date")
+
+        master = self.get_master(payload)
+
+        if "plants" in payload:
+            jobs = payload.get("plants") or []
+            if not jobs:
+                raise ValueError("Payload plants must not be empty")
+            return generate_inventory_report.run_batch(jobs, report_date, master,
+                                                       options=payload.get("options"), emit=emit, cancel=cancel)
+
+        with get_progress_reporter(payload.get("options"), emit=emit) as progress:
+            return generate_inventory_report.generate_report(payload.get("files", {}), report_date, master,
+                                                             options=payload.get("options"), progress=progress,
+                                                             cancel=cancel)
+
+    def handle(self, request, emit, cancel):
+        """Run one job; every record written for it carries the job id"""
+        job_id = request.get("id")
+        job_type = request.get("type")
+        payload = request.get("payload") or {}
+
+        def emit_job(record):
+            record = dict(record)
+            record.setdefault("type", "progress")
+            record["id"] = job_id
+            emit(record)
+
+        def merge_progress(stage, current, total, message=""):
+            emit_job({
+                "type": "progress",
+                "stage": stage,
+                "current": current,
+                "total": total,
+                "percentage": round((current / total * 100), 1) if total > 0 else 0,
+                "message": message
+            })
+
+        log(f"Job {job_id}: {job_type}")
+        try:
+            cancel.check("queued")
+            if job_type == "generate":
+                result = self.run_generate(payload, emit_job, cancel)
+            elif job_type == "merge":
+                result = merge_inventory_reports.merge_reports(payload, progress=merge_progress, cancel=cancel)
+            elif job_type == "read_excel":
+                result = read_excel.read_files(payload)
+            else:
+                raise ValueError(f"Unknown job type: {job_type}")
+        except JobCancelled as e:
+            log(f"Job {job_id} CANCELLED: {str(e)}")
+            result = e.result()
+        except Exception as e:
+            tb = traceback.format_exc()
+            log(f"Job {job_id} ERROR: {str(e)}")
+            log(f"Traceback:\n{tb}")
+            result = {
+                "success": False,
+                "error": str(e),
+                "trace": tb
+            }
+
+        finally:
+            with self.lock:
+                self.tokens.pop(job_id, None)
+
+        self.jobs_done += 1
+        emit({"type": "result", "id": job_id, "result": result})
+
+    def recycle_reason(self):
+        """Reason to restart the process, or None to keep serving"""
+        if self.max_jobs and self.jobs_done >= self.max_jobs:
+            return f"max_jobs {self.max_jobs} reached"
+        rss = current_rss_mb()
+        if self.max_rss_mb and rss > self.max_rss_mb:
+            return f"rss {rss:.0f}MB > {self.max_rss_mb}MB"
+        return None
+
+    def parse_line(self, line, emit):
+        """Request of one input line, or None"""
+        line = line.strip()
+        if not line:
+            return None
+        try:
+            return json.loads(line)
+        except ValueError as e:
+            emit({"type": "result", "id": None, "result": {"success": False, "error": f"Invalid JSON: {str(e)}"}})
+            return None
+
+    def queue_job(self, request, jobs, emit):
+        """Give the job its cancel token (deadline from the payload) and queue it"""
+        payload = request.get("payload") or {}
+        options = payload.get("options") if request.get("type") == "generate" else payload
+        try:
+            cancel = get_cancel_token(options, install_signals=False)
+        except ValueError as e:
+            emit({"type": "result", "id": request.get("id"), "result": {"success": False, "error": str(e)}})
+            return
+        with self.lock:
+            self.tokens[request.get("id")] = cancel
+        jobs.put((request, cancel))
+
+    def serve(self, lines, emit):
+        """Run the jobs read from lines until input closes (None) or the daemon must recycle (reason)"""
+        jobs = queue.Queue()
+
+        def read():
+            try:
+                for line in lines:
+                    request = self.parse_line(line, emit)
+                    if request is None:
+                        continue
+                    if request.get("type") == "cancel":
+                        self.cancel_job(request.get("id"))
+                    else:
+                        self.queue_job(request, jobs, emit)
+            except (OSError, ValueError):  # input closed while reading
+                pass
+            finally:
+                jobs.put(None)
+
+        threading.Thread(target=read, name="daemon-input", daemon=True).start()
+        while True:
+            job = jobs.get()
+            if job is None:
+                return None
+            self.handle(job[0], emit, job[1])
+            reason = self.recycle_reason()
+            if reason:
+                return reason
+
+    def serve_stdio(self):
+        lock = threading.Lock()
+
+        def emit(record):
+            with lock:
+                sys.stdout.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+                sys.stdout.flush()
+
+        emit({"type": "ready", "pid": os.getpid()})
+        # Own file object: forked batch children close sys.stdin, which would block on the
+        # buffer lock held by the input thread
+        lines = open(sys.stdin.fileno(), encoding="utf-8", newline="\n", closefd=False)
+        reason = self.serve(iter(lines.readline, ""), emit)
+        if not reason:
+            log("stdin closed, exiting")
+            return
+        log(f"Recycling: {reason}")
+        emit({"type": "recycle", "reason": reason, "jobs_done": self.jobs_done})
+
+    def serve_socket(self, path):
+        if os.path.exists(path):
+            os.unlink(path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(path)
+        server.listen(8)
+        log(f"Listening on {path} (pid {os.getpid()})")
+
+        try:
+            while True:
+                conn, _ = server.accept()
+                reason = self.serve_connection(conn)
+                if reason:
+                    log(f"Recycling: {reason}")
+                    return reason
+        finally:
+            server.close()
+            if os.path.exists(path):
+                os.unlink(path)
+
+    def serve_connection(self, conn):
+        """Serve jobs on one client connection until it closes or the daemon must recycle"""
+        reader = conn.makefile("r", encoding="utf-8", newline="\n")
+        writer = conn.makefile("w", encoding="utf-8", newline="\n")
+        lock = threading.Lock()
+
+        def emit(record):
+            with lock:
+                writer.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+                writer.flush()
+
+        try:
+            emit({"type": "ready", "pid": os.getpid()})
+            reason = self.serve(reader, emit)
+            if reason:
+                emit({"type": "recycle", "reason": reason, "jobs_done": self.jobs_done})
+                return reason
+        except (BrokenPipeError, ConnectionResetError):
+            log("Client disconnected")
+        finally:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)  # wakes the input thread
+            except OSError:
+                pass
+            writer.close()
+            reader.close()
+            conn.close()
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Long-lived report worker (JSON lines)")
+    parser.add_argument("--socket", default=os.environ.get("REPORT_DAEMON_SOCKET"),
+                        help="Unix socket path (default: stdin/stdout)")
+    parser.add_argument("--max-jobs", type=int, default=int(os.environ.get("REPORT_DAEMON_MAX_JOBS", 200)),
+                        help="Recycle after this many jobs (0 = never)")
+    parser.add_argument("--max-rss-mb", type=int, default=int(os.environ.get("REPORT_DAEMON_MAX_RSS_MB", 2048)),
+                        help="Recycle when RSS exceeds this many MB (0 = never)")
+    args = parser.parse_args()
+
+    daemon = ReportDaemon(args.max_jobs, args.max_rss_mb)
+
+    if not args.socket:
+        daemon.serve_stdio()
+        return
+
+    if daemon.serve_socket(args.socket):
+        # Start over with a fresh interpreter on the same socket path
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.execv(sys.executable, [sys.executable] + sys.argv)
+
+
+if __name__ == "__main__":
+    main()
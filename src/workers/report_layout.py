@@ -0,0 +1,124 @@
+# report_layout.py - Compiled layout of the Output Report INV ARUS BARANG sheet
+# report_layout.json is the machine-readable form of 'Mapping Inventory.txt': one entry per
+# body column with its value source, row formula and whether row 3 sums it, plus the control
+# cells of rows 1-2. It is compiled once into column indexes, MB51 storage blocks and
+# pre-parsed formula terms, and shared by generate_inventory_report and
+# merge_inventory_reports so the two cannot drift apart.
+#
+# Column entries:
+#   {"source": "material", "field": area|plant|kode_dist|profit_center|period|material|description}
+#   {"source": "sheet", "kind": saldo_awal|mb5b_awal|mb5b|eds|baso, "sloc": "GS"|"BS"}
+#   {"source": "mb51", "storage": "GS00"|...|"" (no sloc), "grouping": ..., "mv_type": ...}
+#   {"formula": "=H{r}+I{r}"}  ('{r}' = worksheet row; formula columns it uses must come earlier)
+#   "sum": true adds =SUM(X9:X<last>) in row 3
+# Control cells: {"source": name} (a per-report number, summed by the merger) or {"formula": ...}
+
+import os
+import re
+import json
+from openpyxl.utils import get_column_letter, column_index_from_string
+
+LAYOUT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "report_layout.json")
+# One signed term of a row formula: X{r} or SUM(X{r}:Y{r})
+FORMULA_TERM = re.compile(r"([+-]?)(?:SUM\(([A-Z]+)\{r\}:([A-Z]+)\{r\}\)|([A-Z]+)\{r\})")
+# One signed cell reference of a control formula: X3
+CELL_TERM = re.compile(r"([+-]?)([A-Z]+[0-9]+)")
+
+class ReportLayout:
+    """report_layout.json compiled into the lookups the writers use"""
+
+    def __init__(self, spec):
+        self.sheet = spec["sheet"]
+        self.header_rows = spec["header_rows"]
+        self.first_data_row = spec["first_data_row"]
+        self.last_column = column_index_from_string(spec["last_column"])
+        self.number_format = spec["number_format"]
+        self.number_columns_from = column_index_from_string(spec["number_columns_from"])
+        self.summary_format_from = column_index_from_string(spec["summary_format_from"])
+        self.freeze_panes = spec.get("freeze_panes")
+        self.widths = spec.get("widths", {})
+
+        self.index = {}                 # letter -> 1-based column index
+        self.material_fields = {}       # letter -> material field
+        self.sheet_lookups = []         # (letter, kind, sloc)
+        self.mb51_columns = []          # letters, layout order
+        self.storage_blocks = {}        # storage -> {grouping: letter}
+        self.empty_storage_mv_types = {}
+        self.empty_storage_groupings = {}
+        self.formulas = {}              # letter -> template, in dependency order
+        self.formula_terms = {}         # letter -> [(sign, [letters])]
+        self.sum_columns = []
+
+        formula_letters = {letter for letter, column in spec["columns"].items() if "formula" in column}
+        for letter, column in spec["columns"].items():
+            idx = column_index_from_string(letter)
+            if idx > self.last_column:
+                raise ValueError(f"Layout column {letter} is beyond {spec['last_column']}")
+            self.index[letter] = idx
+            source = column.get("source")
+            if "formula" in column:
+                self.formulas[letter] = column["formula"]
+                self.formula_terms[letter] = self._compile_formula(letter, column["formula"], formula_letters)
+            elif source == "material":
+                self.material_fields[letter] = column["field"]
+            elif source == "sheet":
+                self.sheet_lookups.append((letter, column["kind"], column["sloc"]))
+            elif source == "mb51":
+                self.mb51_columns.append(letter)
+                storage = column.get("storage") or ""
+                if storage:
+                    self.storage_blocks.setdefault(storage, {})[column["grouping"]] = letter
+                else:
+                    if column.get("mv_type"):
+                        self.empty_storage_mv_types[str(column["mv_type"])] = letter
+                    if column.get("grouping"):
+                        self.empty_storage_groupings[column["grouping"]] = letter
+            else:
+                raise ValueError(f"Layout column {letter} has no source or formula")
+            if column.get("sum"):
+                self.sum_columns.append(letter)
+
+        self.controls = {}              # cell -> source name
+        self.control_formulas = {}      # cell -> formula text
+        self.control_terms = {}         # cell -> [(sign, cell)]
+        for cell, control in spec.get("controls", {}).items():
+            if "formula" in control:
+                self.control_formulas[cell] = control["formula"]
+                self.control_terms[cell] = CELL_TERM.findall(control["formula"][1:])
+            else:
+                self.controls[cell] = control["source"]
+
+        self.field_columns = {field: letter for letter, field in self.material_fields.items()}
+
+    def _compile_formula(self, letter, template, formula_letters):
+        """[(sign, [letters])] per term, so the formula can be evaluated column-wise"""
+        terms = []
+        for sign, first, last, single in FORMULA_TERM.findall(template[1:]):
+            if single:
+                letters = [single]
+            else:
+                letters = [get_column_letter(i) for i in
+                           range(column_index_from_string(first), column_index_from_string(last) + 1)]
+            for ref in letters:
+                if ref in formula_letters and ref not in self.formula_terms:
+                    raise ValueError(f"Formula of {letter} uses {ref} before it is defined")
+            terms.append((sign, letters))
+        return terms
+
+    def formula_row(self, row):
+        """{letter: formula} for one worksheet row"""
+        text = str(row)
+        return {letter: template.replace("{r}", text) for letter, template in self.formulas.items()}
+
+    def sum_formulas(self, last_row):
+        """Row-3 SUM formulas over rows first_data_row..last_row"""
+        return {f"{col}3": f"=SUM({col}{self.first_data_row}:{col}{last_row})" for col in self.sum_columns}
+
+_layouts = {}
+
+def load_layout(path=LAYOUT_PATH):
+    """Compiled layout, loaded once per process"""
+    if path not in _layouts:
+        with open(path, encoding="utf-8") as f:
+            _layouts[path] = ReportLayout(json.load(f))
+    return _layouts[path]
@@ -0,0 +1,150 @@
+# report_manifest.py - Input fingerprints for generate_inventory_report
+# Every output gets a manifest (<cache_dir>/manifests/<fingerprint>.json) with the hashes of
+# its inputs: mb51/main/baso file content, master_inventory / master_movement digests,
+# report_date, plant and code version. A request with the same fingerprint gets the
+# existing output back instead of a rebuild.
+#
+# The aggregates computed before the MB51 movement mapping (grouped MB51, material list,
+# sheet lookups) are kept per input set in <cache_dir>/stages, so when only
+# master_movement changed just the mapping stage and the write are redone.
+#
+# Options (payload "options"):
+#   reuse_output     : false always rebuilds (default true)
+#   stage_cache      : false disables the aggregate cache (default true)
+#   report_cache_dir : default assets/cache (env INVENTORY_REPORT_CACHE_DIR)
+
+import sys
+import os
+import json
+import time
+import pickle
+import hashlib
+
+STAGE_MAX_AGE_DAYS = 7
+STAGE_MAX_ENTRIES = 20
+MANIFEST_MAX_AGE_DAYS = 60
+
+def log(msg):
+    """Log to stderr"""
+    print(f"[report-manifest] {msg}", file=sys.stderr, flush=True)
+
+def data_digest(data):
+    """Stable digest of JSON-like data"""
+    raw = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+class ReportManifest:
+    """Fingerprint -> output manifests plus the pre-mapping stage cache"""
+
+    def __init__(self, cache_dir, reuse_output=True, stage_cache=True):
+        self.manifest_dir = os.path.join(cache_dir, "manifests")
+        self.stage_dir = os.path.join(cache_dir, "stages")
+        self.reuse_output = reuse_output
+        self.stage_cache = stage_cache
+        os.makedirs(self.manifest_dir, exist_ok=True)
+        os.makedirs(self.stage_dir, exist_ok=True)
+
+    def find_output(self, fingerprint):
+        """Result of an earlier run with this fingerprint whose output file still exists"""
+        if not self.reuse_output:
+            return None
+        path = os.path.join(self.manifest_dir, f"{fingerprint}.json")
+        try:
+            with open(path, encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        result = manifest.get("result") or {}
+        output_path = result.get("output_path")
+        if not output_path or not os.path.exists(output_path):
+            return None
+        if os.path.getsize(output_path) != result.get("file_size"):
+            log(f"Output {output_path} changed since it was generated - rebuilding")
+            return None
+        return result
+
+    def write(self, fingerprint, inputs, result):
+        """Manifest for a finished output; failures never fail the report"""
+        manifest = {
+            "fingerprint": fingerprint,
+            "inputs": inputs,
+            "output_path": result.get("output_path"),
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "result": result,
+        }
+        path = os.path.join(self.manifest_dir, f"{fingerprint}.json")
+        try:
+            with open(f"{path}.{os.getpid()}.tmp", "w", encoding="utf-8") as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2, default=str)
+            os.replace(f"{path}.{os.getpid()}.tmp", path)
+        except OSError as e:
+            log(f"Could not write manifest: {str(e)}")
+        self._evict(self.manifest_dir, ".json", MANIFEST_MAX_AGE_DAYS, None)
+
+    def load_stage(self, key):
+        """Cached pre-mapping aggregates, or None"""
+        if not self.stage_cache:
+            return None
+        path = os.path.join(self.stage_dir, f"{key}.pkl")
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                stage = pickle.load(f)
+        except Exception as e:
+            log(f"Dropping unreadable stage {key[:10]}: {str(e)}")
+            self._remove(path)
+            return None
+        os.utime(path)
+        return stage
+
+    def save_stage(self, key, stage):
+        if not self.stage_cache:
+            return
+        path = os.path.join(self.stage_dir, f"{key}.pkl")
+        try:
+            with open(f"{path}.{os.getpid()}.tmp", "wb") as f:
+                pickle.dump(stage, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(f"{path}.{os.getpid()}.tmp", path)
+        except Exception as e:
+            log(f"Could not store stage: {str(e)}")
+            self._remove(f"{path}.{os.getpid()}.tmp")
+            return
+        self._evict(self.stage_dir, ".pkl", STAGE_MAX_AGE_DAYS, STAGE_MAX_ENTRIES)
+
+    def _evict(self, directory, suffix, max_age_days, max_entries):
+        """Drop entries older than max_age_days, then the least recently used beyond max_entries"""
+        now = time.time()
+        entries = []
+        for name in os.listdir(directory):
+            if not name.endswith(suffix):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                continue
+            if now - mtime > max_age_days * 86400:
+                self._remove(path)
+            else:
+                entries.append((mtime, path))
+
+        if max_entries and len(entries) > max_entries:
+            for _, path in sorted(entries)[:len(entries) - max_entries]:
+                self._remove(path)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def get_report_manifest(options=None):
+    """ReportManifest configured from payload options / environment"""
+    options = options or {}
+    cache_dir = options.get("report_cache_dir") or os.environ.get(
+        "INVENTORY_REPORT_CACHE_DIR", os.path.join("assets", "cache"))
+    return ReportManifest(cache_dir,
+                          reuse_output=options.get("reuse_output") is not False,
+                          stage_cache=options.get("stage_cache") is not False)
@@ -0,0 +1,139 @@
+# report_progress.py - Progress and heartbeat lines of generate_inventory_report
+# Same record as merge_inventory_reports' send_progress, one JSON line on stdout:
+#   {"type": "progress", "stage", "current", "total", "percentage", "message",
+#    "plant", "elapsed_s", "rows_per_s", "eta_s", "heartbeat"}
+# Stages: reading (MB51 + main file sheets), caches, body, writing (rows written / total, with
+# rows/sec and an ETA from the measured throughput), saving, complete. Row updates are
+# throttled to one line per PROGRESS_INTERVAL_S.
+#
+# A heartbeat thread repeats the current stage (heartbeat: true) when nothing was emitted for
+# heartbeat_s seconds, so the line keeps moving during long blocking calls (pd.read_excel,
+# wb.save) and proxies do not drop the idle connection.
+#
+# Opt-in, since callers that parse the whole stdout as one JSON object would break:
+#   options "progress": true (env INVENTORY_PROGRESS=1), "heartbeat_s" (env INVENTORY_HEARTBEAT_S,
+#   default 15, 0 = no heartbeat)
+
+import os
+import json
+import time
+import threading
+
+PROGRESS_INTERVAL_S = 1.0
+DEFAULT_HEARTBEAT_S = 15.0
+
+def emit_stdout(record):
+    """Write one JSON record to stdout"""
+    print(json.dumps(record), flush=True)
+
+class ProgressReporter:
+    """Current stage / row counters, emitted as progress lines; does nothing when emit is None"""
+
+    def __init__(self, emit=None, plant=None, heartbeat_s=DEFAULT_HEARTBEAT_S):
+        self.emit = emit
+        self.plant = plant
+        self.heartbeat_s = heartbeat_s
+        self.started = time.perf_counter()
+        self.stage_name = None
+        self.message = ""
+        self.current = 0
+        self.total = 0
+        self.stage_started = self.started
+        self.last_emit = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        if self.emit is not None and self.heartbeat_s:
+            self._thread = threading.Thread(target=self._heartbeat, name="progress-heartbeat", daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def stage(self, name, message="", total=0):
+        """Start a stage; total = rows it will process (0 when unknown)"""
+        with self._lock:
+            self.stage_name, self.message = name, message
+            self.current, self.total = 0, total or 0
+            self.stage_started = time.perf_counter()
+            self._send()
+
+    def advance(self, rows, message=None):
+        """rows more processed in the current stage (emitted at most every PROGRESS_INTERVAL_S)"""
+        with self._lock:
+            self.current += rows
+            if message is not None:
+                self.message = message
+            if time.perf_counter() - self.last_emit >= PROGRESS_INTERVAL_S:
+                self._send()
+
+    def track(self, rows, every=1000, then=None):
+        """Yield rows, counting them into the current stage; then() runs once they are used up"""
+        count = 0
+        for row in rows:
+            yield row
+            count += 1
+            if count == every:
+                self.advance(count)
+                count = 0
+        if count:
+            self.advance(count)
+        if then is not None:
+            then()
+
+    def complete(self, message=""):
+        self.stage("complete", message)
+
+    def record(self, heartbeat=False):
+        now = time.perf_counter()
+        stage_elapsed = now - self.stage_started
+        rate = self.current / stage_elapsed if self.current and stage_elapsed > 0 else None
+        eta = (self.total - self.current) / rate if rate and self.total else None
+        if self.stage_name == "complete":
+            percentage = 100.0
+        else:
+            percentage = round(self.current / self.total * 100, 1) if self.total else 0
+        return {
+            "type": "progress",
+            "stage": self.stage_name,
+            "current": self.current,
+            "total": self.total,
+            "percentage": percentage,
+            "message": self.message,
+            "plant": self.plant,
+            "elapsed_s": round(now - self.started, 1),
+            "rows_per_s": round(rate, 1) if rate else None,
+            "eta_s": round(max(eta, 0.0), 1) if eta is not None else None,
+            "heartbeat": heartbeat,
+        }
+
+    def _send(self, heartbeat=False):
+        if self.emit is None or self.stage_name is None:
+            return
+        try:
+            self.emit(self.record(heartbeat))
+        except (OSError, ValueError):  # stdout closed by the caller
+            pass
+        self.last_emit = time.perf_counter()
+
+    def _heartbeat(self):
+        while not self._stop.wait(min(self.heartbeat_s, 1.0)):
+            with self._lock:
+                if time.perf_counter() - self.last_emit >= self.heartbeat_s:
+                    self._send(heartbeat=True)
+
+def get_progress_reporter(options=None, plant=None, emit=emit_stdout):
+    """Reporter for one job - a silent one unless progress is enabled"""
+    options = options or {}
+    enabled = options.get("progress")
+    if enabled is None:
+        enabled = os.environ.get("INVENTORY_PROGRESS", "").strip().lower() in ("1", "true", "yes")
+    heartbeat_s = options.get("heartbeat_s")
+    if heartbeat_s is None:
+        heartbeat_s = os.environ.get("INVENTORY_HEARTBEAT_S") or DEFAULT_HEARTBEAT_S
+    return ProgressReporter(emit if enabled else None, plant, float(heartbeat_s))
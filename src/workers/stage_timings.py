@@ -0,0 +1,98 @@
+# stage_timings.py - Per-stage wall / CPU time and throughput of a worker job
+# Each stage records wall seconds, process CPU seconds and (when given) rows and rows/sec.
+# CPU time is for the whole process, so background parse threads/processes started
+# earlier count towards whichever stage is waiting on them.
+#
+# The workers put timings.as_dict() in their JSON result as "timings" and, when a metrics
+# file is configured, append one JSON line per job to it:
+#   payload options "metrics_file" or env INVENTORY_METRICS_FILE (merge: payload "metrics_file")
+# With a MemoryTracker (memory_usage.py) every lap also records RSS.
+
+import sys
+import os
+import json
+import time
+
+def log(msg):
+    """Log to stderr"""
+    print(f"[stage-timings] {msg}", file=sys.stderr, flush=True)
+
+class StageTimings:
+    """Ordered stage -> wall/CPU seconds and rows
+
+    lap(name) books the time since the previous lap (or since start) to name, so a worker
+    only marks where each stage ends; a name booked twice accumulates.
+    """
+
+    def __init__(self, memory=None):
+        self.memory = memory
+        self.stages = {}
+        self.started = time.perf_counter()
+        self.cpu_started = time.process_time()
+        self.mark = (self.started, self.cpu_started)
+
+    def lap(self, name, rows=None):
+        """End stage name here"""
+        wall, cpu = time.perf_counter(), time.process_time()
+        record = self.stages.setdefault(name, {"wall_s": 0.0, "cpu_s": 0.0, "rows": None})
+        record["wall_s"] += wall - self.mark[0]
+        record["cpu_s"] += cpu - self.mark[1]
+        self.mark = (wall, cpu)
+        if rows is not None:
+            self.add_rows(name, rows)
+        if self.memory is not None:
+            self.memory.stage(name)
+
+    def frame(self, name, data):
+        """Size of a DataFrame for the memory profile; no-op without one"""
+        if self.memory is not None:
+            self.memory.frame(name, data)
+
+    def skip(self):
+        """Do not book the time since the previous lap to any stage"""
+        self.mark = (time.perf_counter(), time.process_time())
+
+    def add_rows(self, name, rows):
+        """Rows handled by a stage, for its rows/sec"""
+        record = self.stages.setdefault(name, {"wall_s": 0.0, "cpu_s": 0.0, "rows": None})
+        record["rows"] = (record["rows"] or 0) + int(rows)
+
+    def as_dict(self):
+        """{"stages": {name: {...}}, "total": {...}} with rounded numbers"""
+        stages = {}
+        for name, record in self.stages.items():
+            entry = {"wall_s": round(record["wall_s"], 3), "cpu_s": round(record["cpu_s"], 3)}
+            if record["rows"] is not None:
+                entry["rows"] = record["rows"]
+                entry["rows_per_s"] = round(record["rows"] / record["wall_s"], 1) if record["wall_s"] > 0 else None
+            stages[name] = entry
+        return {
+            "stages": stages,
+            "total": {"wall_s": round(time.perf_counter() - self.started, 3),
+                      "cpu_s": round(time.process_time() - self.cpu_started, 3)},
+        }
+
+    def summary(self):
+        """One log line: stage=wall/cpu seconds"""
+        return ", ".join(f"{name}={record['wall_s']:.2f}s/{record['cpu_s']:.2f}cpu"
+                         for name, record in self.stages.items())
+
+def append_metrics(path, record):
+    """Append one JSON line to the metrics file; failures never fail the job"""
+    if not path:
+        return
+    try:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        line = json.dumps(dict(record, recorded_at=time.strftime("%Y-%m-%d %H:%M:%S")),
+                          ensure_ascii=False, default=str)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except OSError as e:
+        log(f"Could not write metrics to {path}: {str(e)}")
+
+def metrics_path(options=None):
+    """Metrics file from payload options / environment, or None"""
+    options = options or {}
+    return options.get("metrics_file") or os.environ.get("INVENTORY_METRICS_FILE")
@@ -0,0 +1,195 @@
+# synthetic_inventory_data.py - Synthetic input workbooks for benchmarking the inventory workers
+# Writes per-plant MB51, main (SALDO AWAL, SALDO AWAL MB5B, 13. MB5B, 14. SALDO AKHIR EDS and
+# the existing output sheet) and BASO workbooks laid out like the SAP / BASO templates the
+# workers read, plus master inventory / movement data. Same seed and sizes give the same files.
+#
+# Sizes are per plant: every plant gets its own MB51 extract of mb51_rows rows over a pool of
+# materials (a few percent of the rows belong to other plants, as in real extracts).
+#
+# python synthetic_inventory_data.py <out_dir> [plants] [mb51_rows] [materials]
+
+import sys
+import os
+import json
+import random
+import datetime
+from openpyxl import Workbook
+
+DATASET_VERSION = "1"
+REPORT_DATE = "2025-01-31"
+OUTPUT_SHEET = "Output Report INV ARUS BARANG"
+BASO_SHEETS = ["GT GS", "GT BS", "MT GS", "MT BS"]
+
+# (mv_type, Movement Type Text, grouping or None for unmapped texts, weight)
+MOVEMENTS = [
+    ("101", "GR goods receipt", "Terima Barang", 20),
+    ("102", "GR for PO reversal", "Retur Beli", 2),
+    ("122", "RE return to vendor", "Retur Beli", 3),
+    ("601", "GD goods issue:delvy", "Penjualan", 35),
+    ("602", "RE goods deliv. rev.", "Retur Jual", 3),
+    ("653", "GD returns unrestr.", "Retur Jual", 4),
+    ("311", "TF trfr within plant", "Intra Gudang Masuk", 8),
+    ("641", "TF to stck in trans.", "Intra Gudang", 6),
+    ("642", "TF to stck in tr.rev", "Intra Gudang", 1),
+    ("309", "TF trfr mat to mat", "Transfer Stock", 3),
+    ("551", "GI scrapping", "Pemusnahan", 2),
+    ("701", "GR phys.inv. surplus", "Adjustment", 2),
+    ("702", "GI phys.inv. deficit", "Adjustment", 2),
+    ("Z51", "Consignment issue", None, 1),
+]
+# Storage locations of MB51 rows; "" is a blank cell (641/642 in transit)
+STORAGES = [("GS00", 60), ("BS00", 15), ("AI00", 8), ("TR00", 7), ("", 8), ("XX01", 2)]
+OTHER_PLANT_SHARE = 0.03
+
+def log(msg):
+    """Log to stderr"""
+    print(f"[synthetic-data] {msg}", file=sys.stderr, flush=True)
+
+def plant_codes(count):
+    return [f"P{i:03d}" for i in range(1, count + 1)]
+
+def material_codes(count):
+    return [str(100000000 + i * 7) for i in range(count)]
+
+def master_data(plants):
+    """master_inventory / master_movement rows as the controller sends them"""
+    master_inventory = [
+        {"plant": plant, "area": f"AREA {i % 12 + 1:02d}", "kode_dist": f"D{i:04d}",
+         "profit_center": f"PC{i:05d}"}
+        for i, plant in enumerate(plants + ["PX99"])
+    ]
+    master_movement = [
+        {"mv_type": mv_type, "mv_text": mv_text, "mv_grouping": grouping}
+        for mv_type, mv_text, grouping, _ in MOVEMENTS if grouping
+    ]
+    return master_inventory, master_movement
+
+def write_mb51(path, plant, materials, rows, rnd):
+    """MB51 extract: header row, then one movement per row"""
+    movements = [m[:3] for m in MOVEMENTS]
+    movement_weights = [m[3] for m in MOVEMENTS]
+    storages = [s for s, _ in STORAGES]
+    storage_weights = [w for _, w in STORAGES]
+    start = datetime.datetime(2025, 1, 1)
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Sheet1")
+    ws.append(["Material Document", "Item", "Posting Date", "Material", "Material description", "Plant",
+               "Storage Location", "Movement type", "Movement Type Text", "Batch", "Quantity",
+               "Unit of Entry", "Amount in LC"])
+    for i in range(rows):
+        material = rnd.choice(materials)
+        mv_type, mv_text, _ = rnd.choices(movements, movement_weights)[0]
+        storage = rnd.choices(storages, storage_weights)[0]
+        if mv_type in ("641", "642") and rnd.random() < 0.5:
+            storage = ""
+        row_plant = plant if rnd.random() > OTHER_PLANT_SHARE else "PX99"
+        quantity = rnd.randint(1, 500)
+        if mv_type in ("601", "122", "641", "551", "702"):
+            quantity = -quantity
+        ws.append([4900000000 + i, i % 10 + 1, start + datetime.timedelta(days=rnd.randint(0, 30)),
+                   material, f"PRODUK {material}", row_plant, storage or None, mv_type, mv_text,
+                   f"B{rnd.randint(1, 999):04d}", quantity, "PC", quantity * 1250.0])
+    wb.save(path)
+
+def write_main(path, plant, materials, rnd):
+    """Main file: the four stock sheets plus last period's output (half the materials)"""
+    wb = Workbook(write_only=True)
+
+    ws = wb.create_sheet(OUTPUT_SHEET)
+    ws.append(["REPORT INV ARUS BARANG"])
+    for label in ("Plant", "Periode", "Tanggal", "Area", "", ""):
+        ws.append([None] * 5 + [label])
+    ws.append(["AREA", "PLANT", "KODE DIST", "PROFIT CENTER", "PERIODE", "MATERIAL", "DESCRIPTION"])
+    for material in materials[:len(materials) // 2]:
+        ws.append(["AREA 01", plant, "D0001", "PC00001", "JAN 2025", material, f"PRODUK {material}"])
+
+    ws = wb.create_sheet("SALDO AWAL")
+    ws.append(["Plant", "Kode Material", "Material Description", "Storage Loc", "Closing Stock (pcs)"])
+    for material in materials:
+        for storage in ("GS", "BS"):
+            ws.append([plant, material, f"PRODUK {material}", storage, rnd.randint(0, 2000)])
+
+    ws = wb.create_sheet("SALDO AWAL MB5B")
+    ws.append([f"Stock on Posting Date - {plant}"])
+    ws.append([None])
+    ws.append(["Plnt", "Material", "Material Description", "GS", "BS"])
+    for material in materials:
+        ws.append([plant, material, f"PRODUK {material}", rnd.randint(0, 2000), rnd.randint(0, 100)])
+
+    ws = wb.create_sheet("13. MB5B")
+    ws.append(["Plnt", "Material", "Material Description", "GS", "BS"] + [f"Qty {i}" for i in range(1, 13)])
+    for material in materials:
+        ws.append([plant, material, f"PRODUK {material}", rnd.randint(0, 2000), rnd.randint(0, 100)]
+                  + [rnd.randint(0, 50) for _ in range(12)])
+
+    ws = wb.create_sheet("14. SALDO AKHIR EDS")
+    ws.append(["Plant", "Material", "Material Description", "Storage Location", "Closing Stock (pcs)"])
+    for material in materials:
+        for storage in ("GS", "BS"):
+            ws.append([plant, material, f"PRODUK {material}", storage, rnd.randint(0, 2000)])
+
+    wb.save(path)
+
+def write_baso(path, plant, materials, rnd):
+    """BASO file: title rows, header, one counted row per sampled material in each of the 4 sheets"""
+    wb = Workbook(write_only=True)
+    for name in BASO_SHEETS:
+        ws = wb.create_sheet(name)
+        ws.append([f"BERITA ACARA STOCK OPNAME - {name}"])
+        ws.append([None])
+        ws.append(["NO", "PLANT", "KODE BARANG", "NAMA BARANG", "SATUAN", "FISIK (PCS)"])
+        for i, material in enumerate(rnd.sample(materials, len(materials) // 3)):
+            ws.append([i + 1, plant, material, f"PRODUK {material}", "PCS", rnd.randint(0, 500)])
+    wb.save(path)
+
+def make_dataset(out_dir, plants=1, mb51_rows=1000, materials=500, seed=1, baso=True, regenerate=False):
+    """Write the dataset to out_dir (reused when it already exists with the same parameters)
+
+    Returns {"params", "report_date", "master_inventory", "master_movement",
+             "plants": [{"plant", "files": {"mb51", "main", "baso"}}]}
+    """
+    params = {"version": DATASET_VERSION, "plants": plants, "mb51_rows": mb51_rows,
+              "materials": materials, "seed": seed, "baso": baso}
+    manifest_path = os.path.join(out_dir, "dataset.json")
+    if not regenerate and os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as f:
+            dataset = json.load(f)
+        if dataset.get("params") == params:
+            log(f"Reusing dataset in {out_dir}")
+            return dataset
+
+    os.makedirs(out_dir, exist_ok=True)
+    codes = plant_codes(plants)
+    pool = material_codes(materials)
+    master_inventory, master_movement = master_data(codes)
+    jobs = []
+    for idx, plant in enumerate(codes):
+        rnd = random.Random(f"{seed}:{plant}")
+        plant_dir = os.path.join(out_dir, plant)
+        os.makedirs(plant_dir, exist_ok=True)
+        files = {"mb51": os.path.join(plant_dir, "mb51.xlsx"), "main": os.path.join(plant_dir, "main.xlsx"),
+                 "baso": os.path.join(plant_dir, "baso.xlsx") if baso else None}
+        write_mb51(files["mb51"], plant, pool, mb51_rows, rnd)
+        write_main(files["main"], plant, pool, rnd)
+        if baso:
+            write_baso(files["baso"], plant, pool, rnd)
+        jobs.append({"plant": plant, "files": {k: os.path.abspath(v) if v else None for k, v in files.items()}})
+        log(f"  {idx + 1}/{plants} {plant}: {mb51_rows:,} MB51 rows, {materials:,} materials")
+
+    dataset = {"params": params, "report_date": REPORT_DATE, "master_inventory": master_inventory,
+               "master_movement": master_movement, "plants": jobs}
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(dataset, f, indent=1)
+    return dataset
+
+def main():
+    if len(sys.argv) < 2:
+        print("usage: synthetic_inventory_data.py <out_dir> [plants] [mb51_rows] [materials]", file=sys.stderr)
+        sys.exit(2)
+    sizes = [int(v) for v in sys.argv[2:5]]
+    dataset = make_dataset(sys.argv[1], *sizes, regenerate=True)
+    print(json.dumps(dataset["params"]))
+
+if __name__ == "__main__":
+    main()
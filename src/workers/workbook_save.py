@@ -0,0 +1,38 @@
+# workbook_save.py - Save xlsx outputs with a tunable zip compression level
+# openpyxl always deflates every part at zlib's default level, and for a large report most of
+# wb.save is spent compressing XML. The level is an option of both workers:
+#   0      stored, no compression - fastest; for per-plant files that only feed
+#          merge_inventory_reports and are discarded after it
+#   1..9   deflate at that level (1 = fast, 9 = smallest)
+#   unset  the worker's default (generate: zlib default, merge: 9, the file that is downloaded)
+# generate_inventory_report: payload options "compression_level"
+# merge_inventory_reports: payload "compression_level"
+
+import datetime
+from zipfile import ZipFile, ZIP_DEFLATED, ZIP_STORED
+from openpyxl.writer.excel import ExcelWriter
+
+def compression_level(options, default=None):
+    """Zip compression level of an output, 0-9 or None for zlib's default"""
+    level = (options or {}).get("compression_level")
+    if level is None or level == "":
+        return default
+    level = int(level)
+    if not 0 <= level <= 9:
+        raise ValueError(f"compression_level must be 0-9, got {level}")
+    return level
+
+def zip_settings(level):
+    """(compress_type, compresslevel) for ZipFile / writestr"""
+    if level == 0:
+        return ZIP_STORED, None
+    return ZIP_DEFLATED, level
+
+def save_workbook(wb, path, level=None):
+    """wb.save(path) with the given compression level"""
+    if wb.write_only and not wb.worksheets:
+        wb.create_sheet()
+    compression, compresslevel = zip_settings(level)
+    archive = ZipFile(path, "w", compression, allowZip64=True, compresslevel=compresslevel)
+    wb.properties.modified = datetime.datetime.now(tz=datetime.timezone.utc).replace(tzinfo=None)
+    ExcelWriter(wb, archive).save()